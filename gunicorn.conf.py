@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+
+wsgi_app = 'milk_project.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Load the app once in the master so workers fork with it already imported
+preload_app = True
+
+
+def when_ready(server):
+    from milk_app.warmup import warm_up
+
+    timings = warm_up()
+    server.log.info('Warm-up done: ' + ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items()))
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    connections.close_all()
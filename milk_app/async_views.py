@@ -0,0 +1,324 @@
+# milk_app/async_views.py
+"""
+Native async variants of the auth and read endpoints.
+
+These are plain Django async views (DRF 3.14 has no async support) that mirror
+the request/response contract of the matching views in views.py. Which routes
+use them is controlled by the ASYNC_ROUTES setting, see urls.py. Firebase
+verification and serializer work run in a worker thread so the event loop is
+never blocked; database access goes through Django's async ORM.
+"""
+import json
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.throttling import BaseThrottle
+
+from . import views
+from .authentication import authenticate_async
+from .firebase_config import FirebaseConfig
+from .models import DailyMilkRequest, DailySkipRequest, User, UserSubscription
+from .permission import IsJWTAuthenticated
+from .token_store import TokenRevokedError, revocation_store
+from .throttling import check_rate_limits, retry_after_seconds
+from .serializers import (
+    DailyMilkRequestSerializer, DailySkipRequestSerializer, RefreshTokenSerializer, UserLoginSerializer,
+    UserRegistrationSerializer, UserSerializer, UserSubscriptionSerializer,
+)
+from .utils import generate_jwt_tokens, parse_date
+
+
+def async_csrf_exempt(view_func):
+    """csrf_exempt for async views (Django 4.2's decorator wraps them in a sync function)"""
+    view_func.csrf_exempt = True
+    return view_func
+
+
+def _response(data, status_code=status.HTTP_200_OK):
+    # Match DRF's JSONRenderer output (UNICODE_JSON / COMPACT_JSON)
+    return JsonResponse(
+        data, status=status_code, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')}
+    )
+
+
+def _method_not_allowed(request):
+    return _response(
+        {'detail': f'Method "{request.method}" not allowed.'},
+        status.HTTP_405_METHOD_NOT_ALLOWED
+    )
+
+
+class _ParseError(Exception):
+    pass
+
+
+def _request_data(request):
+    """Parse the request body the way DRF's JSONParser/FormParser would"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as e:
+            raise _ParseError(f'JSON parse error - {e}')
+    return request.POST
+
+
+async def _rate_limited(scope, request, data):
+    """Return a 429 response if the scope's token buckets are empty, matching DRF's Throttled"""
+    phone_number = data.get('phone_number') if hasattr(data, 'get') else None
+    wait = await sync_to_async(check_rate_limits)(scope, BaseThrottle().get_ident(request), phone_number)
+    if not wait:
+        return None
+
+    retry_after = retry_after_seconds(wait)
+    response = _response(
+        {'detail': f'Request was throttled. Expected available in {retry_after} seconds.'},
+        status.HTTP_429_TOO_MANY_REQUESTS
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+async def _authenticated_user(request):
+    """Return the JWT user, or an error response matching IsJWTAuthenticated"""
+    try:
+        result = await authenticate_async(request)
+    except AuthenticationFailed as e:
+        return None, _response({'detail': str(e.detail)}, status.HTTP_403_FORBIDDEN)
+
+    if result is None:
+        return None, _response({'detail': IsJWTAuthenticated.message}, status.HTTP_403_FORBIDDEN)
+
+    return result[0], None
+
+
+def _validate_with_firebase(serializer):
+    """Run serializer validation and the Firebase token check in one worker-thread hop"""
+    if not serializer.is_valid():
+        return False, None
+    decoded_token = FirebaseConfig().verify_id_token(serializer.validated_data['firebase_id_token'])
+    return True, decoded_token
+
+
+async def _run_firebase_validation(serializer):
+    # Firebase verification is blocking network/crypto work: keep it off the event loop
+    # and off the single thread_sensitive executor used for ORM calls.
+    return await sync_to_async(_validate_with_firebase, thread_sensitive=False)(serializer)
+
+
+# Authentication Views
+@async_csrf_exempt
+async def signup(request):
+    if request.method != 'POST':
+        return _method_not_allowed(request)
+
+    try:
+        data = _request_data(request)
+    except _ParseError as e:
+        return _response({'detail': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    throttled = await _rate_limited('signup', request, data)
+    if throttled:
+        return throttled
+
+    serializer = UserRegistrationSerializer(data=data)
+    is_valid, decoded_token = await _run_firebase_validation(serializer)
+    if not is_valid:
+        return _response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    if not decoded_token:
+        return _response({'error': 'Invalid Firebase ID token'}, status.HTTP_400_BAD_REQUEST)
+
+    phone_number = serializer.validated_data['phone_number']
+    full_name = serializer.validated_data['full_name']
+
+    user, created = await User.objects.aget_or_create(
+        phone_number=phone_number,
+        defaults={'full_name': full_name}
+    )
+
+    if not created:
+        user.full_name = full_name
+        await user.asave()
+
+    access_token, refresh_token = generate_jwt_tokens(user)
+
+    return _response({
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'user': UserSerializer(user).data
+    }, status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+@async_csrf_exempt
+async def login(request):
+    if request.method != 'POST':
+        return _method_not_allowed(request)
+
+    try:
+        data = _request_data(request)
+    except _ParseError as e:
+        return _response({'detail': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    throttled = await _rate_limited('login', request, data)
+    if throttled:
+        return throttled
+
+    serializer = UserLoginSerializer(data=data)
+    is_valid, decoded_token = await _run_firebase_validation(serializer)
+    if not is_valid:
+        return _response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    if not decoded_token:
+        return _response({'error': 'Invalid Firebase ID token'}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = await User.objects.aget(phone_number=serializer.validated_data['phone_number'])
+    except User.DoesNotExist:
+        return _response({'error': 'User not found. Please sign up first.'}, status.HTTP_404_NOT_FOUND)
+
+    access_token, refresh_token = generate_jwt_tokens(user)
+
+    return _response({
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'user': UserSerializer(user).data
+    })
+
+
+@async_csrf_exempt
+async def refresh_token(request):
+    if request.method != 'POST':
+        return _method_not_allowed(request)
+
+    try:
+        data = _request_data(request)
+    except _ParseError as e:
+        return _response({'detail': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    throttled = await _rate_limited('refresh_token', request, data)
+    if throttled:
+        return throttled
+
+    serializer = RefreshTokenSerializer(data=data)
+    if not serializer.is_valid():
+        return _response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        payload = jwt.decode(
+            serializer.validated_data['refresh_token'],
+            settings.JWT_SECRET_KEY,
+            algorithms=['HS256']
+        )
+    except jwt.ExpiredSignatureError:
+        return _response({'error': 'Refresh token expired'}, status.HTTP_401_UNAUTHORIZED)
+    except jwt.InvalidTokenError:
+        return _response({'error': 'Invalid refresh token'}, status.HTTP_400_BAD_REQUEST)
+
+    if payload.get('type') != 'refresh':
+        return _response({'error': 'Invalid token type'}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = await User.objects.aget(id=payload['user_id'])
+    except User.DoesNotExist:
+        return _response({'error': 'User not found'}, status.HTTP_404_NOT_FOUND)
+
+    try:
+        family = await sync_to_async(revocation_store.rotate)(payload)
+    except TokenRevokedError as e:
+        return _response({'error': str(e)}, status.HTTP_401_UNAUTHORIZED)
+
+    access_token, new_refresh_token = generate_jwt_tokens(user, family=family)
+
+    return _response({
+        'access_token': access_token,
+        'refresh_token': new_refresh_token
+    })
+
+
+# Read Views
+@async_csrf_exempt
+async def user_profile(request):
+    if request.method != 'GET':
+        # Writes keep the DRF serializer path
+        return await sync_to_async(views.user_profile)(request)
+
+    user, error = await _authenticated_user(request)
+    if error:
+        return error
+
+    return _response(UserSerializer(user).data)
+
+
+@async_csrf_exempt
+async def user_subscription(request):
+    """Manage user's milk subscription"""
+    if request.method != 'GET':
+        return await sync_to_async(views.user_subscription)(request)
+
+    user, error = await _authenticated_user(request)
+    if error:
+        return error
+
+    try:
+        subscription = await UserSubscription.objects.select_related('current_rate').aget(user=user)
+    except UserSubscription.DoesNotExist:
+        return _response({'message': 'No active subscription found'}, status.HTTP_404_NOT_FOUND)
+
+    # Nested rate serializers touch related managers, so render them in a worker thread
+    data = await sync_to_async(lambda: UserSubscriptionSerializer(subscription).data)()
+    return _response(data)
+
+
+@async_csrf_exempt
+async def user_skip_requests(request):
+    """Get user's skip requests"""
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+
+    user, error = await _authenticated_user(request)
+    if error:
+        return error
+
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+
+    skip_requests = DailySkipRequest.objects.filter(user=user)
+
+    if start_date:
+        skip_requests = skip_requests.filter(skip_date__gte=start_date)
+    if end_date:
+        skip_requests = skip_requests.filter(skip_date__lte=end_date)
+
+    skip_requests = [skip async for skip in skip_requests.order_by('-skip_date')]
+
+    return _response(DailySkipRequestSerializer(skip_requests, many=True).data)
+
+
+@async_csrf_exempt
+async def get_user_request(request):
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+
+    user, error = await _authenticated_user(request)
+    if error:
+        return error
+
+    date_str = request.GET.get('date')
+    if not date_str:
+        return _response({'error': 'Date parameter is required'}, status.HTTP_400_BAD_REQUEST)
+
+    target_date = parse_date(date_str)
+    if not target_date:
+        return _response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        milk_request = await DailyMilkRequest.objects.aget(user=user, target_date=target_date)
+    except DailyMilkRequest.DoesNotExist:
+        return _response({'error': 'No request found for this date'}, status.HTTP_404_NOT_FOUND)
+
+    return _response(DailyMilkRequestSerializer(milk_request).data)
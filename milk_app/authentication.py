@@ -1,35 +1,79 @@
 # milk_app/authentication.py
 import jwt
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from .models import User
+from .token_store import revocation_store
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def get_bearer_token(request):
+    """Return the bearer token from the Authorization header, if any"""
+    auth_header = request.META.get('HTTP_AUTHORIZATION')
+
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+
+    return auth_header.split(' ')[1]
+
+
+def decode_access_token(token):
+    """Decode a JWT and return its payload, raising AuthenticationFailed on any problem"""
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationFailed('Token expired')
+    except jwt.InvalidTokenError:
+        raise AuthenticationFailed('Invalid token')
+
+    user_id = payload.get('user_id')
+
+    if not user_id:
+        raise AuthenticationFailed('Invalid token payload')
+
+    return payload
+
+
 class JWTAuthentication(BaseAuthentication):
     def authenticate(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION')
-        
-        if not auth_header or not auth_header.startswith('Bearer '):
+        token = get_bearer_token(request)
+
+        if not token:
             return None
-            
-        token = auth_header.split(' ')[1]
-        
+
+        payload = decode_access_token(token)
+
+        # Bloom-filter check: only a possible hit costs a DB query
+        if payload.get('fam') and revocation_store.is_revoked('family', payload['fam']):
+            raise AuthenticationFailed('Token revoked')
+
         try:
-            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            
-            if not user_id:
-                raise AuthenticationFailed('Invalid token payload')
-                
-            user = User.objects.get(id=user_id)
+            user = User.objects.get(id=payload['user_id'])
             return (user, token)
-            
-        except jwt.ExpiredSignatureError:
-            raise AuthenticationFailed('Token expired')
-        except jwt.InvalidTokenError:
-            raise AuthenticationFailed('Invalid token')
         except User.DoesNotExist:
             raise AuthenticationFailed('User not found')
+
+
+async def authenticate_async(request):
+    """Async counterpart of JWTAuthentication.authenticate for native async views"""
+    token = get_bearer_token(request)
+
+    if not token:
+        return None
+
+    payload = decode_access_token(token)
+
+    family = payload.get('fam')
+    if family and revocation_store.might_be_revoked('family', family):
+        if await sync_to_async(revocation_store.is_revoked_in_db)('family', family):
+            raise AuthenticationFailed('Token revoked')
+
+    try:
+        user = await User.objects.aget(id=payload['user_id'])
+        return (user, token)
+    except User.DoesNotExist:
+        raise AuthenticationFailed('User not found')
@@ -0,0 +1,95 @@
+# milk_app/batch.py
+"""
+In-process execution of batch sub-requests.
+
+Each entry of a batch becomes a lightweight HttpRequest dispatched straight to
+the resolved view. The caller's already-authenticated user is forced onto the
+sub-requests (DRF's ForcedAuthentication hook), so a batch authenticates once
+no matter how many operations it carries.
+"""
+import asyncio
+import io
+import json
+
+from asgiref.sync import async_to_sync
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+# Request metadata that sub-requests inherit from the batch request
+INHERITED_META = [
+    'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'HTTP_HOST', 'HTTP_AUTHORIZATION',
+    'HTTP_USER_AGENT', 'HTTP_X_FORWARDED_FOR', 'HTTP_ACCEPT_LANGUAGE', 'wsgi.url_scheme',
+]
+
+# Routes that cannot be batched: auth flows and the batch endpoint itself
+EXCLUDED_ROUTES = {'signup', 'login', 'refresh_token', 'logout', 'batch'}
+
+
+class BatchEntryError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def _allowed_routes():
+    from .urls import urlpatterns
+    return {pattern.name for pattern in urlpatterns} - EXCLUDED_ROUTES
+
+
+def build_subrequest(parent, method, path, body):
+    """HttpRequest for one batch entry, reusing the parent's auth and client metadata"""
+    path_only, _, query_string = path.partition('?')
+    payload = json.dumps(body).encode() if body is not None else b''
+
+    sub = HttpRequest()
+    sub.method = method
+    sub.path = sub.path_info = path_only
+    sub.META = {key: parent.META[key] for key in INHERITED_META if key in parent.META}
+    sub.META.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path_only,
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+    })
+    sub.GET = QueryDict(query_string)
+    sub._stream = io.BytesIO(payload)
+    sub._read_started = False
+
+    # DRF picks these up in Request.__init__ and skips the authentication classes
+    sub._force_auth_user = parent.user
+    sub._force_auth_token = parent.auth
+    return sub
+
+
+def _response_body(response):
+    if hasattr(response, 'data'):
+        return response.data
+    if not response.content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset or 'utf-8', errors='replace')
+
+
+def dispatch(parent, method, path, body=None):
+    """Run one sub-request and return (status_code, body)"""
+    try:
+        match = resolve(path.partition('?')[0])
+    except Resolver404:
+        raise BatchEntryError(404, f'No route matches {path}')
+
+    if match.url_name not in _allowed_routes():
+        raise BatchEntryError(400, f'Route {match.url_name or path} cannot be used in a batch')
+
+    sub = build_subrequest(parent, method, path, body)
+    sub.resolver_match = match
+
+    view = match.func
+    if asyncio.iscoroutinefunction(view):
+        response = async_to_sync(view)(sub, *match.args, **match.kwargs)
+    else:
+        response = view(sub, *match.args, **match.kwargs)
+
+    return response.status_code, _response_body(response)
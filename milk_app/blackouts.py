@@ -0,0 +1,52 @@
+# milk_app/blackouts.py
+"""
+Blackout calendar: days the dairy does not deliver.
+
+A BlackoutDate closes a day for every subscriber, or only for those on one
+milk type and/or in one delivery zone. Nothing is written per user; readers
+load the blackouts of a range with one query and apply them set-wise - the
+schedule excludes the closed (milk type, zone) pairs in its query, and
+calendars/billing clear the closed days out of the expected set as a bitset
+(bit i = start_date + i days).
+"""
+from django.db.models import Q
+
+from .models import BlackoutDate
+
+
+def closed_bits(start_date, end_date):
+    """{(milk_type, zone_id): bitset of blackout days in [start_date, end_date]}; None in a key means all"""
+    closed = {}
+    blackouts = BlackoutDate.objects.filter(date__range=[start_date, end_date]).values_list('date', 'milk_type', 'zone_id')
+    for day, milk_type, zone_id in blackouts:
+        closed[(milk_type, zone_id)] = closed.get((milk_type, zone_id), 0) | 1 << (day - start_date).days
+    return closed
+
+
+def bits_for(closed, milk_type, zone_id=None):
+    """Blackout days of one milk type in one zone from a closed_bits() result"""
+    bits = 0
+    for scope_milk_type in (None, milk_type):
+        for scope_zone_id in (None, zone_id):
+            bits |= closed.get((scope_milk_type, scope_zone_id), 0)
+    return bits
+
+
+def closures(on_date):
+    """[{'milk_type': ..., 'zone_id': ...}] blacked out on on_date; None means all"""
+    return list(BlackoutDate.objects.filter(date=on_date).values('milk_type', 'zone_id').distinct())
+
+
+def exclude_closed(queryset, closed, milk_type_field='milk_type', zone_field='route__zone_id'):
+    """Drop rows whose milk type/zone (reached through the given lookups) a closures() result covers"""
+    condition = Q()
+    for closure in closed:
+        scope = Q()
+        if closure['milk_type']:
+            scope &= Q(**{milk_type_field: closure['milk_type']})
+        if closure['zone_id']:
+            scope &= Q(**{zone_field: closure['zone_id']})
+        if not scope:
+            return queryset.none()  # closed for everyone
+        condition |= scope
+    return queryset.exclude(condition) if condition else queryset
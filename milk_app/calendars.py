@@ -0,0 +1,243 @@
+# milk_app/calendars.py
+"""
+Per-subscriber delivery calendars as bitsets.
+
+A calendar holds four Python ints used as bitsets over consecutive days
+(bit i = start_date + i days):
+
+* subscribed - a SubscriptionRate covers the day (billing expects a delivery)
+* skipped    - the user has a DailySkipRequest for the day or a SkipRule skips it
+* delivered  - DailyMilkDelivery with status 'delivered'
+* failed     - DailyMilkDelivery with status 'failed'
+
+A fifth set, closed, holds blackout days for the user's milk type and zone
+(milk_app/blackouts.py); it is applied when calendars are read rather than
+cached, so adding a blackout needs no invalidation.
+
+Derived sets such as "expected but not delivered" are plain bit operations,
+and counts are popcounts. Calendars are cached per user and month in the
+``calendars`` cache alias; a per-user version stamp there is bumped by
+``invalidate`` whenever rates, skips or deliveries change, which orphans all
+of that user's cached months at once. Invalidation has to reach every worker,
+so the alias must be a shared backend: with a per-process one (LocMem, the
+default) nothing is cached and calendars are always built from the database.
+"""
+import calendar as monthcalendar
+import uuid
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+
+from . import blackouts, skip_rules
+from .models import DailyMilkDelivery, DailySkipRequest, SubscriptionRate, UserSubscription
+from .utils import cache_is_shared
+
+CACHE_ALIAS = 'calendars'
+KINDS = ('subscribed', 'skipped', 'delivered', 'failed')
+# Users whose months are built per set of queries
+USER_BATCH_SIZE = 500
+
+
+class Calendar:
+    """Bitsets for one user over [start_date, end_date]"""
+
+    def __init__(self, start_date, end_date, subscribed=0, skipped=0, delivered=0, failed=0, closed=0):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days = (end_date - start_date).days + 1
+        self.mask = (1 << self.days) - 1
+        self.subscribed = subscribed
+        self.skipped = skipped
+        self.delivered = delivered
+        self.failed = failed
+        self.closed = closed
+
+    @property
+    def expected(self):
+        """Subscribed, not skipped and not a blackout day"""
+        return self.subscribed & ~self.skipped & ~self.closed & self.mask
+
+    @property
+    def missed(self):
+        """Expected but not delivered"""
+        return self.expected & ~self.delivered & self.mask
+
+    def window(self, bits, start_date=None, end_date=None):
+        """Bits restricted to [start_date, end_date], still aligned to the calendar start"""
+        first = max(0, (start_date - self.start_date).days) if start_date else 0
+        last = min(self.days - 1, (end_date - self.start_date).days) if end_date else self.days - 1
+        if last < first:
+            return 0
+        return bits & (((1 << (last - first + 1)) - 1) << first)
+
+    def count(self, bits, start_date=None, end_date=None):
+        return self.window(bits, start_date, end_date).bit_count()
+
+    def dates(self, bits):
+        found = []
+        while bits:
+            lowest = bits & -bits
+            found.append(self.start_date + date.resolution * (lowest.bit_length() - 1))
+            bits ^= lowest
+        return found
+
+
+def daily_counts(calendars, kind):
+    """Per-day number of calendars (same range) with the bit set, e.g. daily_counts(cals, 'missed')"""
+    calendars = list(calendars)
+    if not calendars:
+        return []
+    counts = [0] * calendars[0].days
+    for cal in calendars:
+        bits = getattr(cal, kind)
+        while bits:
+            lowest = bits & -bits
+            counts[lowest.bit_length() - 1] += 1
+            bits ^= lowest
+    return counts
+
+
+def _month_starts(start_date, end_date):
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        yield month
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _month_end(month):
+    return month.replace(day=monthcalendar.monthrange(month.year, month.month)[1])
+
+
+def _span(offset, length):
+    return ((1 << length) - 1) << offset if length > 0 else 0
+
+
+def _build_months(user_ids, first_month, last_month):
+    """{(user_id, month): [subscribed, skipped, delivered, failed]} built with four queries"""
+    range_start, range_end = first_month, _month_end(last_month)
+    bits = defaultdict(lambda: [0, 0, 0, 0])
+
+    rates = SubscriptionRate.objects.filter(
+        subscription__user_id__in=user_ids,
+        effective_from__lte=range_end,
+    ).filter(
+        Q(effective_to__isnull=True) | Q(effective_to__gte=range_start)
+    ).values_list('subscription__user_id', 'effective_from', 'effective_to')
+    for user_id, effective_from, effective_to in rates:
+        first = max(effective_from, range_start)
+        last = min(effective_to or range_end, range_end)
+        bits[user_id][0] |= _span((first - range_start).days, (last - first).days + 1)
+
+    skips = DailySkipRequest.objects.filter(
+        user_id__in=user_ids, skip_date__range=[range_start, range_end]
+    ).values_list('user_id', 'skip_date')
+    for user_id, skip_date in skips:
+        bits[user_id][1] |= 1 << (skip_date - range_start).days
+    for user_id, rule_bits in skip_rules.expand(range_start, range_end, user_ids).items():
+        bits[user_id][1] |= rule_bits
+
+    deliveries = DailyMilkDelivery.objects.filter(
+        user_id__in=user_ids,
+        delivery_date__range=[range_start, range_end],
+        status__in=['delivered', 'failed']
+    ).values_list('user_id', 'delivery_date', 'status')
+    for user_id, delivery_date, delivery_status in deliveries:
+        bits[user_id][2 if delivery_status == 'delivered' else 3] |= 1 << (delivery_date - range_start).days
+
+    months = {}
+    for user_id in user_ids:
+        user_bits = bits.get(user_id, [0, 0, 0, 0])
+        for month in _month_starts(range_start, range_end):
+            offset = (month - range_start).days
+            month_mask = (1 << _month_end(month).day) - 1
+            months[(user_id, month)] = [(value >> offset) & month_mask for value in user_bits]
+    return months
+
+
+def _version_key(user_id):
+    return f'calendar:version:{user_id}'
+
+
+def _versions(user_ids):
+    cache = caches[CACHE_ALIAS]
+    keys = {_version_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for user_id in user_ids:
+        if user_id not in versions:
+            cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+            versions[user_id] = cache.get(_version_key(user_id))
+    return versions
+
+
+def get_calendars(user_ids, start_date, end_date):
+    """{user_id: Calendar} for the range, built from cached months where possible"""
+    user_ids = list(dict.fromkeys(user_ids))
+    months = list(_month_starts(start_date, end_date))
+    use_cache = cache_is_shared(CACHE_ALIAS)
+    cache = caches[CACHE_ALIAS]
+    versions = _versions(user_ids) if use_cache else {}
+
+    def month_key(user_id, month):
+        return f'calendar:{user_id}:{versions[user_id]}:{month:%Y-%m}'
+
+    cached = {}
+    if use_cache:
+        keys = {month_key(user_id, month): (user_id, month) for user_id in user_ids for month in months}
+        cached = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+    missing_users = sorted({user_id for user_id in user_ids for month in months if (user_id, month) not in cached}, key=str)
+    for offset in range(0, len(missing_users), USER_BATCH_SIZE):
+        built = _build_months(missing_users[offset:offset + USER_BATCH_SIZE], months[0], months[-1])
+        if use_cache:
+            cache.set_many(
+                {month_key(user_id, month): value for (user_id, month), value in built.items()},
+                timeout=settings.CALENDAR_CACHE_TIMEOUT
+            )
+        cached.update(built)
+
+    # Stitch months into range-aligned ints
+    first_month = months[0]
+    shift = (start_date - first_month).days
+    calendars = {}
+    for user_id in user_ids:
+        values = [0, 0, 0, 0]
+        for month in months:
+            offset = (month - first_month).days
+            for index, month_bits in enumerate(cached[(user_id, month)]):
+                values[index] |= month_bits << offset
+        cal = Calendar(start_date, end_date)
+        for kind, value in zip(KINDS, values):
+            setattr(cal, kind, (value >> shift) & cal.mask)
+        calendars[user_id] = cal
+
+    closed = blackouts.closed_bits(start_date, end_date)
+    if closed:
+        scopes = {
+            user_id: (milk_type, zone_id)
+            for user_id, milk_type, zone_id in UserSubscription.objects.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', 'milk_type', 'route__zone_id')
+        }
+        for user_id, cal in calendars.items():
+            cal.closed = blackouts.bits_for(closed, *scopes.get(user_id, (None, None)))
+    return calendars
+
+
+def get_calendar(user_id, start_date, end_date):
+    return get_calendars([user_id], start_date, end_date)[user_id]
+
+
+def invalidate(*user_ids):
+    """Orphan every cached month of these users"""
+    if not cache_is_shared(CACHE_ALIAS):
+        return
+    caches[CACHE_ALIAS].set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, timeout=None)
+
+
+def invalidate_on_commit(*user_ids):
+    transaction.on_commit(lambda: invalidate(*user_ids))
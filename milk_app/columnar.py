@@ -0,0 +1,331 @@
+# milk_app/columnar.py
+"""
+Columnar export of delivery history for analytics.
+
+Rates, deliveries and skips for a date range are written as NumPy ``.npy``
+column files split into chunks of a fixed number of rows. The files are
+produced without NumPy (``array`` buffers behind a hand-built .npy header),
+so exports run on the app servers as-is, and analysts can open any column
+with ``numpy.load(path, mmap_mode='r')``. With ``compress=True`` each chunk
+is written as a deflated ``.npz`` instead: smaller, but it has to be
+decompressed on load. The admin API builds bundles in a background job and
+keeps the zipped result in the COLUMNAR_EXPORT['STORAGE'] storage (shared
+between job workers and web servers) for download.
+
+Rows are read through ``QuerySet.iterator()`` (server-side cursors where the
+database supports them) and flushed chunk by chunk, so memory stays bounded
+by the chunk size plus the user/rate dictionaries.
+
+Column encodings:
+
+* dates are int32 days since 1970-01-01
+* liters are int32 centiliters; -1 marks NULL
+* user and rate are int32 indexes into users.json / rates.json; -1 marks NULL
+* status and reason are uint8 codes listed in manifest.json
+"""
+import array
+import json
+import os
+import sys
+import zipfile
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DailyMilkDelivery, DailySkipRequest, SubscriptionRate, User
+
+FORMAT_VERSION = 1
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+NULL = -1
+UNKNOWN_CODE = 255
+# Lookups by primary key are issued in batches of this size
+ID_BATCH_SIZE = 500
+
+INT32 = 'i'
+UINT8 = 'B'
+NPY_DESCR = {INT32: '<i4', UINT8: '|u1'}
+
+if array.array(INT32).itemsize != 4:
+    raise ImportError(f"array typecode '{INT32}' is {array.array(INT32).itemsize} bytes here; .npy int32 columns need 4")
+
+DELIVERY_STATUSES = [value for value, _ in DailyMilkDelivery.STATUS_CHOICES]
+SKIP_REASONS = [value for value, _ in DailySkipRequest.REASON_CHOICES]
+
+
+def npy_header(typecode, length):
+    """Version 1.0 .npy header for a 1-d array"""
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (NPY_DESCR[typecode], length)
+    # magic + version + length field (10 bytes) + header + newline must be a multiple of 64
+    header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+def _npy_bytes(buffer):
+    if sys.byteorder == 'big':
+        buffer = array.array(buffer.typecode, buffer)
+        buffer.byteswap()
+    return npy_header(buffer.typecode, len(buffer)) + buffer.tobytes()
+
+
+def _days(value):
+    return value.toordinal() - EPOCH_ORDINAL if value is not None else NULL
+
+
+def _centiliters(value):
+    return int(value * 100) if value is not None else NULL
+
+
+class _Dictionary:
+    """Assigns dense int indexes to ids in first-seen order"""
+
+    def __init__(self):
+        self.indexes = {}
+
+    def __contains__(self, key):
+        return key in self.indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def index(self, key):
+        if key is None:
+            return NULL
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = len(self.indexes)
+        return index
+
+    def keys(self):
+        return list(self.indexes)
+
+
+class ChunkedTableWriter:
+    """Buffers rows per column and writes a chunk every ``chunk_rows`` rows"""
+
+    def __init__(self, output_dir, table, columns, chunk_rows, compress=False):
+        self.output_dir = output_dir
+        self.table = table
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.buffers = [array.array(typecode) for _, typecode in columns]
+        self.chunks = []
+        self.rows = 0
+
+    def append(self, row):
+        for buffer, value in zip(self.buffers, row):
+            buffer.append(value)
+        if len(self.buffers[0]) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        length = len(self.buffers[0])
+        if not length:
+            return
+
+        chunk_name = f'{self.table}/chunk-{len(self.chunks):05d}'
+        files = [(f'{name}.npy', _npy_bytes(buffer)) for (name, _), buffer in zip(self.columns, self.buffers)]
+
+        if self.compress:
+            path = f'{chunk_name}.npz'
+            os.makedirs(os.path.join(self.output_dir, self.table), exist_ok=True)
+            with zipfile.ZipFile(os.path.join(self.output_dir, path), 'w', zipfile.ZIP_DEFLATED) as archive:
+                for filename, content in files:
+                    archive.writestr(filename, content)
+        else:
+            path = chunk_name
+            os.makedirs(os.path.join(self.output_dir, path), exist_ok=True)
+            for filename, content in files:
+                with open(os.path.join(self.output_dir, path, filename), 'wb') as f:
+                    f.write(content)
+
+        self.chunks.append({'path': path, 'rows': length})
+        self.rows += length
+        self.buffers = [array.array(typecode) for _, typecode in self.columns]
+
+    def close(self):
+        self.flush()
+        return {
+            'rows': self.rows,
+            'columns': {name: NPY_DESCR[typecode] for name, typecode in self.columns},
+            'chunks': self.chunks,
+        }
+
+
+def _rate_row(rate, users, rates):
+    rate_id, user_id, daily_liters, effective_from, effective_to, is_active = rate
+    return (
+        rates.index(rate_id), users.index(user_id), _centiliters(daily_liters),
+        _days(effective_from), _days(effective_to), int(is_active),
+    )
+
+
+RATE_FIELDS = ['id', 'subscription__user_id', 'daily_liters', 'effective_from', 'effective_to', 'is_active']
+
+
+def export_history(output_dir, start_date, end_date, chunk_rows=None, compress=False):
+    """Write the columnar bundle for [start_date, end_date] into output_dir and return the manifest"""
+    config = settings.COLUMNAR_EXPORT
+    chunk_rows = chunk_rows or config['CHUNK_ROWS']
+    fetch_size = config['FETCH_SIZE']
+    os.makedirs(output_dir, exist_ok=True)
+
+    users = _Dictionary()
+    rates = _Dictionary()
+
+    def writer(table, columns):
+        return ChunkedTableWriter(output_dir, table, columns, chunk_rows, compress)
+
+    # Rates in effect during the range
+    rate_writer = writer('rates', [
+        ('rate', INT32), ('user', INT32), ('daily_liters', INT32),
+        ('effective_from', INT32), ('effective_to', INT32), ('is_active', UINT8),
+    ])
+    overlapping_rates = SubscriptionRate.objects.filter(
+        Q(effective_to__isnull=True) | Q(effective_to__gte=start_date),
+        effective_from__lte=end_date,
+    ).order_by('effective_from').values_list(*RATE_FIELDS)
+    for rate in overlapping_rates.iterator(chunk_size=fetch_size):
+        rate_writer.append(_rate_row(rate, users, rates))
+    exported_rates = len(rates)
+
+    status_codes = {value: code for code, value in enumerate(DELIVERY_STATUSES)}
+    delivery_writer = writer('deliveries', [
+        ('user', INT32), ('delivery_date', INT32), ('scheduled_liters', INT32),
+        ('actual_liters', INT32), ('status', UINT8), ('rate', INT32),
+    ])
+    deliveries = DailyMilkDelivery.objects.filter(
+        delivery_date__range=(start_date, end_date)
+    ).order_by('delivery_date').values_list(
+        'user_id', 'delivery_date', 'scheduled_liters', 'actual_liters', 'status', 'rate_applied_id'
+    )
+    for user_id, delivery_date, scheduled, actual, status, rate_id in deliveries.iterator(chunk_size=fetch_size):
+        delivery_writer.append((
+            users.index(user_id), _days(delivery_date), _centiliters(scheduled),
+            _centiliters(actual), status_codes.get(status, UNKNOWN_CODE), rates.index(rate_id),
+        ))
+
+    reason_codes = {value: code for code, value in enumerate(SKIP_REASONS)}
+    skip_writer = writer('skips', [('user', INT32), ('skip_date', INT32), ('reason', UINT8)])
+    skips = DailySkipRequest.objects.filter(
+        skip_date__range=(start_date, end_date)
+    ).order_by('skip_date').values_list('user_id', 'skip_date', 'reason')
+    for user_id, skip_date, reason in skips.iterator(chunk_size=fetch_size):
+        skip_writer.append((users.index(user_id), _days(skip_date), reason_codes.get(reason, UNKNOWN_CODE)))
+
+    # Rates referenced by deliveries but not in effect during the range (edited history)
+    late_rate_ids = rates.keys()[exported_rates:]
+    for offset in range(0, len(late_rate_ids), ID_BATCH_SIZE):
+        batch = SubscriptionRate.objects.filter(
+            id__in=late_rate_ids[offset:offset + ID_BATCH_SIZE]
+        ).values_list(*RATE_FIELDS)
+        for rate in batch:
+            rate_writer.append(_rate_row(rate, users, rates))
+
+    tables = {
+        'rates': rate_writer.close(),
+        'deliveries': delivery_writer.close(),
+        'skips': skip_writer.close(),
+    }
+
+    _write_json(output_dir, 'rates.json', [str(rate_id) for rate_id in rates.keys()])
+    _write_json(output_dir, 'users.json', _user_dictionary(users.keys()))
+
+    manifest = {
+        'format': 'milk-columnar',
+        'version': FORMAT_VERSION,
+        'start_date': start_date,
+        'end_date': end_date,
+        'generated_at': timezone.now(),
+        'chunk_rows': chunk_rows,
+        'compressed': compress,
+        'encodings': {
+            'date': 'int32 days since 1970-01-01, -1 = NULL',
+            'liters': 'int32 centiliters, -1 = NULL',
+            'user': 'int32 index into users.json',
+            'rate': 'int32 index into rates.json, -1 = NULL',
+        },
+        'codes': {
+            'status': DELIVERY_STATUSES,
+            'reason': SKIP_REASONS,
+            'unknown': UNKNOWN_CODE,
+        },
+        'tables': tables,
+    }
+    _write_json(output_dir, 'manifest.json', manifest)
+    return manifest
+
+
+def _user_dictionary(user_ids):
+    entries = [None] * len(user_ids)
+    positions = {user_id: index for index, user_id in enumerate(user_ids)}
+    for offset in range(0, len(user_ids), ID_BATCH_SIZE):
+        batch = User.objects.filter(
+            id__in=user_ids[offset:offset + ID_BATCH_SIZE]
+        ).values_list('id', 'phone_number', 'full_name')
+        for user_id, phone_number, full_name in batch:
+            entries[positions[user_id]] = {'id': str(user_id), 'phone_number': phone_number, 'full_name': full_name}
+    return entries
+
+
+def _write_json(output_dir, filename, data):
+    with open(os.path.join(output_dir, filename), 'w') as f:
+        json.dump(data, f, cls=DjangoJSONEncoder)
+
+
+def zip_bundle(output_dir, fileobj):
+    """Deflate an exported bundle into a single zip archive"""
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root, _, filenames in os.walk(output_dir):
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                archive.write(path, os.path.relpath(path, output_dir))
+
+
+ARCHIVE_DIR = 'history'
+
+
+def _archive_storage():
+    return storages[settings.COLUMNAR_EXPORT['STORAGE']]
+
+
+def _archive_name(name):
+    return f'{ARCHIVE_DIR}/{name}.zip'
+
+
+def save_archive(name, fileobj):
+    """Store a zipped bundle under name, replacing any earlier one"""
+    storage = _archive_storage()
+    if storage.exists(_archive_name(name)):
+        storage.delete(_archive_name(name))
+    storage.save(_archive_name(name), File(fileobj))
+
+
+def open_archive(name):
+    """Stored bundle opened for reading, or None once it has been pruned"""
+    storage = _archive_storage()
+    if not storage.exists(_archive_name(name)):
+        return None
+    return storage.open(_archive_name(name), 'rb')
+
+
+def prune_archives():
+    """Delete stored bundles older than COLUMNAR_EXPORT['RETAIN_DAYS']; returns how many were removed"""
+    storage = _archive_storage()
+    try:
+        _, filenames = storage.listdir(ARCHIVE_DIR)
+    except FileNotFoundError:
+        return 0
+    cutoff = timezone.now() - timedelta(days=settings.COLUMNAR_EXPORT['RETAIN_DAYS'])
+    removed = 0
+    for filename in filenames:
+        name = f'{ARCHIVE_DIR}/{filename}'
+        if filename.endswith('.zip') and storage.get_modified_time(name) < cutoff:
+            storage.delete(name)
+            removed += 1
+    return removed
@@ -0,0 +1,90 @@
+# milk_app/deliveries.py
+"""
+Recording delivery outcomes, shared by admin_update_delivery_status (JSON)
+and the driver package results upload (binary).
+"""
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import calendars
+from .models import DailyMilkDelivery, UserSubscription
+
+
+def apply_delivery_updates(delivery_date, updates):
+    """
+    Record status/actual_liters for users on a date; updates are dicts with
+    user_id, status and optionally actual_liters. Each delivery is created
+    or updated at the rate applicable that day (scheduled liters follow plan
+    changes). Users without a subscription or an applicable rate are
+    skipped. Runs a fixed number of queries plus one per user whose current
+    rate does not cover the date. Returns the number of deliveries updated.
+
+    Overlapping calls for the same date (a driver retrying an upload) may both
+    try to create a delivery; the later insert then updates the row instead.
+    """
+    updates = {str(update.get('user_id')): update for update in updates}
+    subscriptions = UserSubscription.objects.select_related('current_rate').filter(
+        user_id__in=[user_id for user_id in updates if _is_uuid(user_id)]
+    )
+
+    with transaction.atomic():
+        rates = {}
+        for subscription in subscriptions:
+            # ✅ get the correct rate for the delivery_date (no query when the current rate covers it)
+            rate = subscription.rate_for(delivery_date)
+            if rate:  # no valid rate found, skip this user
+                rates[str(subscription.user_id)] = (subscription, rate)
+
+        existing = {
+            str(delivery.user_id): delivery
+            for delivery in DailyMilkDelivery.objects.select_for_update().filter(
+                user_id__in=list(rates), delivery_date=delivery_date
+            )
+        }
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for user_id, (subscription, rate) in rates.items():
+            update = updates[user_id]
+            delivery = existing.get(user_id)
+            if delivery is None:
+                to_create.append(DailyMilkDelivery(
+                    user_id=subscription.user_id,
+                    delivery_date=delivery_date,
+                    scheduled_liters=rate.daily_liters,
+                    rate_applied=rate,
+                    route_id=subscription.route_id,
+                    status=update.get('status'),
+                    actual_liters=update.get('actual_liters')
+                ))
+                continue
+            delivery.status = update.get('status')
+            if update.get('actual_liters') is not None:
+                delivery.actual_liters = update['actual_liters']
+            delivery.scheduled_liters = rate.daily_liters  # ✅ keep it updated if plan changes
+            delivery.rate_applied = rate
+            delivery.updated_at = now
+            to_update.append(delivery)
+
+        DailyMilkDelivery.objects.bulk_create(
+            to_create,
+            update_conflicts=True,
+            unique_fields=['user', 'delivery_date'],
+            update_fields=['status', 'actual_liters', 'scheduled_liters', 'rate_applied', 'updated_at']
+        )
+        DailyMilkDelivery.objects.bulk_update(
+            to_update, ['status', 'actual_liters', 'scheduled_liters', 'rate_applied', 'updated_at']
+        )
+        if rates:
+            calendars.invalidate_on_commit(*[subscription.user_id for subscription, _ in rates.values()])
+    return len(rates)
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,249 @@
+# milk_app/driver_package.py
+"""
+Offline driver packages: a route's stops for a date in a compact binary form.
+
+Drivers download the package once before the round, deliver offline, and
+upload their results in one request that answers with the refreshed
+package. Both payloads are a short uncompressed header followed by a
+zlib-deflated body of little-endian fixed-width fields:
+
+* strings are utf-8 prefixed by a u16 byte length
+* users are dictionary-encoded: each appears once in the user table and
+  stops refer to it by u16 index
+* liters are u32 centiliters; NULL_U32 marks an unknown/absent value
+* coordinates are i32 micro-degrees; NULL_I32 marks an unknown position
+* statuses are u8 indexes into the status table carried in the package
+
+Package (magic ``MDRV``)::
+
+    header  magic[4] version:u8 body_length:u32
+    body    date_ordinal:u32 route_id[16] route_name:str
+            statuses:u8 status:str * statuses
+            users:u16  (user_id[16] name:str phone:str address:str latitude:i32 longitude:i32) * users
+            stops:u16  (user:u16 scheduled_cl:u32 status:u8 leg_m:u32) * stops
+
+Stops are in driving order (routes.route_sequence). Results (magic ``MDRR``)::
+
+    header  magic[4] version:u8 body_length:u32
+    body    date_ordinal:u32 results:u16 (user_id[16] status:u8 actual_cl:u32) * results
+"""
+import hashlib
+import struct
+import uuid
+import zlib
+from datetime import date
+from decimal import Decimal
+
+from .models import DailyMilkDelivery
+
+PACKAGE_MAGIC = b'MDRV'
+RESULTS_MAGIC = b'MDRR'
+FORMAT_VERSION = 1
+CONTENT_TYPE = 'application/octet-stream'
+# Results of one upload; a route is far smaller than this
+MAX_RESULTS = 0xFFFF
+MAX_BODY_LENGTH = 16 * 1024 * 1024
+
+NULL_U32 = 0xFFFFFFFF
+NULL_I32 = -0x80000000
+MICRO_DEGREES = Decimal(1000000)
+CENTILITERS = Decimal(100)
+
+DELIVERY_STATUSES = [value for value, _ in DailyMilkDelivery.STATUS_CHOICES]
+
+HEADER = struct.Struct('<4sBI')
+PACKAGE_HEAD = struct.Struct('<I16s')
+USER = struct.Struct('<ii')
+STOP = struct.Struct('<HIBI')
+RESULTS_HEAD = struct.Struct('<IH')
+RESULT = struct.Struct('<16sBI')
+U8 = struct.Struct('<B')
+U16 = struct.Struct('<H')
+
+
+class PackageError(ValueError):
+    """A payload that is not a well-formed driver package/results upload"""
+
+
+def _string(value):
+    encoded = (value or '').encode('utf-8')
+    return U16.pack(len(encoded)) + encoded
+
+
+def _centiliters(liters):
+    return NULL_U32 if liters is None else int(Decimal(liters) * CENTILITERS)
+
+
+def _micro_degrees(degrees):
+    return NULL_I32 if degrees is None else int(Decimal(degrees) * MICRO_DEGREES)
+
+
+def _frame(magic, body):
+    return HEADER.pack(magic, FORMAT_VERSION, len(body)) + zlib.compress(body, 9)
+
+
+def _unframe(magic, payload):
+    if len(payload) < HEADER.size:
+        raise PackageError('Payload is too short')
+    found, version, length = HEADER.unpack_from(payload)
+    if found != magic:
+        raise PackageError('Unrecognized payload')
+    if version != FORMAT_VERSION:
+        raise PackageError(f'Unsupported format version {version}')
+    if length > MAX_BODY_LENGTH:
+        raise PackageError('Payload body is too large')
+    try:
+        # Inflate no further than the declared length, so a hostile body cannot balloon
+        inflater = zlib.decompressobj()
+        body = inflater.decompress(payload[HEADER.size:], length + 1)
+    except zlib.error:
+        raise PackageError('Corrupt payload body')
+    if len(body) != length or not inflater.eof:
+        raise PackageError('Payload body length mismatch')
+    return body
+
+
+class _Reader:
+    """Sequential reader over a decompressed body"""
+
+    def __init__(self, body):
+        self.body = body
+        self.offset = 0
+
+    def unpack(self, layout):
+        try:
+            values = layout.unpack_from(self.body, self.offset)
+        except struct.error:
+            raise PackageError('Truncated payload')
+        self.offset += layout.size
+        return values
+
+    def raw(self, length):
+        value = self.body[self.offset:self.offset + length]
+        if len(value) != length:
+            raise PackageError('Truncated payload')
+        self.offset += length
+        return value
+
+    def string(self):
+        try:
+            return self.raw(self.unpack(U16)[0]).decode('utf-8')
+        except UnicodeDecodeError:
+            raise PackageError('Invalid string')
+
+
+def encode_package(route, delivery_date, stops):
+    """
+    Package bytes for a route's stops (routes.route_sequence order; dicts with
+    user_id, user_name, user_phone, address, latitude, longitude,
+    scheduled_liters, status and leg_km).
+    """
+    users = {}
+    user_table = []
+    stop_table = []
+    for stop in stops:
+        index = users.get(stop['user_id'])
+        if index is None:
+            index = users[stop['user_id']] = len(user_table)
+            user_table.append(
+                stop['user_id'].bytes + _string(stop['user_name']) + _string(stop['user_phone'])
+                + _string(stop['address']) + USER.pack(_micro_degrees(stop['latitude']), _micro_degrees(stop['longitude']))
+            )
+        leg_m = NULL_U32 if stop['leg_km'] is None else round(stop['leg_km'] * 1000)
+        stop_table.append(STOP.pack(
+            index, _centiliters(stop['scheduled_liters']), DELIVERY_STATUSES.index(stop['status']), leg_m
+        ))
+
+    body = b''.join([
+        PACKAGE_HEAD.pack(delivery_date.toordinal(), route.id.bytes),
+        _string(route.name),
+        U8.pack(len(DELIVERY_STATUSES)),
+        *[_string(value) for value in DELIVERY_STATUSES],
+        U16.pack(len(user_table)),
+        *user_table,
+        U16.pack(len(stop_table)),
+        *stop_table,
+    ])
+    return _frame(PACKAGE_MAGIC, body)
+
+
+def decode_package(payload):
+    """Inverse of encode_package, as plain dicts (liters as Decimal, leg_km as float)"""
+    reader = _Reader(_unframe(PACKAGE_MAGIC, payload))
+    ordinal, route_id = reader.unpack(PACKAGE_HEAD)
+    route_name = reader.string()
+    statuses = [reader.string() for _ in range(reader.unpack(U8)[0])]
+
+    users = []
+    for _ in range(reader.unpack(U16)[0]):
+        user_id = uuid.UUID(bytes=reader.raw(16))
+        name, phone, address = reader.string(), reader.string(), reader.string()
+        latitude, longitude = reader.unpack(USER)
+        users.append({
+            'user_id': user_id,
+            'user_name': name,
+            'user_phone': phone,
+            'address': address,
+            'latitude': None if latitude == NULL_I32 else Decimal(latitude) / MICRO_DEGREES,
+            'longitude': None if longitude == NULL_I32 else Decimal(longitude) / MICRO_DEGREES,
+        })
+
+    stops = []
+    for sequence in range(1, reader.unpack(U16)[0] + 1):
+        index, centiliters, status_code, leg_m = reader.unpack(STOP)
+        if index >= len(users) or status_code >= len(statuses):
+            raise PackageError('Stop refers outside the package tables')
+        stops.append(dict(
+            users[index],
+            sequence=sequence,
+            scheduled_liters=Decimal(centiliters) / CENTILITERS,
+            status=statuses[status_code],
+            leg_km=None if leg_m == NULL_U32 else leg_m / 1000
+        ))
+    return {
+        'date': date.fromordinal(ordinal),
+        'route': {'id': uuid.UUID(bytes=route_id), 'name': route_name},
+        'stops': stops
+    }
+
+
+def etag(payload):
+    return '"%s"' % hashlib.sha1(payload).hexdigest()
+
+
+def encode_results(delivery_date, results):
+    """Results upload bytes for [{user_id, status, actual_liters}] (what the driver app sends)"""
+    if len(results) > MAX_RESULTS:
+        raise PackageError(f'At most {MAX_RESULTS} results per upload')
+    body = RESULTS_HEAD.pack(delivery_date.toordinal(), len(results)) + b''.join(
+        RESULT.pack(
+            uuid.UUID(str(result['user_id'])).bytes,
+            DELIVERY_STATUSES.index(result['status']),
+            _centiliters(result.get('actual_liters'))
+        ) for result in results
+    )
+    return _frame(RESULTS_MAGIC, body)
+
+
+def decode_results(payload):
+    """(delivery_date, [{user_id, status, actual_liters}]) from a results upload"""
+    reader = _Reader(_unframe(RESULTS_MAGIC, payload))
+    ordinal, count = reader.unpack(RESULTS_HEAD)
+    try:
+        delivery_date = date.fromordinal(ordinal)
+    except ValueError:
+        raise PackageError('Invalid delivery date')
+
+    results = []
+    for _ in range(count):
+        user_id, status_code, actual = reader.unpack(RESULT)
+        if status_code >= len(DELIVERY_STATUSES):
+            raise PackageError(f'Unknown status code {status_code}')
+        results.append({
+            'user_id': uuid.UUID(bytes=user_id),
+            'status': DELIVERY_STATUSES[status_code],
+            'actual_liters': None if actual == NULL_U32 else Decimal(actual) / CENTILITERS
+        })
+    if reader.offset != len(reader.body):
+        raise PackageError('Trailing data after results')
+    return delivery_date, results
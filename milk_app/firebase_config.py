@@ -1,7 +1,6 @@
 
 # milk_app/firebase_config.py
-import firebase_admin
-from firebase_admin import credentials, auth
+import threading
 from django.conf import settings
 import logging
 
@@ -10,6 +9,7 @@ logger = logging.getLogger(__name__)
 class FirebaseConfig:
     _instance = None
     _initialized = False
+    _lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -18,17 +18,29 @@ class FirebaseConfig:
     
     def __init__(self):
         if not self._initialized:
-            try:
-                cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
-                firebase_admin.initialize_app(cred)
-                self._initialized = True
-                logger.info("Firebase Admin SDK initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize Firebase: {e}")
-                raise
+            with self._lock:
+                if not self._initialized:
+                    self._initialize()
+    
+    def _initialize(self):
+        # firebase_admin pulls in google-auth, requests, etc.; import it on first use
+        # (or in milk_app.warmup before forking) instead of at module load
+        import firebase_admin
+        from firebase_admin import credentials
+        
+        try:
+            cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
+            firebase_admin.initialize_app(cred)
+            self._initialized = True
+            logger.info("Firebase Admin SDK initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize Firebase: {e}")
+            raise
     
     @staticmethod
     def verify_id_token(id_token):
+        from firebase_admin import auth
+        
         try:
             decoded_token = auth.verify_id_token(id_token)
             return decoded_token
@@ -0,0 +1,143 @@
+# milk_app/idempotency.py
+"""
+Idempotency-Key support for mutating endpoints.
+
+Clients on flaky networks retry POSTs whose response they never saw. When a
+request carries an ``Idempotency-Key`` header, the first response for that
+key is kept in the idempotency_keys table and every retry gets it back
+as-is, without running the view (no validation, no domain-table queries).
+Entries are scoped to the authenticated user and the view, and expire after
+settings.IDEMPOTENCY['TTL'] seconds. The table rather than the cache holds
+them so a retry that lands on another worker is still recognised, and
+entries are not evicted early; ``prune_idempotency_keys`` deletes expired
+rows.
+
+Each key is one row:
+
+* while the first request runs, an in-flight row, claimed by inserting it
+  under a unique key so exactly one of several concurrent retries proceeds;
+  the others get 409 and should retry shortly. The claim lapses after
+  IN_FLIGHT_TIMEOUT in case the worker dies mid-request.
+* afterwards the fingerprint (a digest of the method, path and body), status
+  code and response data. Reusing a key for a different request gets 422
+  rather than another request's response.
+
+Server errors (5xx) and exceptions are not remembered, so a retry after one
+runs the view again. Requests without the header are unaffected.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def _storage_key(request, scope, key):
+    return hashlib.blake2b(f'{request.user.id}|{scope}|{key}'.encode(), digest_size=16).hexdigest()
+
+
+def _fingerprint(request):
+    return hashlib.blake2b(
+        request.method.encode() + b' ' + request.path.encode() + b'\n' + request.body, digest_size=16
+    ).hexdigest()
+
+
+def _claim(storage_key, fingerprint):
+    """Insert an in-flight row, or take over an expired one; returns (claimed, existing row)"""
+    now = timezone.now()
+    in_flight_until = now + timezone.timedelta(seconds=settings.IDEMPOTENCY['IN_FLIGHT_TIMEOUT'])
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=storage_key, fingerprint=fingerprint, expires_at=in_flight_until)
+        return True, None
+    except IntegrityError:
+        pass
+
+    stored = IdempotencyKey.objects.filter(key=storage_key).first()
+    if stored is not None and stored.expires_at <= now:
+        # Expired: take it over unless another retry just did
+        claimed = IdempotencyKey.objects.filter(key=storage_key, expires_at=stored.expires_at).update(
+            fingerprint=fingerprint, in_flight=True, status_code=None, response=None, expires_at=in_flight_until
+        )
+        if claimed:
+            return True, None
+        stored = IdempotencyKey.objects.filter(key=storage_key).first()
+    return False, stored
+
+
+def _release(storage_key):
+    if transaction.get_connection().needs_rollback:
+        return  # the enclosing transaction (an atomic batch) is rolled back, claim included
+    IdempotencyKey.objects.filter(key=storage_key, in_flight=True).delete()
+
+
+def idempotent(view_func):
+    """
+    Honour Idempotency-Key on a DRF function view. Apply below @api_view and
+    @permission_classes so the key is scoped to an authenticated user.
+    """
+    scope = view_func.__name__
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_func(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            return Response(
+                {'error': f'{HEADER} must be 1-{MAX_KEY_LENGTH} printable characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        storage_key = _storage_key(request, scope, key)
+        fingerprint = _fingerprint(request)
+        claimed, stored = _claim(storage_key, fingerprint)
+        if not claimed:
+            if stored is None or stored.in_flight:
+                metrics.incr(f'idempotency.{scope}.in_flight')
+                return Response(
+                    {'error': 'A request with this Idempotency-Key is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if stored.fingerprint != fingerprint:
+                metrics.incr(f'idempotency.{scope}.mismatch')
+                return Response(
+                    {'error': f'{HEADER} was already used for a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            metrics.incr(f'idempotency.{scope}.replayed')
+            return Response(stored.response, status=stored.status_code, headers={REPLAY_HEADER: 'true'})
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            _release(storage_key)
+            raise
+        if response.status_code >= 500 or not isinstance(response, Response):
+            _release(storage_key)
+        else:
+            IdempotencyKey.objects.filter(key=storage_key).update(
+                in_flight=False,
+                status_code=response.status_code,
+                response=response.data,
+                expires_at=timezone.now() + timezone.timedelta(seconds=settings.IDEMPOTENCY['TTL'])
+            )
+        return response
+
+    return wrapper
+
+
+def prune():
+    """Delete expired keys; returns how many were removed"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
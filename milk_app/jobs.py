@@ -0,0 +1,301 @@
+# milk_app/jobs.py
+"""
+Lightweight DB-backed job queue.
+
+Admin views enqueue a Job row; the ``run_jobs`` management command claims and
+executes queued jobs in a pool of worker processes/threads. Only the database
+is used for coordination, so no Redis or other broker is required.
+
+While a job runs, its worker refreshes ``updated_at`` as a heartbeat. Workers
+periodically reap running jobs whose heartbeat has gone stale (the worker was
+killed or lost its host): they are requeued, or failed after MAX_ATTEMPTS.
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .columnar import export_history, prune_archives, save_archive, zip_bundle
+from .models import Job, User, UserSubscription
+from .reports import build_billing_report, build_billing_reports, build_delivery_schedule
+from .serializers import (
+    BillingInvoicesParamsSerializer, BillingReportParamsSerializer, HistoryExportParamsSerializer,
+    ScheduleExportParamsSerializer,
+)
+
+logger = logging.getLogger(__name__)
+
+# kind -> (handler, params serializer class)
+JOB_HANDLERS = {}
+
+# Subscriptions billed per build_billing_reports call in billing_invoices jobs
+INVOICE_BATCH_SIZE = 500
+
+_last_reap = 0
+
+
+class JobError(Exception):
+    """Raised by handlers for expected failures; the message is stored on the job"""
+
+
+def job_handler(kind, params_serializer):
+    """Register a function as the handler for a job kind"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = (func, params_serializer)
+        return func
+    return decorator
+
+
+def validate_job_params(kind, params):
+    """Return (validated_data, errors) for a job kind's parameters"""
+    _, params_serializer = JOB_HANDLERS[kind]
+    serializer = params_serializer(data=params)
+    if serializer.is_valid():
+        return serializer.validated_data, None
+    return None, serializer.errors
+
+
+def enqueue_job(kind, params, user=None):
+    """Queue a job; params must already be valid for the kind"""
+    return Job.objects.create(kind=kind, params=params, created_by=user)
+
+
+def report_progress(job, progress, total=None):
+    """Persist progress for pollers without touching the rest of the row"""
+    job.progress = progress
+    fields = {'progress': progress, 'updated_at': timezone.now()}
+    if total is not None:
+        job.total = total
+        fields['total'] = total
+    Job.objects.filter(id=job.id).update(**fields)
+
+
+def claim_next_job(worker_name):
+    """Atomically move the oldest queued job to running, or return None"""
+    queued = Job.objects.filter(status='queued').order_by('created_at')
+
+    def claim(job):
+        return Job.objects.filter(id=job.id, status='queued').update(
+            status='running', started_at=started_at, worker=worker_name, updated_at=started_at,
+            attempts=F('attempts') + 1
+        )
+
+    started_at = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queued.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            claim(job)
+    else:
+        # No row locks (SQLite): claim with a conditional UPDATE in autocommit mode
+        # and move on to the next candidate if another worker got there first
+        while True:
+            job = queued.first()
+            if job is None:
+                return None
+            if claim(job):
+                break
+
+    job.status = 'running'
+    job.started_at = started_at
+    job.worker = worker_name
+    job.attempts += 1
+    return job
+
+
+def reap_stale_jobs():
+    """Requeue (or fail, after MAX_ATTEMPTS) running jobs whose heartbeat is older than STALE_TIMEOUT"""
+    config = settings.JOB_QUEUE
+    cutoff = timezone.now() - timezone.timedelta(seconds=config['STALE_TIMEOUT'])
+    stale = Job.objects.filter(status='running', updated_at__lt=cutoff)
+
+    reaped = 0
+    for job in stale.only('id', 'kind', 'worker', 'attempts', 'updated_at'):
+        # Conditional on the heartbeat we saw, so a worker that just reported in keeps its job
+        current = Job.objects.filter(id=job.id, status='running', updated_at=job.updated_at)
+        now = timezone.now()
+        if job.attempts < config['MAX_ATTEMPTS']:
+            updated = current.update(status='queued', worker='', started_at=None, updated_at=now)
+        else:
+            updated = current.update(
+                status='failed', finished_at=now, updated_at=now,
+                error=f'Worker {job.worker} stopped responding (attempt {job.attempts} of {config["MAX_ATTEMPTS"]})'
+            )
+        if updated:
+            logger.warning(f"Reaped stale job {job.id} ({job.kind}) from {job.worker}")
+            reaped += updated
+    return reaped
+
+
+def _heartbeat(job, stop_event, interval):
+    try:
+        while not stop_event.wait(interval):
+            Job.objects.filter(id=job.id, status='running', worker=job.worker).update(updated_at=timezone.now())
+    except DatabaseError as e:
+        logger.warning(f"Heartbeat for job {job.id} failed: {e}")
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    """Execute a claimed job and record its outcome"""
+    entry = JOB_HANDLERS.get(job.kind)
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, args=(job, stop_heartbeat, settings.JOB_QUEUE['HEARTBEAT_INTERVAL']), daemon=True
+    )
+    heartbeat.start()
+    try:
+        if entry is None:
+            raise JobError(f'Unknown job kind: {job.kind}')
+
+        handler, _ = entry
+        params, errors = validate_job_params(job.kind, job.params)
+        if errors:
+            raise JobError(f'Invalid params: {errors}')
+
+        result = handler(job, params)
+    except JobError as e:
+        _finish_job(job, 'failed', error=str(e))
+    except Exception:
+        logger.exception(f"Job {job.id} ({job.kind}) crashed")
+        _finish_job(job, 'failed', error=traceback.format_exc(limit=5))
+    else:
+        _finish_job(job, 'succeeded', result=result)
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+
+def _finish_job(job, status, result=None, error=''):
+    job.status = status
+    job.result = result
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at', 'updated_at'])
+
+
+def _maybe_reap():
+    global _last_reap
+    if time.monotonic() - _last_reap < settings.JOB_QUEUE['HEARTBEAT_INTERVAL']:
+        return
+    _last_reap = time.monotonic()
+    reap_stale_jobs()
+
+
+def work(stop_event, poll_interval, burst=False):
+    """Thread loop: claim and run jobs until stopped (or until the queue is empty in burst mode)"""
+    worker_name = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            try:
+                _maybe_reap()
+                job = claim_next_job(worker_name)
+            except DatabaseError as e:
+                logger.warning(f"Could not claim a job: {e}")
+                stop_event.wait(poll_interval)
+                continue
+            if job is None:
+                if burst:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            run_job(job)
+    finally:
+        connection.close()
+
+
+# Job Handlers
+@job_handler('billing_report', BillingReportParamsSerializer)
+def billing_report_job(job, params):
+    try:
+        user = User.objects.get(id=params['user_id'])
+        subscription = UserSubscription.objects.get(user=user)
+    except (User.DoesNotExist, UserSubscription.DoesNotExist):
+        raise JobError('User or subscription not found')
+
+    report_progress(job, 0, total=1)
+    report = build_billing_report(user, subscription, params['start_date'], params['end_date'])
+    report_progress(job, 1)
+    return report
+
+
+@job_handler('billing_invoices', BillingInvoicesParamsSerializer)
+def billing_invoices_job(job, params):
+    """Billing summary and rate breakdown for every subscriber active in the period"""
+    start_date, end_date = params['start_date'], params['end_date']
+
+    subscriptions = UserSubscription.objects.filter(
+        subscription_start_date__lte=end_date,
+    ).filter(
+        Q(subscription_end_date__isnull=True) | Q(subscription_end_date__gte=start_date)
+    ).order_by('user__full_name')
+
+    if params.get('user_ids'):
+        subscriptions = subscriptions.filter(user_id__in=params['user_ids'])
+
+    subscription_ids = list(subscriptions.values_list('id', flat=True))
+    report_progress(job, 0, total=len(subscription_ids))
+
+    invoices = []
+    for offset in range(0, len(subscription_ids), INVOICE_BATCH_SIZE):
+        batch = subscriptions.filter(id__in=subscription_ids[offset:offset + INVOICE_BATCH_SIZE])
+        invoices.extend(build_billing_reports(batch, start_date, end_date))
+        report_progress(job, len(invoices))
+
+    return {
+        'billing_period': {'start_date': start_date, 'end_date': end_date},
+        'invoice_count': len(invoices),
+        'invoices': invoices
+    }
+
+
+@job_handler('schedule_export', ScheduleExportParamsSerializer)
+def schedule_export_job(job, params):
+    """Delivery schedules for every date in the range"""
+    start_date, end_date = params['start_date'], params['end_date']
+    total_days = (end_date - start_date).days + 1
+    report_progress(job, 0, total=total_days)
+
+    schedules = []
+    for offset in range(total_days):
+        schedules.append(build_delivery_schedule(start_date + timezone.timedelta(days=offset)))
+        report_progress(job, offset + 1)
+
+    return {'start_date': start_date, 'end_date': end_date, 'schedules': schedules}
+
+
+
+@job_handler('history_export', HistoryExportParamsSerializer)
+def history_export_job(job, params):
+    """Zipped columnar bundle of the range, downloaded from api/admin/export/history/<job_id>/"""
+    start_date, end_date = params['start_date'], params['end_date']
+    report_progress(job, 0, total=1)
+    prune_archives()
+
+    # Downloads only look for the stored bundle once the job has succeeded
+    with tempfile.TemporaryDirectory() as output_dir, tempfile.TemporaryFile() as archive:
+        manifest = export_history(output_dir, start_date, end_date, compress=params['compress'])
+        zip_bundle(output_dir, archive)
+        size = archive.tell()
+        archive.seek(0)
+        save_archive(job.id, archive)
+    report_progress(job, 1)
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'filename': f'delivery_history_{start_date}_{end_date}.zip',
+        'size': size,
+        'rows': {table: info['rows'] for table, info in manifest['tables'].items()},
+    }
@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from milk_app.billing_engine import NO_RATE, aggregate_rates, load_numpy
+
+
+def _aggregate_python(rate_user, rate_start, rate_end, delivery_user, delivery_day, delivery_rate,
+                      delivery_liters, skip_user, skip_day):
+    """Row-by-row reference with the Python engine's semantics and summation order"""
+    rate_count = len(rate_user)
+    delivered_days = [0] * rate_count
+    delivered_liters = [0] * rate_count
+    for user, day, rate, liters in zip(delivery_user, delivery_day, delivery_rate, delivery_liters):
+        if rate != NO_RATE and user == rate_user[rate] and rate_start[rate] <= day <= rate_end[rate]:
+            delivered_days[rate] += 1
+            delivered_liters[rate] += liters
+
+    skips = set(zip(skip_user, skip_day))
+    skip_days = [
+        sum((user, day) in skips for day in range(start, end + 1))
+        for user, start, end in zip(rate_user, rate_start, rate_end)
+    ]
+    return delivered_days, delivered_liters, skip_days
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorized billing engine on synthetic delivery columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Delivered rows to generate')
+        parser.add_argument('--users', type=int, default=50_000, help='Subscribers (two rates each)')
+        parser.add_argument('--days', type=int, default=365, help='Length of the billing period')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-python', action='store_true',
+                            help='Skip the row-by-row reference run and the equality check')
+
+    def handle(self, *args, **options):
+        np = load_numpy()
+        if np is None:
+            raise CommandError('NumPy is not installed')
+
+        rng = np.random.default_rng(options['seed'])
+        rows, users, days = options['rows'], options['users'], options['days']
+        first_day = 738000
+
+        # Each user switches from rate 2u to rate 2u+1 somewhere in the period
+        switch = rng.integers(1, days, size=users)
+        rate_user = np.repeat(np.arange(users, dtype=np.int32), 2)
+        rate_start = np.empty(users * 2, dtype=np.int32)
+        rate_end = np.empty(users * 2, dtype=np.int32)
+        rate_start[0::2], rate_end[0::2] = first_day, first_day + switch - 1
+        rate_start[1::2], rate_end[1::2] = first_day + switch, first_day + days - 1
+
+        delivery_day = np.sort(rng.integers(0, days, size=rows)).astype(np.int32) + first_day
+        delivery_user = rng.integers(0, users, size=rows, dtype=np.int32)
+        delivery_rate = (2 * delivery_user + (delivery_day >= first_day + switch[delivery_user])).astype(np.int32)
+        delivery_rate[rng.random(rows) < 0.01] = NO_RATE
+        delivery_liters = rng.integers(2, 13, size=rows) * 0.25
+
+        skip_count = rows // 20
+        skip_keys = np.unique(
+            rng.integers(0, users, size=skip_count).astype(np.int64) * days + rng.integers(0, days, size=skip_count)
+        )
+        skip_user = (skip_keys // days).astype(np.int32)
+        skip_day = (skip_keys % days).astype(np.int32) + first_day
+
+        columns = (rate_user, rate_start, rate_end, delivery_user, delivery_day, delivery_rate,
+                   delivery_liters, skip_user, skip_day)
+        self.stdout.write(f'{rows:,} deliveries, {len(skip_user):,} skips, {users * 2:,} rates over {days} days')
+
+        started = time.perf_counter()
+        vectorized = aggregate_rates(*columns)
+        self.stdout.write(f'numpy:  {time.perf_counter() - started:.2f}s')
+
+        if options['skip_python']:
+            return
+
+        started = time.perf_counter()
+        reference = _aggregate_python(*(column.tolist() for column in columns))
+        self.stdout.write(f'python: {time.perf_counter() - started:.2f}s')
+
+        for name, ours, theirs in zip(['delivered_days', 'delivered_liters', 'skip_days'], vectorized, reference):
+            if ours.tolist() != theirs:
+                raise CommandError(f'{name} differs between engines')
+        self.stdout.write(self.style.SUCCESS('Results identical'))
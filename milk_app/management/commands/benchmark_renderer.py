@@ -0,0 +1,71 @@
+import json
+import random
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from milk_app.renderers import FastJSONRenderer, load_orjson
+
+
+def _schedule(rows, seed):
+    """Synthetic delivery schedule shaped like reports.build_delivery_schedule output"""
+    rng = random.Random(seed)
+    delivery_date = date(2024, 1, 1)
+    routes = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(max(1, rows // 300))]
+    deliveries = [{
+        'user_id': uuid.UUID(int=rng.getrandbits(128)),
+        'user_name': f'Customer {index}',
+        'user_phone': f'+9198{rng.randrange(10 ** 8):08d}',
+        'scheduled_liters': Decimal(rng.randrange(25, 400, 25)) / 100,
+        'rate_id': uuid.UUID(int=rng.getrandbits(128)),
+        'route_id': rng.choice(routes),
+        'status': 'scheduled',
+        'updated_at': timezone.now() - timedelta(seconds=rng.randrange(86400))
+    } for index in range(rows)]
+    return {
+        'date': delivery_date,
+        'blackouts': [],
+        'total_deliveries': rows,
+        'total_liters': sum(delivery['scheduled_liters'] for delivery in deliveries),
+        'deliveries': deliveries
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark FastJSONRenderer against DRF\'s JSONRenderer on a synthetic delivery schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50_000, help='Deliveries in the schedule')
+        parser.add_argument('--repeat', type=int, default=5, help='Renders per renderer; the best time is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if load_orjson() is None:
+            raise CommandError('orjson is not installed')
+
+        rows = options['rows']
+        data = _schedule(rows, options['seed'])
+        self.stdout.write(f'{rows:,} deliveries')
+
+        outputs = {}
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            best = None
+            for _ in range(max(1, options['repeat'])):
+                started = time.perf_counter()
+                output = renderer.render(data, 'application/json')
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            outputs[name] = output
+            self.stdout.write(
+                f'{name + ":":18}{best * 1000:8.1f} ms  {rows / best:12,.0f} rows/s  '
+                f'{len(output) / best / 1e6:7.1f} MB/s  {len(output):,} bytes'
+            )
+
+        if json.loads(outputs['JSONRenderer']) != json.loads(outputs['FastJSONRenderer']):
+            raise CommandError('Renderers produced different documents')
+        self.stdout.write(self.style.SUCCESS('Documents identical'))
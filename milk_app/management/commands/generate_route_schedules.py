@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from milk_app.models import DeliveryRoute
+from milk_app.utils import parse_date
+
+
+def _init_worker():
+    django.setup()
+
+
+def _generate(args):
+    from milk_app.routes import generate_route_schedule
+
+    route_id, delivery_date = args
+    started = time.perf_counter()
+    stops = generate_route_schedule(route_id, delivery_date)
+    connections.close_all()
+    return route_id, stops, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Generate scheduled deliveries for a date route by route, in parallel worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Delivery date (YYYY-MM-DD, default tomorrow)')
+        parser.add_argument('--processes', type=int, default=min(4, os.cpu_count() or 1),
+                            help='Worker processes; each generates whole routes')
+        parser.add_argument('--route', action='append', dest='routes', default=[],
+                            help='Only this route id (repeatable)')
+        parser.add_argument('--skip-unrouted', action='store_true',
+                            help='Do not schedule subscriptions that have no route yet')
+
+    def handle(self, *args, **options):
+        delivery_date = timezone.now().date() + timezone.timedelta(days=1)
+        if options['date']:
+            delivery_date = parse_date(options['date'])
+            if not delivery_date:
+                raise CommandError('Date must be in YYYY-MM-DD format')
+
+        routes = DeliveryRoute.objects.select_related('zone')
+        if options['routes']:
+            routes = routes.filter(id__in=options['routes'])
+        names = {route.id: str(route) for route in routes}
+        route_ids = list(names)
+        if not options['routes'] and not options['skip_unrouted']:
+            route_ids.append(None)
+            names[None] = '(no route)'
+
+        tasks = [(route_id, delivery_date) for route_id in route_ids]
+        processes = max(1, min(options['processes'], len(tasks)))
+        started = time.perf_counter()
+        if processes == 1:
+            results = [_generate(task) for task in tasks]
+        else:
+            # Connections must not be shared with child processes
+            connections.close_all()
+            with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+                results = pool.map(_generate, tasks)
+
+        for route_id, stops, seconds in results:
+            self.stdout.write(f'{names[route_id]}: {stops} stops ({seconds * 1000:.0f} ms)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Scheduled {sum(result[1] for result in results)} deliveries on {len(results)} routes for '
+            f'{delivery_date} with {processes} process(es) in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from milk_app import partitions
+from milk_app.utils import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        'Create upcoming monthly partitions of daily_milk_deliveries and archive old months '
+        '(PostgreSQL: gzipped CSV per partition, then detach and drop; other databases: archive table)'
+    )
+
+    def add_arguments(self, parser):
+        config = settings.DELIVERY_PARTITIONS
+        parser.add_argument('--ahead', type=int, default=config['MONTHS_AHEAD'],
+                            help='Months past the current one to create partitions for')
+        parser.add_argument('--archive', action='store_true',
+                            help='Archive months older than the retention window')
+        parser.add_argument('--retain-months', type=int, default=config['RETAIN_MONTHS'],
+                            help='Full months kept before the current one when archiving')
+        parser.add_argument('--archive-before', help='Archive months ending on or before this date instead (YYYY-MM-DD)')
+        parser.add_argument('--archive-dir', default=config['ARCHIVE_DIR'])
+        parser.add_argument('--keep-detached', action='store_true',
+                            help='Leave archived partitions as standalone tables instead of dropping them')
+        parser.add_argument('--export', action='store_true',
+                            help='Without partitions: also write the archive table to a gzipped CSV')
+        parser.add_argument('--list', action='store_true', help='List partitions and exit')
+
+    def _cutoff(self, options):
+        if options['archive_before']:
+            cutoff = parse_date(options['archive_before'])
+            if not cutoff:
+                raise CommandError('Date must be in YYYY-MM-DD format')
+            return cutoff
+        if options['retain_months'] < 0:
+            raise CommandError('--retain-months must not be negative')
+        current = partitions.month_start(timezone.now().date())
+        return partitions.add_months(current, -options['retain_months'])
+
+    def handle(self, *args, **options):
+        archiving = options['archive'] or options['archive_before']
+        if not partitions.is_partitioned():
+            if options['list']:
+                raise CommandError('daily_milk_deliveries is not partitioned on this database')
+            if archiving:
+                moved = partitions.archive_rows_before(self._cutoff(options))
+                self.stdout.write(self.style.SUCCESS(f'Moved {moved} deliveries to the archive table'))
+            if options['export']:
+                path = partitions.export_archived(options['archive_dir'])
+                self.stdout.write(f'Wrote {path}')
+            return
+
+        if options['list']:
+            for name, first_day, end_day in partitions.list_partitions():
+                self.stdout.write(f'{name}  {first_day} .. {end_day}')
+            return
+
+        for name in partitions.ensure_partitions(options['ahead']):
+            self.stdout.write(f'Created {name}')
+
+        if archiving:
+            archived = partitions.archive_partitions_before(
+                self._cutoff(options), options['archive_dir'], options['keep_detached']
+            )
+            for name, path in archived:
+                self.stdout.write(f'Archived {name} to {path}')
+            self.stdout.write(self.style.SUCCESS(f'Archived {len(archived)} partitions'))
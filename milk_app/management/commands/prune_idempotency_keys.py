@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from milk_app import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete Idempotency-Key records that have expired'
+
+    def handle(self, *args, **options):
+        deleted = idempotency.prune()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from milk_app.token_store import revocation_store
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked/consumed token records whose tokens have expired'
+
+    def handle(self, *args, **options):
+        deleted = revocation_store.prune()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired token records'))
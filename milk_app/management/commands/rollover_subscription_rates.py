@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from milk_app.rates import rollover
+from milk_app.utils import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Activate rate versions due today, expire ended ones and repoint current rates (run daily after midnight)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Roll over as of this date instead of today (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        on_date = None
+        if options['date']:
+            on_date = parse_date(options['date'])
+            if not on_date:
+                raise CommandError('Date must be in YYYY-MM-DD format')
+
+        flipped, repointed = rollover(on_date)
+        self.stdout.write(self.style.SUCCESS(
+            f'Flipped is_active on {flipped} rate versions; updated current rate on {repointed} subscriptions'
+        ))
@@ -0,0 +1,76 @@
+import multiprocessing
+import signal
+import threading
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _run_threads(threads, poll_interval, burst):
+    from milk_app.jobs import work
+
+    stop_event = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *args: stop_event.set())
+
+    workers = [
+        threading.Thread(target=work, args=(stop_event, poll_interval, burst), daemon=True)
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    # join with a timeout so the signal handlers above still get to run
+    for worker in workers:
+        while worker.is_alive():
+            worker.join(timeout=1)
+
+
+def _process_main(threads, poll_interval, burst):
+    django.setup()
+    _run_threads(threads, poll_interval, burst)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_QUEUE['WORKER_PROCESSES'],
+                            help='Worker processes to start')
+        parser.add_argument('--threads', type=int, default=settings.JOB_QUEUE['WORKER_THREADS'],
+                            help='Worker threads per process')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_QUEUE['POLL_INTERVAL'],
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        threads = max(1, options['threads'])
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+
+        self.stdout.write(f'Starting {processes} process(es) x {threads} thread(s)')
+
+        if processes == 1:
+            _run_threads(threads, poll_interval, burst)
+            return
+
+        # Connections must not be shared with child processes
+        connections.close_all()
+        children = [
+            multiprocessing.Process(target=_process_main, args=(threads, poll_interval, burst))
+            for _ in range(processes)
+        ]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+            for child in children:
+                child.join()
@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter under -X importtime; prints phase timings as JSON on stdout
+CHILD_SCRIPT = r'''
+import io, json, sys, time
+started = time.perf_counter()
+phases = {}
+
+def mark(name):
+    phases[name] = time.perf_counter() - started
+
+import django
+django.setup()
+mark('django_setup')
+
+if sys.argv[1] == 'warm':
+    from milk_app.warmup import warm_up
+    warm_up()
+    mark('warm_up')
+
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+mark('wsgi_application')
+
+def request(path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(body)
+    if hasattr(body, 'close'):
+        body.close()
+    return statuses[0]
+
+status = request(sys.argv[2])
+mark('first_response')
+before = time.perf_counter()
+request(sys.argv[2])
+phases['second_response_only'] = time.perf_counter() - before
+print(json.dumps({'status': status, 'phases': phases}))
+'''
+
+
+def _parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start cost: import time per module and time to first response'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/user/me/',
+                            help='Path requested by the simulated first request (default needs no DB)')
+        parser.add_argument('--top', type=int, default=25, help='Modules to list, by cumulative import time')
+        parser.add_argument('--prefix', default='', help='Only list modules starting with this prefix')
+        parser.add_argument('--warm-up', action='store_true',
+                            help='Run milk_app.warmup.warm_up() before the first request, as the gunicorn master does')
+
+    def _run_child(self, mode, path):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'milk_project.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, mode, path],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup run failed:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), _parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        mode = 'warm' if options['warm_up'] else 'cold'
+        timings, modules = self._run_child(mode, options['path'])
+
+        self.stdout.write(f"Imports ({len(modules)} modules), top {options['top']} by cumulative time:")
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        listed = [
+            (name, times) for name, times in modules.items() if name.startswith(options['prefix'])
+        ]
+        for name, (self_us, cumulative_us) in sorted(listed, key=lambda item: -item[1][1])[:options['top']]:
+            self.stdout.write(f'{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}')
+
+        self.stdout.write('')
+        self.stdout.write(f"Phases ({mode} start, GET {options['path']} -> {timings['status']}), ms since interpreter start:")
+        for name, seconds in timings['phases'].items():
+            self.stdout.write(f'{name:>22}: {seconds * 1000:8.1f}')
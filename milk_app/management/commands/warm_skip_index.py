@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from milk_app import skip_index
+
+
+class Command(BaseCommand):
+    help = 'Fill the cached skip index for the coming days (run before dispatch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SKIP_INDEX['WARM_DAYS'],
+                            help='Number of days to warm, starting today')
+
+    def handle(self, *args, **options):
+        if not skip_index.enabled():
+            self.stdout.write(self.style.WARNING('The default cache is per-process; the skip index is not used'))
+            return
+        counts = skip_index.warm(days=options['days'])
+        for skip_date, count in counts.items():
+            self.stdout.write(f'{skip_date}: {count} skipped')
+        self.stdout.write(self.style.SUCCESS(f'Warmed skip index for {len(counts)} day(s)'))
@@ -0,0 +1,68 @@
+# milk_app/metrics.py
+"""
+Operational counters kept in the default cache so every worker process
+contributes to the same totals (given a shared cache backend).
+
+Counters bumped on every response use ``incr_buffered``, which adds to
+per-process totals and pushes them at most every FLUSH_INTERVAL seconds, so
+the hot path costs no cache round trips. Buffered amounts not yet pushed
+when a process exits are lost.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+KEY_PREFIX = 'metrics:'
+NAMES_KEY = 'metrics:names'
+FLUSH_INTERVAL = 10  # seconds
+
+_pending = defaultdict(int)
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def incr(name, amount=1):
+    """Add amount to a named counter, creating it on first use"""
+    key = KEY_PREFIX + name
+    if cache.add(key, amount, timeout=None):
+        names = cache.get(NAMES_KEY, set())
+        if name not in names:
+            cache.set(NAMES_KEY, names | {name}, timeout=None)
+        return
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, amount, timeout=None)
+
+
+def incr_buffered(amounts):
+    """Add {name: amount} to this process's totals, pushing them once FLUSH_INTERVAL has passed"""
+    with _pending_lock:
+        for name, amount in amounts.items():
+            _pending[name] += amount
+        if time.monotonic() - _last_flush < FLUSH_INTERVAL:
+            return
+    flush()
+
+
+def flush():
+    """Push this process's buffered totals to the cache"""
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    for name, amount in pending.items():
+        if amount:
+            incr(name, amount)
+
+
+def snapshot(prefix=''):
+    """Return {name: value} for every counter whose name starts with prefix"""
+    flush()
+    names = sorted(name for name in cache.get(NAMES_KEY, set()) if name.startswith(prefix))
+    values = cache.get_many([KEY_PREFIX + name for name in names])
+    return {name: values.get(KEY_PREFIX + name, 0) for name in names}
@@ -0,0 +1,170 @@
+# milk_app/middleware.py
+"""
+Selective gzip compression of responses.
+
+Unlike Django's GZipMiddleware, only responses worth it are compressed:
+content types listed in settings.COMPRESSION['CONTENT_TYPES'] (JSON, CSV,
+...; already-compressed payloads such as driver packages and zip exports
+are left alone) of at least MIN_SIZE bytes. Streaming responses are
+compressed chunk by chunk as they are sent (flushed after every chunk, so
+clients still receive data incrementally); their size is unknown up front,
+so only a Content-Length below MIN_SIZE exempts them.
+
+Paths under LOW_CPU_PATHS (the hot mobile endpoints) use LOW_CPU_LEVEL,
+trading some ratio for less CPU; everything else uses LEVEL. The gzip
+header carries a random-length file name, as in Django's middleware, to
+blunt BREACH-style length attacks.
+
+Totals go to milk_app.metrics under ``compression.``: responses,
+bytes_in, bytes_out, bytes_saved, cpu_us (thread CPU time spent
+compressing) and incompressible (responses left as-is because gzip did not
+shrink them); see api/admin/metrics/?prefix=compression. They are buffered
+per process (metrics.incr_buffered) rather than written per response.
+"""
+import gzip
+import io
+import random
+import secrets
+import string
+import time
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+
+from . import metrics
+
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+MAX_RANDOM_BYTES = 100
+
+
+def _random_filename():
+    return ''.join(random.choices(string.ascii_letters, k=secrets.randbelow(MAX_RANDOM_BYTES) + 1)).encode()
+
+
+def _gzip_file(buffer, level):
+    return gzip.GzipFile(filename=_random_filename(), mode='wb', compresslevel=level, fileobj=buffer, mtime=0)
+
+
+def _record(bytes_in, bytes_out, cpu_seconds, low_cpu):
+    metrics.incr_buffered({
+        'compression.responses': 1,
+        'compression.bytes_in': bytes_in,
+        'compression.bytes_out': bytes_out,
+        'compression.bytes_saved': bytes_in - bytes_out,
+        'compression.cpu_us': round(cpu_seconds * 1e6),
+        'compression.low_cpu_responses': 1 if low_cpu else 0,
+    })
+
+
+class _StreamCompressor:
+    """Incremental gzip of a response's chunks, recording metrics once the stream ends"""
+
+    def __init__(self, level, low_cpu):
+        self.buffer = io.BytesIO()
+        self.file = _gzip_file(self.buffer, level)
+        self.low_cpu = low_cpu
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0
+
+    def _drain(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.bytes_out += len(data)
+        return data
+
+    def compress(self, chunk):
+        started = time.thread_time()
+        self.bytes_in += len(chunk)
+        self.file.write(chunk)
+        self.file.flush(zlib.Z_SYNC_FLUSH)
+        data = self._drain()
+        self.cpu += time.thread_time() - started
+        return data
+
+    def close(self):
+        started = time.thread_time()
+        self.file.close()
+        data = self._drain()
+        self.cpu += time.thread_time() - started
+        _record(self.bytes_in, self.bytes_out, self.cpu, self.low_cpu)
+        return data
+
+
+class SelectiveCompressionMiddleware(MiddlewareMixin):
+    """Gzip large responses of configured content types, at a lower level on CPU-sensitive paths"""
+
+    def process_response(self, request, response):
+        config = settings.COMPRESSION
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in config['CONTENT_TYPES']:
+            return response
+        if response.streaming:
+            length = response.get('Content-Length')
+            if length is not None and int(length) < config['MIN_SIZE']:
+                return response
+        elif len(response.content) < config['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        low_cpu = request.path.startswith(tuple(config['LOW_CPU_PATHS']))
+        level = config['LOW_CPU_LEVEL'] if low_cpu else config['LEVEL']
+        if response.streaming:
+            self._compress_stream(response, level, low_cpu)
+        elif not self._compress_content(response, level, low_cpu):
+            return response
+
+        # A strong ETag no longer matches the encoded bytes; weaken it as Django's GZipMiddleware does
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    def _compress_content(self, response, level, low_cpu):
+        """Compress response.content in place; False (and content untouched) when gzip does not shrink it"""
+        content = response.content
+        started = time.thread_time()
+        buffer = io.BytesIO()
+        with _gzip_file(buffer, level) as file:
+            file.write(content)
+        compressed = buffer.getvalue()
+        cpu = time.thread_time() - started
+        if len(compressed) >= len(content):
+            metrics.incr_buffered({'compression.incompressible': 1})
+            return False
+        _record(len(content), len(compressed), cpu, low_cpu)
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        return True
+
+    def _compress_stream(self, response, level, low_cpu):
+        compressor = _StreamCompressor(level, low_cpu)
+        # Capture the iterator now in case streaming_content is replaced later
+        chunks = response.streaming_content
+        if response.is_async:
+            async def compressed():
+                async for chunk in chunks:
+                    data = compressor.compress(chunk)
+                    if data:
+                        yield data
+                yield compressor.close()
+        else:
+            def compressed():
+                for chunk in chunks:
+                    data = compressor.compress(chunk)
+                    if data:
+                        yield data
+                yield compressor.close()
+        response.streaming_content = compressed()
+        # The compressed size is only known once the stream ends
+        del response.headers['Content-Length']
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def populate_current_rate(apps, schema_editor):
+    UserSubscription = apps.get_model('milk_app', 'UserSubscription')
+    SubscriptionRate = apps.get_model('milk_app', 'SubscriptionRate')
+    today = timezone.now().date()
+    covering = SubscriptionRate.objects.filter(
+        subscription=OuterRef('pk'),
+        effective_from__lte=today,
+    ).filter(
+        Q(effective_to__isnull=True) | Q(effective_to__gte=today)
+    ).order_by('-effective_from')
+    UserSubscription.objects.update(
+        current_rate=Subquery(covering.values('id')[:1]),
+        current_daily_liters=Subquery(covering.values('daily_liters')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk_app', '0004_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersubscription',
+            name='current_daily_liters',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='usersubscription',
+            name='current_rate',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='milk_app.subscriptionrate'),
+        ),
+        migrations.RunPython(populate_current_rate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:22
+
+from django.db import migrations, models
+from django.db.models import Case, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+
+def normalize_active_flags(apps, schema_editor):
+    # Future-dated changes used to deactivate the running version and activate the pending one
+    SubscriptionRate = apps.get_model('milk_app', 'SubscriptionRate')
+    UserSubscription = apps.get_model('milk_app', 'UserSubscription')
+    today = timezone.now().date()
+    covers = Q(effective_from__lte=today) & (Q(effective_to__isnull=True) | Q(effective_to__gte=today))
+    SubscriptionRate.objects.update(is_active=Case(When(covers, then=Value(True)), default=Value(False)))
+
+    active = SubscriptionRate.objects.filter(subscription=OuterRef('pk'), is_active=True).order_by('-effective_from')
+    UserSubscription.objects.update(
+        current_rate=Subquery(active.values('id')[:1]),
+        current_daily_liters=Subquery(active.values('daily_liters')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk_app', '0005_subscription_current_rate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriptionrate',
+            index=models.Index(fields=['subscription', 'is_active'], name='subscriptio_subscri_78ba3a_idx'),
+        ),
+        migrations.RunPython(normalize_active_flags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:24
+
+from datetime import date
+
+from django.db import migrations, models
+
+TABLE = 'daily_milk_deliveries'
+LEGACY_TABLE = 'daily_milk_deliveries_unpartitioned'
+# Monthly partitions created past the current month; manage_delivery_partitions keeps this topped up
+MONTHS_AHEAD = 3
+
+CONSTRAINTS = [
+    'ALTER TABLE {table} ADD CONSTRAINT daily_milk_deliveries_pkey PRIMARY KEY ({pk})',
+    'ALTER TABLE {table} ADD CONSTRAINT daily_milk_deliveries_user_id_delivery_date_60ff4393_uniq '
+    'UNIQUE (user_id, delivery_date)',
+    'CREATE INDEX daily_milk_deliveries_user_id_6187c5b8 ON {table} (user_id)',
+    'CREATE INDEX daily_milk_deliveries_rate_applied_id_f247f2fe ON {table} (rate_applied_id)',
+    'ALTER TABLE {table} ADD CONSTRAINT daily_milk_deliveries_user_id_6187c5b8_fk_users_id '
+    'FOREIGN KEY (user_id) REFERENCES users (id) DEFERRABLE INITIALLY DEFERRED',
+    'ALTER TABLE {table} ADD CONSTRAINT daily_milk_deliverie_rate_applied_id_f247f2fe_fk_subscript '
+    'FOREIGN KEY (rate_applied_id) REFERENCES subscription_rates (id) DEFERRABLE INITIALLY DEFERRED',
+]
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_deliveries(apps, schema_editor):
+    """
+    PostgreSQL only: rebuild daily_milk_deliveries as a table range-partitioned
+    by delivery_date, one partition per month plus a default partition. The
+    partition key must be part of every unique constraint, so the primary key
+    becomes (id, delivery_date); ids stay uuid4 values.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (delivery_date)'
+        )
+
+        cursor.execute(f'SELECT MIN(delivery_date) FROM {LEGACY_TABLE}')
+        today = date.today().replace(day=1)
+        month = min(cursor.fetchone()[0] or today, today).replace(day=1)
+        last = today
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(last)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_y{month.year}m{month.month:02d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            )
+            month = _next_month(month)
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}')
+        cursor.execute(f'DROP TABLE {LEGACY_TABLE}')
+        for statement in CONSTRAINTS:
+            cursor.execute(statement.format(table=TABLE, pk='id, delivery_date'))
+
+
+def unpartition_deliveries(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}')
+        cursor.execute(f'DROP TABLE {LEGACY_TABLE}')  # drops the partitions with it
+        for statement in CONSTRAINTS:
+            cursor.execute(statement.format(table=TABLE, pk='id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk_app', '0006_rate_activation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDelivery',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('user_id', models.UUIDField(db_index=True)),
+                ('delivery_date', models.DateField(db_index=True)),
+                ('scheduled_liters', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('actual_liters', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('rate_applied_id', models.UUIDField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('skipped', 'Skipped by User'), ('delivered', 'Delivered'), ('failed', 'Delivery Failed')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'daily_milk_deliveries_archive',
+            },
+        ),
+        migrations.RunPython(partition_deliveries, unpartition_deliveries),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk_app', '0007_delivery_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkipRule',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('weekday_mask', models.PositiveSmallIntegerField(default=0)),
+                ('interval_days', models.PositiveSmallIntegerField(default=1)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('reason', models.CharField(choices=[('traveling', 'Traveling'), ('excess_stock', 'Have Excess Stock'), ('health', 'Health Reasons'), ('other', 'Other')], default='other', max_length=20)),
+                ('notes', models.TextField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skip_rules', to='milk_app.user')),
+            ],
+            options={
+                'db_table': 'skip_rules',
+                'indexes': [models.Index(fields=['start_date', 'end_date'], name='skip_rules_start_d_54bacb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:29
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk_app', '0008_skip_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlackoutDate',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField(db_index=True)),
+                ('milk_type', models.CharField(blank=True, choices=[('buffalo', 'Buffalo'), ('cow', 'Cow')], max_length=10, null=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'blackout_dates',
+            },
+        ),
+        migrations.AddField(
+            model_name='usersubscription',
+            name='milk_type',
+            field=models.CharField(choices=[('buffalo', 'Buffalo'), ('cow', 'Cow')], default='buffalo', max_length=10),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk_app', '0009_blackout_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryRoute',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'delivery_routes',
+            },
+        ),
+        migrations.CreateModel(
+            name='DeliveryZone',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'delivery_zones',
+            },
+        ),
+        migrations.AddField(
+            model_name='archiveddelivery',
+            name='route_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryroute',
+            name='zone',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='routes', to='milk_app.deliveryzone'),
+        ),
+        migrations.AddField(
+            model_name='blackoutdate',
+            name='zone',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='blackouts', to='milk_app.deliveryzone'),
+        ),
+        migrations.AddField(
+            model_name='dailymilkdelivery',
+            name='route',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='milk_app.deliveryroute'),
+        ),
+        migrations.AddIndex(
+            model_name='dailymilkdelivery',
+            index=models.Index(fields=['route', 'delivery_date'], name='daily_milk__route_i_2703c8_idx'),
+        ),
+        migrations.AddField(
+            model_name='usersubscription',
+            name='route',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subscriptions', to='milk_app.deliveryroute'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='deliveryroute',
+            unique_together={('zone', 'name')},
+        ),
+    ]
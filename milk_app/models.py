@@ -1,7 +1,9 @@
 # milk_app/models.py
 import uuid
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
 
 class User(models.Model):
     ROLE_CHOICES = [
@@ -14,6 +16,10 @@ class User(models.Model):
     full_name = models.CharField(max_length=255)
     timezone = models.CharField(max_length=50, default='Asia/Kolkata')
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='customer')
+    address = models.TextField(blank=True, max_length=500)
+    # Optional delivery coordinates, used to sequence route stops (milk_app/routing.py)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -52,27 +58,82 @@ class DailyMilkRequest(models.Model):
 
 
 
+class DeliveryZone(models.Model):
+    """Area of the city served together; blackouts can be scoped to a zone"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        db_table = 'delivery_zones'
+
+
+class DeliveryRoute(models.Model):
+    """One driver's run within a zone; schedules are generated and served per route"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    zone = models.ForeignKey(DeliveryZone, on_delete=models.PROTECT, related_name='routes')
+    name = models.CharField(max_length=100)
+    # Where the driver loads up; stop sequences start here when set
+    depot_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    depot_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.zone.name} / {self.name}"
+    
+    class Meta:
+        unique_together = ['zone', 'name']
+        db_table = 'delivery_routes'
+
+
 class UserSubscription(models.Model):
     """Main subscription record - tracks overall subscription status"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='subscription')
     is_active = models.BooleanField(default=True)
+    milk_type = models.CharField(max_length=10, choices=DailyMilkRequest.MILK_TYPE_CHOICES, default='buffalo')
+    route = models.ForeignKey(
+        DeliveryRoute, on_delete=models.SET_NULL, null=True, blank=True, related_name='subscriptions'
+    )  # null = not assigned to a route yet
     subscription_start_date = models.DateField()
     subscription_end_date = models.DateField(null=True, blank=True)  # null = ongoing
+    # Denormalized rate covering today, maintained by refresh_current_rate() on rate writes
+    # and by the nightly rollover_subscription_rates command
+    current_rate = models.ForeignKey(
+        'SubscriptionRate', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    current_daily_liters = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.user.full_name} - Subscription"
     
-    @property
-    def current_rate(self):
-        """Get current active rate"""
-        current_rate = self.subscription_rates.filter(
-            is_active=True,
-            effective_from__lte=timezone.now().date()
-        ).order_by('-effective_from').first()
-        return current_rate
+    def rates_covering(self, on_date):
+        """Rate versions whose effective window contains on_date, newest first"""
+        return self.subscription_rates.filter(
+            effective_from__lte=on_date,
+        ).filter(
+            models.Q(effective_to__isnull=True) | models.Q(effective_to__gte=on_date)
+        ).order_by('-effective_from')
+    
+    def rate_for(self, on_date):
+        """Rate applicable on a date; served from current_rate without a query when it covers the date"""
+        rate = self.current_rate
+        if rate and rate.effective_from <= on_date and (rate.effective_to is None or rate.effective_to >= on_date):
+            return rate
+        return self.rates_covering(on_date).first()
+    
+    def refresh_current_rate(self, on_date=None):
+        """Point current_rate/current_daily_liters at the rate covering on_date (default today)"""
+        rate = self.rates_covering(on_date or timezone.now().date()).first()
+        self.current_rate = rate
+        self.current_daily_liters = rate.daily_liters if rate else None
+        self.save(update_fields=['current_rate', 'current_daily_liters', 'updated_at'])
+        return rate
     
     class Meta:
         db_table = 'user_subscriptions'
@@ -84,8 +145,9 @@ class SubscriptionRate(models.Model):
     daily_liters = models.DecimalField(max_digits=5, decimal_places=2)
     effective_from = models.DateField()
     effective_to = models.DateField(null=True, blank=True)  # null = current rate
-    is_active = models.BooleanField(default=True)
+    is_active = models.BooleanField(default=True)  # False for pending (future) and expired versions
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.subscription.user.full_name} - {self.daily_liters}L from {self.effective_from}"
@@ -94,6 +156,10 @@ class SubscriptionRate(models.Model):
         db_table = 'subscription_rates'
         unique_together = ['subscription', 'effective_from']
         ordering = ['-effective_from']
+        indexes = [
+            # Active-rate lookups: is_active is True only for the version covering today
+            models.Index(fields=['subscription', 'is_active']),
+        ]
 
 
 class DailySkipRequest(models.Model):
@@ -119,6 +185,55 @@ class DailySkipRequest(models.Model):
         db_table = 'daily_skip_requests'
 
 
+class BlackoutDate(models.Model):
+    """Day the dairy does not deliver (festival, closure), for everyone or one milk type and/or zone"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField(db_index=True)
+    milk_type = models.CharField(
+        max_length=10, choices=DailyMilkRequest.MILK_TYPE_CHOICES, null=True, blank=True
+    )  # null = all milk types
+    zone = models.ForeignKey(
+        DeliveryZone, on_delete=models.CASCADE, null=True, blank=True, related_name='blackouts'
+    )  # null = all zones
+    reason = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Blackout {self.date} ({self.milk_type or 'all'})"
+    
+    class Meta:
+        db_table = 'blackout_dates'
+
+
+class SkipRule(models.Model):
+    """Recurring skip ("every Sunday", "every other day"), expanded lazily by milk_app/skip_rules.py"""
+    WEEKDAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='skip_rules')
+    weekday_mask = models.PositiveSmallIntegerField(default=0)  # bit 0 = Monday ... bit 6 = Sunday; 0 = any day
+    interval_days = models.PositiveSmallIntegerField(default=1)  # every Nth day counted from start_date
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)  # null = ongoing
+    reason = models.CharField(max_length=20, choices=DailySkipRequest.REASON_CHOICES, default='other')
+    notes = models.TextField(blank=True, max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.full_name} - Skip rule from {self.start_date}"
+    
+    @property
+    def weekdays(self):
+        return [name for bit, name in enumerate(self.WEEKDAY_NAMES) if self.weekday_mask >> bit & 1]
+    
+    class Meta:
+        db_table = 'skip_rules'
+        indexes = [
+            models.Index(fields=['start_date', 'end_date']),
+        ]
+
+
 class DailyMilkDelivery(models.Model):
     """Auto-generated delivery records for tracking and billing"""
     STATUS_CHOICES = [
@@ -134,10 +249,133 @@ class DailyMilkDelivery(models.Model):
     scheduled_liters = models.DecimalField(max_digits=5, decimal_places=2)
     actual_liters = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     rate_applied = models.ForeignKey(SubscriptionRate, on_delete=models.PROTECT, null=True, blank=True)
+    # Route the delivery was scheduled on; set by generate_route_schedules
+    route = models.ForeignKey(
+        DeliveryRoute, on_delete=models.SET_NULL, null=True, blank=True, related_name='deliveries', db_index=False
+    )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['user', 'delivery_date']
-        db_table = 'daily_milk_deliveries'
\ No newline at end of file
+        db_table = 'daily_milk_deliveries'
+        indexes = [
+            # Per-route schedules for a date
+            models.Index(fields=['route', 'delivery_date']),
+        ]
+
+
+class ArchivedDelivery(models.Model):
+    """
+    Deliveries moved out of daily_milk_deliveries by manage_delivery_partitions
+    on databases without table partitioning (SQLite). References are kept as
+    plain ids so archived rows never block deleting users or rates.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    user_id = models.UUIDField(db_index=True)
+    delivery_date = models.DateField(db_index=True)
+    scheduled_liters = models.DecimalField(max_digits=5, decimal_places=2)
+    actual_liters = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    rate_applied_id = models.UUIDField(null=True, blank=True)
+    route_id = models.UUIDField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=DailyMilkDelivery.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'daily_milk_deliveries_archive'
+
+
+class Job(models.Model):
+    """Background job queued by admins and executed by the run_jobs worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class RevokedToken(models.Model):
+    """Consumed refresh-token IDs and revoked token families, kept until the tokens expire"""
+    KIND_CHOICES = [
+        ('jti', 'Token ID'),
+        ('family', 'Token Family'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    token_id = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='revoked_tokens')
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.token_id}"
+
+    class Meta:
+        db_table = 'revoked_tokens'
+        unique_together = ['kind', 'token_id']
+
+
+class IdempotencyKey(models.Model):
+    """First response to a request carrying an Idempotency-Key, replayed to its retries"""
+    id = models.BigAutoField(primary_key=True)
+    key = models.CharField(max_length=32, unique=True)  # digest of user, view and client key
+    fingerprint = models.CharField(max_length=32)  # digest of method, path and body
+    in_flight = models.BooleanField(default=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({'in flight' if self.in_flight else self.status_code})"
+
+    class Meta:
+        db_table = 'idempotency_keys'
+
+
+class SyncTombstone(models.Model):
+    """Records deletions so delta-sync clients can drop rows they already hold"""
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_tombstones')
+    model = models.CharField(max_length=50)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted"
+
+    class Meta:
+        db_table = 'sync_tombstones'
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
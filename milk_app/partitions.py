@@ -0,0 +1,183 @@
+# milk_app/partitions.py
+"""
+Monthly partitions and archival for daily_milk_deliveries.
+
+On PostgreSQL the table is range-partitioned by delivery_date (migration
+0007): one partition per month, named daily_milk_deliveries_yYYYYmMM, plus a
+default partition catching dates no monthly partition covers. Queries that
+filter on delivery_date (billing, calendars, schedules) only scan the months
+they touch. Old months are archived by copying the partition to a gzipped
+CSV, detaching it and dropping it.
+
+Other databases have no partitions; archival there moves old rows into
+ArchivedDelivery (daily_milk_deliveries_archive) in batches instead.
+"""
+import csv
+import gzip
+import os
+import re
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedDelivery, DailyMilkDelivery
+
+TABLE = DailyMilkDelivery._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_FIELDS = [
+    'id', 'user_id', 'delivery_date', 'scheduled_liters', 'actual_liters',
+    'rate_applied_id', 'route_id', 'status', 'created_at', 'updated_at',
+]
+
+_BOUND = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)', [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """[(name, first_day, end_day)] of monthly partitions in date order; end_day is exclusive"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits i '
+            'JOIN pg_class parent ON parent.oid = i.inhparent JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)', [TABLE]
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND.search(bound)
+        if match:
+            partitions.append((name, date.fromisoformat(match[1]), date.fromisoformat(match[2])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(month):
+    """
+    Create the partition for a month. Rows for that month already sitting in
+    the default partition are moved into it, since PostgreSQL refuses to add a
+    partition whose range the default partition holds rows for.
+    """
+    first_day, end_day = month, add_months(month, 1)
+    name = partition_name(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE delivery_date >= %s AND delivery_date < %s)',
+            [first_day, end_day]
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)', [first_day, end_day]
+            )
+            return
+
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)', [first_day, end_day])
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE delivery_date >= %s AND delivery_date < %s '
+            f'RETURNING *) INSERT INTO {name} SELECT * FROM moved', [first_day, end_day]
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+
+
+def ensure_partitions(months_ahead, today=None):
+    """
+    Create missing monthly partitions from the current month to months_ahead
+    past it, and for any month with rows stranded in the default partition
+    (back-dated or far-future deliveries); returns the names created.
+    """
+    existing = {partition[1] for partition in list_partitions()}
+    current = month_start(today or timezone.now().date())
+    months = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', delivery_date)::date FROM {DEFAULT_PARTITION}")
+        months.update(row[0] for row in cursor.fetchall())
+
+    created = []
+    for month in sorted(months - existing):
+        create_partition(month)
+        created.append(partition_name(month))
+    return created
+
+
+def _archive_path(archive_dir, name):
+    os.makedirs(archive_dir, exist_ok=True)
+    return os.path.join(archive_dir, f'{name}.csv.gz')
+
+
+def archive_partition(name, archive_dir, keep_detached=False):
+    """Copy a partition to <archive_dir>/<name>.csv.gz, detach it and (unless keep_detached) drop it"""
+    path = _archive_path(archive_dir, name)
+    with transaction.atomic(), connection.cursor() as cursor:
+        with gzip.open(path, 'wb') as archive:
+            cursor.cursor.copy_expert(
+                f"COPY (SELECT {', '.join(ARCHIVE_FIELDS)} FROM {name} ORDER BY delivery_date) "
+                f"TO STDOUT WITH (FORMAT csv, HEADER)", archive
+            )
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if not keep_detached:
+            cursor.execute(f'DROP TABLE {name}')
+    return path
+
+
+def archive_partitions_before(cutoff, archive_dir, keep_detached=False):
+    """Archive every monthly partition that ends on or before cutoff; returns [(name, path)]"""
+    return [
+        (name, archive_partition(name, archive_dir, keep_detached))
+        for name, _, end_day in list_partitions() if end_day <= cutoff
+    ]
+
+
+def archive_rows_before(cutoff):
+    """
+    Move deliveries dated before cutoff into ArchivedDelivery, a batch per
+    transaction; for databases without partitions. Returns rows moved.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                DailyMilkDelivery.objects.filter(delivery_date__lt=cutoff)
+                .order_by('delivery_date').values(*ARCHIVE_FIELDS)[:ARCHIVE_BATCH_SIZE]
+            )
+            if not rows:
+                return moved
+            ArchivedDelivery.objects.bulk_create(
+                [ArchivedDelivery(**row) for row in rows], ignore_conflicts=True
+            )
+            DailyMilkDelivery.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+
+
+def export_archived(archive_dir, name='daily_milk_deliveries_archive'):
+    """Write the archive table to <archive_dir>/<name>.csv.gz; returns the path"""
+    path = _archive_path(archive_dir, name)
+    with gzip.open(path, 'wt', newline='') as archive:
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_FIELDS)
+        rows = ArchivedDelivery.objects.order_by('delivery_date').values_list(*ARCHIVE_FIELDS)
+        writer.writerows(rows.iterator(chunk_size=ARCHIVE_BATCH_SIZE))
+    return path
@@ -0,0 +1,91 @@
+# milk_app/rates.py
+"""
+Bookkeeping for versioned subscription rates.
+
+A subscription's rates form a timeline of non-overlapping
+[effective_from, effective_to] windows. Exactly the version covering today
+has is_active=True; future (pending) and past (expired) versions are
+inactive, so "the active rate" is an indexed equality lookup. Rate changes
+are inserted into the timeline by schedule_rate_change(), and the nightly
+rollover_subscription_rates command flips every version that became due or
+expired in a single UPDATE, then repoints the denormalized
+UserSubscription.current_rate / current_daily_liters.
+"""
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from .models import SubscriptionRate, UserSubscription
+
+
+def _covers(on_date):
+    return Q(effective_from__lte=on_date) & (Q(effective_to__isnull=True) | Q(effective_to__gte=on_date))
+
+
+def schedule_rate_change(subscription, daily_liters, effective_from):
+    """
+    Insert a rate version starting at effective_from. The version before it
+    is cut off the day before; if later versions are already scheduled, the
+    new one ends the day before the next of them. Call inside a transaction.
+    """
+    today = timezone.now().date()
+    versions = subscription.subscription_rates.select_for_update()
+    previous = versions.filter(effective_from__lt=effective_from).order_by('-effective_from').first()
+    following = versions.filter(effective_from__gt=effective_from).order_by('effective_from').first()
+
+    if previous and (previous.effective_to is None or previous.effective_to >= effective_from):
+        previous.effective_to = effective_from - timezone.timedelta(days=1)
+        # Stays active until the new rate takes over when the change is in the future
+        previous.is_active = previous.effective_from <= today <= previous.effective_to
+        previous.save(update_fields=['effective_to', 'is_active', 'updated_at'])
+
+    new_rate = SubscriptionRate.objects.create(
+        subscription=subscription,
+        daily_liters=daily_liters,
+        effective_from=effective_from,
+        effective_to=following.effective_from - timezone.timedelta(days=1) if following else None,
+        is_active=effective_from <= today,
+    )
+    subscription.refresh_current_rate(today)
+    return new_rate
+
+
+def activate_due_rates(on_date=None):
+    """Activate versions that took effect and deactivate expired ones in one UPDATE; returns rows changed"""
+    covers = _covers(on_date or timezone.now().date())
+    return SubscriptionRate.objects.filter(
+        (Q(is_active=False) & covers) | (Q(is_active=True) & ~covers)
+    ).update(
+        is_active=Case(When(covers, then=Value(True)), default=Value(False)),
+        updated_at=timezone.now(),
+    )
+
+
+def sync_current_rates():
+    """Repoint every subscription whose current_rate is not its active version; returns rows updated"""
+    active = SubscriptionRate.objects.filter(
+        subscription=OuterRef('pk'),
+        is_active=True,
+    ).order_by('-effective_from')
+
+    stale = UserSubscription.objects.annotate(
+        active_rate=Subquery(active.values('id')[:1])
+    ).filter(
+        ~Q(current_rate=F('active_rate'))
+        | Q(current_rate__isnull=True, active_rate__isnull=False)
+        | Q(current_rate__isnull=False, active_rate__isnull=True)
+    )
+
+    return UserSubscription.objects.filter(pk__in=stale.values('pk')).update(
+        current_rate=Subquery(active.values('id')[:1]),
+        current_daily_liters=Subquery(active.values('daily_liters')[:1]),
+        updated_at=timezone.now(),
+    )
+
+
+def rollover(on_date=None):
+    """Nightly transition: returns (rate versions flipped, subscriptions repointed)"""
+    with transaction.atomic():
+        flipped = activate_due_rates(on_date)
+        repointed = sync_current_rates()
+    return flipped, repointed
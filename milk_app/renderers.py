@@ -0,0 +1,66 @@
+# milk_app/renderers.py
+"""
+JSON rendering for API responses.
+
+FastJSONRenderer is a drop-in JSONRenderer that serializes through orjson
+when it is installed (``pip install orjson``). orjson handles dicts, lists,
+strings, UUIDs and dates natively in C; only Decimals and the odd lazy
+string or queryset go back to Python, through DRF's own encoder so they come
+out exactly as before. Output matches JSONRenderer's (compact separators,
+UTF-8, ``Z`` for UTC datetimes, Decimals as numbers, \\u2028/\\u2029
+escaped) with two differences:
+
+* floats use orjson's shortest spelling, which varies by orjson version
+  (``1e16`` or ``1e+16``, ``0.00001`` for ``1e-05``); the values parse the
+  same but the bytes can differ.
+* NaN and Infinity render as ``null``, where JSONRenderer's STRICT_JSON
+  raises ValueError.
+
+Requests for indented output, payloads orjson rejects (integers beyond 64
+bits) and installs without orjson are rendered by JSONRenderer.
+"""
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+orjson = None
+_encoder = JSONEncoder()
+
+
+def load_orjson():
+    """Import orjson on first use; returns None when it is not installed"""
+    global orjson
+    if orjson is None:
+        try:
+            import orjson as module
+        except ImportError:  # optional dependency
+            return None
+        orjson = module
+    return orjson
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if load_orjson() is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same strict-javascript-subset escaping as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
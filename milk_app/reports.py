@@ -0,0 +1,257 @@
+# milk_app/reports.py
+"""
+Schedule and billing computations shared by the admin views and background jobs.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import billing_engine, blackouts, calendars, skip_index, skip_rules
+from .models import DailyMilkDelivery, DailyMilkRequest, SubscriptionRate, UserSubscription
+from .serializers import DailyMilkDeliverySerializer
+
+# How a confirmed DailyMilkRequest combines with the same user's subscription delivery
+DEMAND_ADHOC_RULES = ('add', 'override')
+
+
+def build_delivery_schedule(delivery_date, route_id=None, unrouted=False):
+    """Get delivery schedule for a specific date with correct rates
+
+    Limited to one route with route_id, or to subscriptions without a route
+    with unrouted=True; see routes.generate_route_schedule.
+    """
+    # Get all active subscriptions, minus milk types/zones blacked out on this date
+    closed = blackouts.closures(delivery_date)
+    active_subscriptions = UserSubscription.objects.filter(
+        is_active=True,
+        subscription_start_date__lte=delivery_date,
+    ).filter(
+        Q(subscription_end_date__isnull=True) | Q(subscription_end_date__gte=delivery_date)
+    )
+    if route_id:
+        active_subscriptions = active_subscriptions.filter(route_id=route_id)
+    elif unrouted:
+        active_subscriptions = active_subscriptions.filter(route__isnull=True)
+    active_subscriptions = blackouts.exclude_closed(active_subscriptions, closed).select_related('user', 'current_rate')
+
+    # Users who skipped this date: explicit skips from the cached skip index, plus recurring rules
+    skip_requests = skip_index.skipped_users(delivery_date) | skip_rules.users_skipping(delivery_date)
+
+    # Build delivery schedule with correct rates
+    deliveries = []
+    total_liters = 0
+
+    for subscription in active_subscriptions:
+        if subscription.user.id not in skip_requests:
+            # Get the rate applicable for this date (denormalized current rate in the common case)
+            applicable_rate = subscription.rate_for(delivery_date)
+
+            if applicable_rate:
+                deliveries.append({
+                    'user_id': subscription.user.id,
+                    'user_name': subscription.user.full_name,
+                    'user_phone': subscription.user.phone_number,
+                    'scheduled_liters': applicable_rate.daily_liters,
+                    'rate_id': applicable_rate.id,
+                    'route_id': subscription.route_id,
+                    'status': 'scheduled'
+                })
+                total_liters += applicable_rate.daily_liters
+
+    return {
+        'date': delivery_date,
+        'blackouts': closed,
+        'total_deliveries': len(deliveries),
+        'total_liters': total_liters,
+        'deliveries': deliveries
+    }
+
+
+def build_demand(delivery_date, adhoc_rule=None):
+    """
+    Total demand for a date: subscription deliveries merged with confirmed
+    ad-hoc DailyMilkRequests, per user and per milk type.
+
+    With adhoc_rule 'add' an ad-hoc request comes on top of the user's
+    subscription liters; with 'override' it replaces them for that day.
+    Skips and skip rules only drop the subscription part; blackouts drop
+    both. The query count does not depend on the number of users.
+    """
+    adhoc_rule = adhoc_rule or settings.DEMAND_ADHOC_RULE
+    closed = blackouts.closures(delivery_date)
+    skipped = skip_index.skipped_users(delivery_date) | skip_rules.users_skipping(delivery_date)
+
+    # Newest rate covering the date for every active subscription, in one query
+    rates = SubscriptionRate.objects.filter(
+        effective_from__lte=delivery_date,
+        subscription__is_active=True,
+        subscription__subscription_start_date__lte=delivery_date,
+    ).filter(
+        Q(effective_to__isnull=True) | Q(effective_to__gte=delivery_date),
+        Q(subscription__subscription_end_date__isnull=True) | Q(subscription__subscription_end_date__gte=delivery_date)
+    )
+    rates = blackouts.exclude_closed(
+        rates, closed, 'subscription__milk_type', 'subscription__route__zone_id'
+    ).order_by('effective_from').values_list(
+        'subscription__user_id', 'subscription__user__full_name', 'subscription__milk_type', 'daily_liters'
+    )
+    lines = {}
+    for user_id, user_name, milk_type, daily_liters in rates:
+        if user_id not in skipped:
+            # Later effective_from wins, like UserSubscription.rates_covering()
+            lines[user_id] = {'user_id': user_id, 'user_name': user_name, 'subscription': (milk_type, daily_liters), 'adhoc': None}
+
+    adhoc_requests = DailyMilkRequest.objects.filter(
+        target_date=delivery_date,
+        status='confirmed'
+    )
+    adhoc_requests = blackouts.exclude_closed(
+        adhoc_requests, closed, 'milk_type', 'user__subscription__route__zone_id'
+    ).values_list('user_id', 'user__full_name', 'milk_type', 'liters')
+    for user_id, user_name, milk_type, liters in adhoc_requests:
+        line = lines.setdefault(user_id, {'user_id': user_id, 'user_name': user_name, 'subscription': None, 'adhoc': None})
+        line['adhoc'] = (milk_type, liters)
+        if adhoc_rule == 'override':
+            line['subscription'] = None
+
+    totals = {}
+    users = []
+    for line in lines.values():
+        user_liters = Decimal('0')
+        user_milk_types = set()
+        for source in ('subscription', 'adhoc'):
+            if line[source]:
+                milk_type, liters = line[source]
+                total = totals.setdefault(milk_type, {
+                    'subscription_liters': Decimal('0'), 'adhoc_liters': Decimal('0'), 'total_liters': Decimal('0'), 'users': 0
+                })
+                total[f'{source}_liters'] += liters
+                total['total_liters'] += liters
+                if milk_type not in user_milk_types:
+                    total['users'] += 1
+                    user_milk_types.add(milk_type)
+                user_liters += liters
+        users.append({
+            'user_id': line['user_id'],
+            'user_name': line['user_name'],
+            'subscription': dict(zip(['milk_type', 'liters'], line['subscription'])) if line['subscription'] else None,
+            'adhoc': dict(zip(['milk_type', 'liters'], line['adhoc'])) if line['adhoc'] else None,
+            'total_liters': user_liters
+        })
+
+    return {
+        'date': delivery_date,
+        'adhoc_rule': adhoc_rule,
+        'blackouts': closed,
+        'total_liters': sum((total['total_liters'] for total in totals.values()), Decimal('0')),
+        'by_milk_type': totals,
+        'users': users
+    }
+
+
+def build_billing_report(user, subscription, start_date, end_date, include_deliveries=True):
+    """Generate billing report for a user in a date range"""
+    if billing_engine.is_enabled():
+        report = billing_engine.build_billing_reports(
+            UserSubscription.objects.filter(id=subscription.id), start_date, end_date
+        )[0]
+        if include_deliveries:
+            deliveries = DailyMilkDelivery.objects.filter(
+                user=user,
+                delivery_date__range=[start_date, end_date],
+                status='delivered'
+            ).order_by('delivery_date')
+            report['deliveries'] = DailyMilkDeliverySerializer(deliveries, many=True).data
+        return report
+
+    # Get all rates active in the period
+    rates_in_period = SubscriptionRate.objects.filter(
+        subscription=subscription,
+        effective_from__lte=end_date,
+    ).filter(
+        Q(effective_to__isnull=True) | Q(effective_to__gte=start_date)
+    ).order_by('effective_from')
+
+    # Get actual deliveries
+    deliveries = DailyMilkDelivery.objects.filter(
+        user=user,
+        delivery_date__range=[start_date, end_date],
+        status='delivered'
+    ).select_related('rate_applied').order_by('delivery_date')
+
+    # Skip and blackout days per rate period come from the cached calendar bitsets
+    calendar = calendars.get_calendar(user.id, start_date, end_date)
+
+    # Build billing breakdown
+    billing_breakdown = []
+    total_delivered_liters = 0
+    total_delivered_days = 0
+
+    for rate in rates_in_period:
+        rate_start = max(rate.effective_from, start_date)
+        rate_end = min(rate.effective_to or end_date, end_date)
+
+        # ✅ Filter on queryset (not serialized list)
+        rate_deliveries = deliveries.filter(
+            delivery_date__range=[rate_start, rate_end],
+            rate_applied=rate
+        )
+
+        delivered_days = rate_deliveries.count()
+        delivered_liters = sum(float(d.actual_liters or d.scheduled_liters) for d in rate_deliveries)
+
+        total_days_in_range = (rate_end - rate_start).days + 1
+        skip_days = calendar.count(calendar.skipped | calendar.closed, rate_start, rate_end)
+
+        expected_delivery_days = total_days_in_range - skip_days
+
+        billing_breakdown.append({
+            'rate_id': str(rate.id),
+            'daily_liters': str(rate.daily_liters),
+            'effective_from': rate.effective_from,
+            'effective_to': rate.effective_to,
+            'period_start': rate_start,
+            'period_end': rate_end,
+            'expected_delivery_days': expected_delivery_days,
+            'actual_delivery_days': delivered_days,
+            'delivered_liters': delivered_liters,
+            'delivery_success_rate': f"{(delivered_days/expected_delivery_days*100):.1f}%" if expected_delivery_days > 0 else "0%"
+        })
+
+        total_delivered_liters += delivered_liters
+        total_delivered_days += delivered_days
+
+    report = {
+        'user': {
+            'id': str(user.id),
+            'name': user.full_name,
+            'phone': user.phone_number
+        },
+        'billing_period': {
+            'start_date': start_date,
+            'end_date': end_date
+        },
+        'summary': {
+            'total_delivered_days': total_delivered_days,
+            'total_delivered_liters': total_delivered_liters
+        },
+        'rate_breakdown': billing_breakdown,
+    }
+
+    if include_deliveries:
+        # ✅ Serialize only once at the end
+        report['deliveries'] = DailyMilkDeliverySerializer(deliveries, many=True).data
+
+    return report
+
+
+def build_billing_reports(subscriptions, start_date, end_date):
+    """Billing reports without delivery lists for a queryset of subscriptions"""
+    if billing_engine.is_enabled():
+        return billing_engine.build_billing_reports(subscriptions, start_date, end_date)
+
+    return [
+        build_billing_report(subscription.user, subscription, start_date, end_date, include_deliveries=False)
+        for subscription in subscriptions.select_related('user')
+    ]
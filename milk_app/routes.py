@@ -0,0 +1,154 @@
+# milk_app/routes.py
+"""
+Per-route delivery schedules.
+
+Subscriptions belong to a DeliveryRoute (or to none yet). A route's schedule
+for a date is materialized as DailyMilkDelivery rows tagged with the route,
+so drivers fetch only their own stops through the (route, delivery_date)
+index. Routes are independent of each other, which lets the
+``generate_route_schedules`` command compute them in parallel processes.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import driver_package, routing
+from .models import DailyMilkDelivery, SyncTombstone, User
+from .reports import build_delivery_schedule
+
+
+def generate_route_schedule(route_id, delivery_date):
+    """
+    Write the 'scheduled' deliveries of one route (None = subscriptions
+    without a route) for a date. Rows already delivered or failed are left
+    alone; scheduled rows of users no longer due (skipped since, moved to
+    another route) are removed, with a SyncTombstone so delta-sync clients
+    drop them too. Returns the number of scheduled stops.
+    """
+    schedule = build_delivery_schedule(delivery_date, route_id=route_id, unrouted=route_id is None)
+    entries = {entry['user_id']: entry for entry in schedule['deliveries']}
+
+    with transaction.atomic():
+        # Lock this route's stops and rows in one ordered query, so a route generated in
+        # parallel cannot delete a row being moved onto this route (or deadlock with us)
+        rows = DailyMilkDelivery.objects.select_for_update().filter(
+            Q(user_id__in=list(entries)) | Q(route_id=route_id, status='scheduled'),
+            delivery_date=delivery_date,
+        ).order_by('user_id')
+        existing = {}
+        stale = []
+        for delivery in rows:
+            if delivery.user_id in entries:
+                existing[delivery.user_id] = delivery
+            elif delivery.route_id == route_id and delivery.status == 'scheduled':
+                stale.append(delivery)
+        now = timezone.now()
+        to_update = []
+        to_create = []
+        for user_id, entry in entries.items():
+            delivery = existing.get(user_id)
+            if delivery is None:
+                to_create.append(DailyMilkDelivery(
+                    user_id=user_id,
+                    delivery_date=delivery_date,
+                    scheduled_liters=entry['scheduled_liters'],
+                    rate_applied_id=entry['rate_id'],
+                    route_id=route_id,
+                    status='scheduled'
+                ))
+            elif delivery.status == 'scheduled':
+                delivery.scheduled_liters = entry['scheduled_liters']
+                delivery.rate_applied_id = entry['rate_id']
+                delivery.route_id = route_id
+                delivery.updated_at = now
+                to_update.append(delivery)
+
+        DailyMilkDelivery.objects.bulk_create(to_create)
+        DailyMilkDelivery.objects.bulk_update(to_update, ['scheduled_liters', 'rate_applied', 'route', 'updated_at'])
+        if stale:
+            DailyMilkDelivery.objects.filter(id__in=[delivery.id for delivery in stale]).delete()
+            SyncTombstone.objects.bulk_create([
+                SyncTombstone(user_id=delivery.user_id, model='delivery', object_id=delivery.id) for delivery in stale
+            ])
+    return len(entries)
+
+
+def route_schedule(route, delivery_date):
+    """
+    Schedule of one route: the generated rows when generate_route_schedules
+    has run for the date, otherwise computed on the fly for the route alone.
+    """
+    deliveries = DailyMilkDelivery.objects.filter(
+        route=route, delivery_date=delivery_date
+    ).select_related('user').order_by('user__full_name')
+    stops = [{
+        'user_id': delivery.user_id,
+        'user_name': delivery.user.full_name,
+        'user_phone': delivery.user.phone_number,
+        'scheduled_liters': delivery.scheduled_liters,
+        'rate_id': delivery.rate_applied_id,
+        'route_id': delivery.route_id,
+        'status': delivery.status
+    } for delivery in deliveries]
+
+    if stops:
+        schedule = {
+            'date': delivery_date,
+            'total_deliveries': len(stops),
+            'total_liters': sum(stop['scheduled_liters'] for stop in stops),
+            'deliveries': stops,
+            'source': 'generated'
+        }
+    else:
+        schedule = build_delivery_schedule(delivery_date, route_id=route.id)
+        schedule['source'] = 'live'
+    schedule['route'] = {'id': route.id, 'name': route.name, 'zone': route.zone.name}
+    return schedule
+
+
+def route_sequence(route, delivery_date):
+    """
+    Stops of a route for a date in driving order. The stop set is always the
+    live schedule, so skips and new subscribers since generation are
+    reflected; the ordering itself is cached by routing.sequence_stops.
+    """
+    schedule = build_delivery_schedule(delivery_date, route_id=route.id)
+    coordinates = {
+        user_id: (address, latitude, longitude)
+        for user_id, address, latitude, longitude in User.objects.filter(
+            id__in=[entry['user_id'] for entry in schedule['deliveries']]
+        ).values_list('id', 'address', 'latitude', 'longitude')
+    }
+    stops = []
+    for entry in schedule['deliveries']:
+        address, latitude, longitude = coordinates[entry['user_id']]
+        stops.append(dict(entry, address=address, latitude=latitude, longitude=longitude))
+
+    depot = None
+    if route.depot_latitude is not None and route.depot_longitude is not None:
+        depot = (float(route.depot_latitude), float(route.depot_longitude))
+    ordered, total_km, cached = routing.sequence_stops(route.id, stops, depot)
+    return {
+        'date': delivery_date,
+        'route': {'id': route.id, 'name': route.name, 'zone': route.zone.name},
+        'total_deliveries': len(ordered),
+        'total_liters': schedule['total_liters'],
+        'total_km': total_km,
+        'cached': cached,
+        'stops': ordered
+    }
+
+
+def route_package(route, delivery_date):
+    """
+    Offline driver package (driver_package.encode_package) of a route for a
+    date: the route_sequence stops, each carrying the status already
+    recorded for it, so a refreshed package shows what has been synced.
+    """
+    stops = route_sequence(route, delivery_date)['stops']
+    recorded = dict(DailyMilkDelivery.objects.filter(
+        user_id__in=[stop['user_id'] for stop in stops], delivery_date=delivery_date
+    ).values_list('user_id', 'status'))
+    return driver_package.encode_package(route, delivery_date, [
+        dict(stop, status=recorded.get(stop['user_id'], stop['status'])) for stop in stops
+    ])
@@ -0,0 +1,139 @@
+# milk_app/routing.py
+"""
+Stop sequencing for delivery routes.
+
+A route's stops are ordered by a nearest-neighbour tour from the route's
+depot (or the first stop when the route has none), improved with 2-opt
+until no segment reversal shortens it. Tours are open: the driver does not
+return to the depot. Distances are great-circle kilometres, computed once
+per sequencing into a matrix.
+
+Results are cached per route under a digest of the stop set (user ids and
+coordinates), so a sequence is reused until a skip, a new subscriber or a
+moved address changes that route's stops; other routes are unaffected.
+Stops without coordinates cannot be placed and are appended at the end.
+"""
+import hashlib
+import math
+
+from django.core.cache import cache
+
+EARTH_RADIUS_KM = 6371.0
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def distance_matrix(points):
+    """Haversine distances in km between every pair of (lat, lng) points"""
+    radians = [(math.radians(lat), math.radians(lng)) for lat, lng in points]
+    cosines = [math.cos(lat) for lat, _ in radians]
+    size = len(points)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        lat_i, lng_i = radians[i]
+        row = matrix[i]
+        for j in range(i + 1, size):
+            lat_j, lng_j = radians[j]
+            a = math.sin((lat_j - lat_i) / 2) ** 2 + cosines[i] * cosines[j] * math.sin((lng_j - lng_i) / 2) ** 2
+            row[j] = matrix[j][i] = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+    return matrix
+
+
+def nearest_neighbour(matrix, start=0):
+    """Open tour visiting every node, always moving to the closest unvisited one"""
+    unvisited = set(range(len(matrix))) - {start}
+    tour = [start]
+    while unvisited:
+        row = matrix[tour[-1]]
+        following = min(unvisited, key=row.__getitem__)
+        unvisited.remove(following)
+        tour.append(following)
+    return tour
+
+
+def two_opt(matrix, tour):
+    """
+    Improve an open tour in place by reversing segments while that shortens
+    it. tour[0] stays first (the depot). Reversing tour[i:j + 1] replaces
+    edges (i-1, i) and (j, j+1) with (i-1, j) and (i, j+1); for the last
+    node there is no (j, j+1) edge.
+    """
+    size = len(tour)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, size - 1):
+            before = tour[i - 1]
+            first = tour[i]
+            row_before = matrix[before]
+            row_first = matrix[first]
+            removed_head = row_before[first]
+            for j in range(i + 1, size):
+                last = tour[j]
+                if j + 1 < size:
+                    after = tour[j + 1]
+                    delta = row_before[last] + row_first[after] - removed_head - matrix[last][after]
+                else:
+                    delta = row_before[last] - removed_head
+                if delta < -1e-9:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+                    first = tour[i]
+                    row_first = matrix[first]
+                    removed_head = row_before[first]
+    return tour
+
+
+def tour_length(matrix, tour):
+    return sum(matrix[a][b] for a, b in zip(tour, tour[1:]))
+
+
+def sequence(points, depot=None):
+    """(order of point indexes, legs in km) for an open route starting at depot or at points[0]"""
+    if not points:
+        return [], []
+    nodes = [depot] + list(points) if depot else list(points)
+    matrix = distance_matrix(nodes)
+    tour = two_opt(matrix, nearest_neighbour(matrix))
+    legs = [matrix[a][b] for a, b in zip(tour, tour[1:])]
+    if depot:
+        return [node - 1 for node in tour[1:]], legs
+    return tour, [0.0] + legs
+
+
+def stops_digest(route_id, stops, depot):
+    """Identity of a route's stop set: ids and coordinates, independent of order"""
+    parts = sorted(f"{stop['user_id']}:{stop['latitude']}:{stop['longitude']}" for stop in stops)
+    payload = f'{route_id}|{depot}|' + '|'.join(parts)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def sequence_stops(route_id, stops, depot=None):
+    """
+    Order stop dicts (user_id, latitude, longitude, ...) for a route; each
+    returned stop gets 'sequence' and 'leg_km'. Returns (stops, total_km,
+    cached).
+    """
+    key = f'route_sequence:{route_id}:{stops_digest(route_id, stops, depot)}'
+    located = [stop for stop in stops if stop['latitude'] is not None and stop['longitude'] is not None]
+    unlocated = sorted(
+        (stop for stop in stops if stop['latitude'] is None or stop['longitude'] is None),
+        key=lambda stop: stop.get('user_name') or ''
+    )
+
+    cached = cache.get(key)
+    if cached is None:
+        order, legs = sequence([(float(stop['latitude']), float(stop['longitude'])) for stop in located], depot)
+        cached = ([str(located[index]['user_id']) for index in order], legs)
+        cache.set(key, cached, timeout=CACHE_TIMEOUT)
+        hit = False
+    else:
+        hit = True
+
+    by_user = {str(stop['user_id']): stop for stop in located}
+    user_ids, legs = cached
+    ordered = []
+    for position, (user_id, leg) in enumerate(zip(user_ids, legs), start=1):
+        ordered.append(dict(by_user[user_id], sequence=position, leg_km=round(leg, 3)))
+    for position, stop in enumerate(unlocated, start=len(ordered) + 1):
+        ordered.append(dict(stop, sequence=position, leg_km=None))
+    return ordered, round(sum(legs), 3), hit
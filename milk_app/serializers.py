@@ -1,7 +1,8 @@
 
 # milk_app/serializers.py
+from django.conf import settings
 from rest_framework import serializers
-from .models import DailyMilkDelivery, DailySkipRequest, SubscriptionRate, User, DailyMilkRequest, UserSubscription
+from .models import BlackoutDate, DailyMilkDelivery, DeliveryRoute, DeliveryZone, DailySkipRequest, Job, SkipRule, SubscriptionRate, User, DailyMilkRequest, UserSubscription
 from .firebase_config import FirebaseConfig
 from .utils import is_past_cutoff
 from django.utils import timezone
@@ -41,8 +42,20 @@ class RefreshTokenSerializer(serializers.Serializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'phone_number', 'full_name', 'timezone', 'role', 'created_at', 'updated_at']
+        fields = ['id', 'phone_number', 'full_name', 'timezone', 'role', 'address', 'latitude', 'longitude',
+                  'created_at', 'updated_at']
         read_only_fields = ['id', 'phone_number', 'role', 'created_at', 'updated_at']
+        extra_kwargs = {
+            'latitude': {'min_value': -90, 'max_value': 90},
+            'longitude': {'min_value': -180, 'max_value': 180},
+        }
+    
+    def validate(self, data):
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("latitude and longitude must be set together")
+        return data
 
 class SubscriptionRateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -56,12 +69,13 @@ class UserSubscriptionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = UserSubscription
-        fields = ['id', 'is_active', 'subscription_start_date', 'subscription_end_date', 
-                 'current_rate', 'rate_history', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'current_rate', 'rate_history', 'created_at', 'updated_at']
+        fields = ['id', 'is_active', 'milk_type', 'subscription_start_date', 'subscription_end_date', 
+                 'current_rate', 'current_daily_liters', 'rate_history', 'route', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'current_rate', 'current_daily_liters', 'rate_history', 'route', 'created_at', 'updated_at']
 
 class CreateSubscriptionSerializer(serializers.Serializer):
     daily_liters = serializers.DecimalField(max_digits=5, decimal_places=2)
+    milk_type = serializers.ChoiceField(choices=DailyMilkRequest.MILK_TYPE_CHOICES, default='buffalo')
     subscription_start_date = serializers.DateField()
     
     def validate_subscription_start_date(self, value):
@@ -99,6 +113,59 @@ class DailySkipRequestSerializer(serializers.ModelSerializer):
         
         return value
     
+class SkipRuleSerializer(serializers.ModelSerializer):
+    weekdays = serializers.ListField(
+        child=serializers.ChoiceField(choices=SkipRule.WEEKDAY_NAMES), required=False, allow_empty=True
+    )
+    
+    class Meta:
+        model = SkipRule
+        fields = ['id', 'weekdays', 'interval_days', 'start_date', 'end_date', 'reason', 'notes', 'created_at']
+        read_only_fields = ['id', 'created_at']
+        extra_kwargs = {'interval_days': {'min_value': 1, 'max_value': 366}}
+    
+    def validate_start_date(self, value):
+        if is_past_cutoff(value, self.context['request'].user.timezone):
+            raise serializers.ValidationError(
+                f"Cannot start a skip rule on {value}. Cutoff time has passed."
+            )
+        return value
+    
+    def validate(self, data):
+        if data.get('end_date') and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError({'end_date': 'End date cannot be before start date'})
+        # ['sat', 'sun'] -> bits 5 and 6; no weekdays means any day
+        weekdays = data.pop('weekdays', [])
+        data['weekday_mask'] = sum(1 << SkipRule.WEEKDAY_NAMES.index(name) for name in set(weekdays))
+        return data
+    
+class DeliveryZoneSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeliveryZone
+        fields = ['id', 'name', 'created_at']
+        read_only_fields = ['id', 'created_at']
+    
+class DeliveryRouteSerializer(serializers.ModelSerializer):
+    zone_name = serializers.CharField(source='zone.name', read_only=True)
+    
+    class Meta:
+        model = DeliveryRoute
+        fields = ['id', 'zone', 'zone_name', 'name', 'depot_latitude', 'depot_longitude', 'created_at']
+        read_only_fields = ['id', 'zone_name', 'created_at']
+        extra_kwargs = {
+            'depot_latitude': {'min_value': -90, 'max_value': 90},
+            'depot_longitude': {'min_value': -180, 'max_value': 180},
+        }
+    
+class RouteAssignmentSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    
+class BlackoutDateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BlackoutDate
+        fields = ['id', 'date', 'milk_type', 'zone', 'reason', 'created_at']
+        read_only_fields = ['id', 'created_at']
+    
 class DailyMilkDeliverySerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.full_name', read_only=True)
     user_phone = serializers.CharField(source='user.phone_number', read_only=True)
@@ -135,6 +202,14 @@ class AdminRequestUpdateSerializer(serializers.ModelSerializer):
         fields = ['liters', 'status']
 
 
+class AdminBulkOverrideSerializer(AdminRequestUpdateSerializer):
+    request_id = serializers.UUIDField()
+
+    class Meta(AdminRequestUpdateSerializer.Meta):
+        fields = ['request_id'] + AdminRequestUpdateSerializer.Meta.fields
+        extra_kwargs = {field: {'required': False} for field in AdminRequestUpdateSerializer.Meta.fields}
+
+
 
 class DailyMilkDeliverySerializer(serializers.ModelSerializer):
     class Meta:
@@ -146,4 +221,85 @@ class DailyMilkDeliverySerializer(serializers.ModelSerializer):
             'actual_liters',
             'status',
             'rate_applied'
-        ]
\ No newline at end of file
+        ]
+
+
+class SyncSubscriptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserSubscription
+        fields = ['id', 'is_active', 'milk_type', 'subscription_start_date', 'subscription_end_date', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.CharField(max_length=500)
+    body = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_path(self, value):
+        if not value.startswith('/'):
+            raise serializers.ValidationError("Path must be absolute, e.g. /api/user/me/")
+        return value
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        limit = settings.BATCH_MAX_REQUESTS
+        if len(value) > limit:
+            raise serializers.ValidationError(f"A batch can contain at most {limit} requests")
+        return value
+
+
+# Background Jobs
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'params', 'status', 'progress', 'total', 'error', 'attempts',
+                 'created_at', 'started_at', 'finished_at', 'updated_at']
+        read_only_fields = fields
+
+
+class EnqueueJobSerializer(serializers.Serializer):
+    kind = serializers.CharField(max_length=50)
+    params = serializers.DictField(required=False, default=dict)
+
+
+class DateRangeParamsSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, attrs):
+        if attrs['end_date'] < attrs['start_date']:
+            raise serializers.ValidationError("end_date cannot be before start_date")
+        return attrs
+
+
+class BillingReportParamsSerializer(DateRangeParamsSerializer):
+    user_id = serializers.UUIDField()
+
+
+class BillingInvoicesParamsSerializer(DateRangeParamsSerializer):
+    user_ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+
+class CalendarParamsSerializer(DateRangeParamsSerializer):
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if (attrs['end_date'] - attrs['start_date']).days >= 366:
+            raise serializers.ValidationError("Calendars are limited to one year")
+        return attrs
+
+
+class ScheduleExportParamsSerializer(DateRangeParamsSerializer):
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if (attrs['end_date'] - attrs['start_date']).days >= 366:
+            raise serializers.ValidationError("Schedule exports are limited to one year")
+        return attrs
+
+
+class HistoryExportParamsSerializer(DateRangeParamsSerializer):
+    compress = serializers.BooleanField(required=False, default=False)
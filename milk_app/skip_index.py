@@ -0,0 +1,101 @@
+# milk_app/skip_index.py
+"""
+Date-keyed index of who skipped delivery: date -> frozenset of user ids.
+
+Entries live in the shared cache so dispatch-time paths (the delivery
+schedule, route sheets) answer "did this user skip D?" with a set lookup
+instead of a DailySkipRequest query. The ``warm_skip_index`` command fills
+the coming days ahead of dispatch, and a missing entry is rebuilt from the
+database on first use.
+
+Each date has a version stamp, and entries are stored under the version
+read before their rows were loaded. skip_delivery and cancel_skip_request
+replace the date's stamp once their transaction commits, so any entry built
+before the change - including one a concurrent reader is still loading - is
+orphaned and the next lookup rebuilds it.
+
+Versions only reach other workers through a shared cache backend. With a
+per-process one (LocMem) the index is not used at all and every lookup
+queries the database.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DailySkipRequest
+from .utils import cache_is_shared
+
+
+def _version_key(skip_date):
+    return f'skip_index:version:{skip_date.isoformat()}'
+
+
+def _key(skip_date, version):
+    return f'skip_index:{skip_date.isoformat()}:{version}'
+
+
+def _versions(dates):
+    keys = {_version_key(skip_date): skip_date for skip_date in dates}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for skip_date in dates:
+        if skip_date not in versions:
+            cache.add(_version_key(skip_date), uuid.uuid4().hex, timeout=settings.SKIP_INDEX['TIMEOUT'])
+            versions[skip_date] = cache.get(_version_key(skip_date))
+    return versions
+
+
+def _load(start_date, end_date):
+    index = {start_date + timezone.timedelta(days=offset): set() for offset in range((end_date - start_date).days + 1)}
+    skips = DailySkipRequest.objects.filter(
+        skip_date__range=[start_date, end_date]
+    ).values_list('skip_date', 'user_id')
+    for skip_date, user_id in skips:
+        index[skip_date].add(user_id)
+    return {skip_date: frozenset(user_ids) for skip_date, user_ids in index.items()}
+
+
+def enabled():
+    """Whether lookups go through the cache (only with a shared backend)"""
+    return cache_is_shared()
+
+
+def skipped_users(skip_date):
+    """frozenset of ids of users who skipped skip_date"""
+    if not enabled():
+        return _load(skip_date, skip_date)[skip_date]
+    # The version is read before loading so a change committed meanwhile orphans this entry
+    key = _key(skip_date, _versions([skip_date])[skip_date])
+    user_ids = cache.get(key)
+    if user_ids is None:
+        user_ids = _load(skip_date, skip_date)[skip_date]
+        cache.add(key, user_ids, timeout=settings.SKIP_INDEX['TIMEOUT'])
+    return user_ids
+
+
+def warm(start_date=None, days=None):
+    """Fill missing entries for a run of dates with a single query; returns {date: user count}"""
+    start_date = start_date or timezone.now().date()
+    days = days or settings.SKIP_INDEX['WARM_DAYS']
+    end_date = start_date + timezone.timedelta(days=days - 1)
+    versions = _versions([start_date + timezone.timedelta(days=offset) for offset in range(days)])
+    index = _load(start_date, end_date)
+    for skip_date, user_ids in index.items():
+        cache.add(_key(skip_date, versions[skip_date]), user_ids, timeout=settings.SKIP_INDEX['TIMEOUT'])
+    return {skip_date: len(user_ids) for skip_date, user_ids in index.items()}
+
+
+def invalidate(skip_date):
+    """Orphan the date's entry; the next lookup rebuilds it from the database"""
+    if enabled():
+        cache.set(_version_key(skip_date), uuid.uuid4().hex, timeout=settings.SKIP_INDEX['TIMEOUT'])
+
+
+def record_skip_on_commit(skip_date, user_id):
+    transaction.on_commit(lambda: invalidate(skip_date))
+
+
+def record_cancel_on_commit(skip_date, user_id):
+    transaction.on_commit(lambda: invalidate(skip_date))
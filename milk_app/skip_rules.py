@@ -0,0 +1,87 @@
+# milk_app/skip_rules.py
+"""
+Expansion of recurring SkipRules into skipped days.
+
+Rules are never materialized as DailySkipRequest rows. A rule skips every
+interval_days-th day counted from its start_date, restricted to the weekdays
+in weekday_mask (0 = any weekday), until end_date. Matching days over a range
+come out as a bitset aligned like the calendar bitsets (bit i = start_date +
+i days): one period of the pattern (lcm of 7 and the interval) is built bit
+by bit, then doubled by shifting until it covers the range, so a year of
+"every Sunday" costs a handful of big-int operations rather than a loop over
+365 dates. Every rule overlapping a range is resolved with one query.
+"""
+from datetime import timedelta
+from math import lcm
+
+from django.db.models import Q
+
+from .models import SkipRule
+
+ANY_WEEKDAY = 0b1111111
+
+
+def _pattern(weekday_mask, interval_days, first_date):
+    """(bits, period): matching offsets over one period starting at first_date, a candidate day"""
+    if weekday_mask in (0, ANY_WEEKDAY):
+        return 1, interval_days
+    period = lcm(7, interval_days)
+    bits = 0
+    for offset in range(0, period, interval_days):
+        if weekday_mask >> ((first_date.weekday() + offset) % 7) & 1:
+            bits |= 1 << offset
+    return bits, period
+
+
+def rule_bits(weekday_mask, interval_days, rule_start, rule_end, start_date, end_date):
+    """Bitset of the days in [start_date, end_date] skipped by one rule"""
+    first = max(start_date, rule_start)
+    last = min(end_date, rule_end) if rule_end else end_date
+    if last < first:
+        return 0
+    # Move to the first day on the rule's interval grid
+    first += timedelta(days=-(first - rule_start).days % interval_days)
+    if last < first:
+        return 0
+
+    bits, period = _pattern(weekday_mask, interval_days, first)
+    length = (last - first).days + 1
+    while period < length:
+        bits |= bits << period
+        period *= 2
+    return (bits & ((1 << length) - 1)) << (first - start_date).days
+
+
+def expand(start_date, end_date, user_ids=None):
+    """{user_id: bitset of rule-skipped days in [start_date, end_date]} for users with matching rules"""
+    rules = SkipRule.objects.filter(
+        start_date__lte=end_date,
+    ).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=start_date)
+    )
+    if user_ids is not None:
+        rules = rules.filter(user_id__in=user_ids)
+
+    skipped = {}
+    for user_id, weekday_mask, interval_days, rule_start, rule_end in rules.values_list(
+        'user_id', 'weekday_mask', 'interval_days', 'start_date', 'end_date'
+    ):
+        bits = rule_bits(weekday_mask, interval_days, rule_start, rule_end, start_date, end_date)
+        if bits:
+            skipped[user_id] = skipped.get(user_id, 0) | bits
+    return skipped
+
+
+def users_skipping(on_date, user_ids=None):
+    """frozenset of ids of users whose rules skip on_date"""
+    return frozenset(expand(on_date, on_date, user_ids))
+
+
+def offsets(bits):
+    """Day offsets of the set bits, ascending"""
+    found = []
+    while bits:
+        lowest = bits & -bits
+        found.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return found
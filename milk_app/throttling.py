@@ -0,0 +1,104 @@
+# milk_app/throttling.py
+"""
+Token-bucket rate limiting for the unauthenticated auth endpoints.
+
+Buckets live in the default cache, keyed by route scope plus client IP or
+phone number, so limits hold across worker processes when the cache is
+shared. Limits are configured per scope in settings.RATE_LIMITS using DRF's
+'<requests>/<period>' syntax: the number is the bucket capacity (burst) and
+the bucket refills at that many tokens per period.
+
+Bucket updates are read-modify-write on the cache, so a burst racing across
+processes can slightly exceed the capacity; that is acceptable for abuse
+protection and avoids a lock round-trip on every request.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/min' -> (capacity, seconds per full refill)"""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+def take_token(key, rate, now=None):
+    """Consume one token from the bucket; return 0 if allowed, else seconds until a token is available"""
+    capacity, duration = parse_rate(rate)
+    refill_per_second = capacity / duration
+    now = time.time() if now is None else now
+
+    tokens, updated_at = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+
+    if tokens >= 1:
+        cache.set(key, (tokens - 1, now), timeout=duration)
+        return 0
+
+    cache.set(key, (tokens, now), timeout=duration)
+    return (1 - tokens) / refill_per_second
+
+
+def _bucket_key(scope, dimension, value):
+    digest = hashlib.sha1(str(value).encode()).hexdigest()
+    return f'ratelimit:{scope}:{dimension}:{digest}'
+
+
+def check_rate_limits(scope, ident, phone_number=None):
+    """Apply every configured bucket for the scope; return seconds to wait, or 0 if allowed"""
+    limits = settings.RATE_LIMITS.get(scope, {})
+    identities = {'ip': ident, 'phone': phone_number}
+
+    for dimension, rate in limits.items():
+        value = identities.get(dimension)
+        if not value:
+            continue
+        wait = take_token(_bucket_key(scope, dimension, value), rate)
+        if wait:
+            metrics.incr(f'ratelimit.{scope}.rejected')
+            metrics.incr(f'ratelimit.{scope}.rejected.{dimension}')
+            return wait
+
+    metrics.incr(f'ratelimit.{scope}.allowed')
+    return 0
+
+
+def retry_after_seconds(wait):
+    return max(1, math.ceil(wait))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base throttle: subclasses set scope to a key of settings.RATE_LIMITS"""
+    scope = None
+
+    def allow_request(self, request, view):
+        phone_number = None
+        if isinstance(request.data, dict):
+            phone_number = request.data.get('phone_number')
+
+        self._wait = check_rate_limits(self.scope, self.get_ident(request), phone_number)
+        return not self._wait
+
+    def wait(self):
+        return retry_after_seconds(self._wait)
+
+
+class SignupRateThrottle(TokenBucketThrottle):
+    scope = 'signup'
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    scope = 'login'
+
+
+class RefreshTokenRateThrottle(TokenBucketThrottle):
+    scope = 'refresh_token'
@@ -0,0 +1,187 @@
+# milk_app/token_store.py
+"""
+Refresh-token rotation store.
+
+Every refresh token carries a ``jti`` (token id) and ``fam`` (family id)
+claim. Rotating a refresh token records its jti as consumed; presenting a
+consumed jti again means the token was copied, so the whole family is
+revoked. Consumed jtis are only ever checked by their unique insert.
+Revoked families live in the revoked_tokens table, fronted by an
+in-process bloom filter: a negative answer (the common case) costs a few
+hash computations and never touches the database, and only a possible
+positive falls back to a DB lookup. Processes notice revocations made
+elsewhere through a version stamp in the shared cache and pull just the
+new rows. Without a shared cache backend that stamp never reaches other
+workers, so every check goes to the database instead.
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+from .utils import cache_is_shared
+
+VERSION_KEY = 'token_store:version'
+
+
+class TokenRevokedError(Exception):
+    pass
+
+
+class TokenReuseError(TokenRevokedError):
+    pass
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.capacity = capacity
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _bloom_key(kind, token_id):
+    return f'{kind}:{token_id}'
+
+
+class RevocationStore:
+    # overlap for incremental syncs to cover commit latency and clock skew between servers
+    SYNC_OVERLAP = timedelta(seconds=60)
+    # full rebuilds drop expired entries and resize the filter
+    REBUILD_INTERVAL = 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._version = None
+        self._synced_at = None
+        self._built_at = 0
+
+    def _rebuild(self):
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(kind='family', expires_at__gt=now).values_list('kind', 'token_id')
+        total = rows.count()
+        config = settings.REFRESH_TOKEN_STORE
+        bloom = BloomFilter(max(config['BLOOM_CAPACITY'], total * 2), config['BLOOM_ERROR_RATE'])
+        for kind, token_id in rows.iterator(chunk_size=5000):
+            bloom.add(_bloom_key(kind, token_id))
+        self._bloom = bloom
+        self._synced_at = now
+        self._built_at = time.monotonic()
+
+    def _pull_new(self):
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(
+            kind='family', revoked_at__gte=self._synced_at - self.SYNC_OVERLAP
+        ).values_list('kind', 'token_id')
+        for kind, token_id in rows:
+            self._bloom.add(_bloom_key(kind, token_id))
+        self._synced_at = now
+
+    def _sync(self):
+        version = cache.get(VERSION_KEY)
+        stale = self._bloom is None or time.monotonic() - self._built_at > self.REBUILD_INTERVAL
+        if not stale and version is not None and version == self._version:
+            return
+
+        with self._lock:
+            if self._bloom is None or stale or self._bloom.count > self._bloom.capacity:
+                self._rebuild()
+            elif version != self._version:
+                self._pull_new()
+            self._version = version
+
+    def _publish(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+    def might_be_revoked(self, kind, token_id):
+        """Bloom check only: False means definitely not revoked"""
+        if not cache_is_shared():
+            # Revocations by other workers are never announced to this one: let callers ask the DB
+            return True
+        self._sync()
+        return _bloom_key(kind, token_id) in self._bloom
+
+    def is_revoked_in_db(self, kind, token_id):
+        return RevokedToken.objects.filter(kind=kind, token_id=token_id).exists()
+
+    def is_revoked(self, kind, token_id):
+        return self.might_be_revoked(kind, token_id) and self.is_revoked_in_db(kind, token_id)
+
+    def _record(self, kind, token_id, user_id, expires_at):
+        """Insert a revocation row; return False if it already existed"""
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(kind=kind, token_id=token_id, user_id=user_id, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
+
+    def revoke_family(self, family, user_id=None):
+        # The newest token in a family expires at most one lifetime from now
+        lifetime = max(settings.JWT_ACCESS_TOKEN_LIFETIME, settings.JWT_REFRESH_TOKEN_LIFETIME)
+        if not self._record('family', family, user_id, timezone.now() + timedelta(seconds=lifetime)):
+            return
+        if self._bloom is not None:
+            with self._lock:
+                self._bloom.add(_bloom_key('family', family))
+        # Only family revocations are looked up through the bloom filter, so only they are announced
+        transaction.on_commit(self._publish)
+
+    def rotate(self, payload):
+        """
+        Consume a decoded refresh-token payload and return the family id the
+        replacement tokens should carry. Raises TokenRevokedError for revoked
+        families and TokenReuseError (after revoking the family) when an
+        already-rotated token is presented again.
+        """
+        jti = payload.get('jti')
+        family = payload.get('fam')
+
+        if not jti or not family:
+            # Issued before rotation existed and cannot be tracked: move the client onto a new family
+            return None
+
+        if self.is_revoked('family', family):
+            raise TokenRevokedError('Refresh token revoked')
+
+        expires_at = datetime.fromtimestamp(payload['exp'], tz=dt_timezone.utc)
+        if not self._record('jti', jti, payload.get('user_id'), expires_at):
+            self.revoke_family(family, payload.get('user_id'))
+            raise TokenReuseError('Refresh token reuse detected. Please log in again.')
+
+        return family
+
+    def prune(self):
+        """Delete rows whose tokens have expired anyway"""
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+revocation_store = RevocationStore()
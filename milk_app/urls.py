@@ -1,40 +1,78 @@
 # milk_app/urls.py
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+
+def _route(name, sync_view):
+    """Serve the native async variant of a view when its route is listed in ASYNC_ROUTES"""
+    if name in settings.ASYNC_ROUTES:
+        return getattr(async_views, name)
+    return sync_view
+
 
 urlpatterns = [
     # Authentication
-    path('auth/signup/', views.signup, name='signup'), 
-    path('auth/login/', views.login, name='login'),
-    path('auth/refresh/', views.refresh_token, name='refresh_token'),
+    path('auth/signup/', _route('signup', views.signup), name='signup'), 
+    path('auth/login/', _route('login', views.login), name='login'),
+    path('auth/refresh/', _route('refresh_token', views.refresh_token), name='refresh_token'),
+    path('auth/logout/', views.logout, name='logout'),
     
     # User Profile
-    path('user/me/', views.user_profile, name='user_profile'),
+    path('user/me/', _route('user_profile', views.user_profile), name='user_profile'),
+    path('home/', views.home_screen, name='home_screen'),
+    path('batch/', views.batch, name='batch'),
     
     # Subscription Management (Updated with Rate Versioning)
-    path('subscription/', views.user_subscription, name='user_subscription'),
+    path('subscription/', _route('user_subscription', views.user_subscription), name='user_subscription'),
     path('subscription/update-rate/', views.update_subscription_rate, name='update_subscription_rate'),
     path('subscription/billing-history/', views.subscription_billing_history, name='subscription_billing_history'),
     
     # Skip Requests (New - Exception-based approach)
     path('skip/', views.skip_delivery, name='skip_delivery'),
-    path('skip/list/', views.user_skip_requests, name='user_skip_requests'),
+    path('skip/list/', _route('user_skip_requests', views.user_skip_requests), name='user_skip_requests'),
     path('skip/<uuid:skip_id>/', views.cancel_skip_request, name='cancel_skip_request'),
+    path('skip/rules/', views.user_skip_rules, name='user_skip_rules'),
+    path('skip/rules/<uuid:rule_id>/', views.end_skip_rule, name='end_skip_rule'),
+    
+    # Mobile delta sync
+    path('sync/', views.delta_sync, name='delta_sync'),
     
     # Legacy Milk Requests (Keep for backward compatibility or remove)
     path('requests/', views.create_milk_request, name='create_milk_request'),
     path('requests/<uuid:request_id>/', views.update_milk_request, name='update_milk_request'),
     path('requests/<uuid:request_id>/delete/', views.delete_milk_request, name='delete_milk_request'),
-    path('requests/by-date/', views.get_user_request, name='get_user_request'),
+    path('requests/by-date/', _route('get_user_request', views.get_user_request), name='get_user_request'),
     
     # Admin - Updated with Rate Versioning System
     path('admin/schedule/', views.admin_delivery_schedule, name='admin_delivery_schedule'),
+    path('admin/demand/', views.admin_demand, name='admin_demand'),
+    path('admin/zones/', views.admin_zones, name='admin_zones'),
+    path('admin/routes/', views.admin_routes, name='admin_routes'),
+    path('admin/routes/<uuid:route_id>/subscribers/', views.admin_assign_route, name='admin_assign_route'),
+    path('admin/routes/<uuid:route_id>/schedule/', views.admin_route_schedule, name='admin_route_schedule'),
+    path('admin/routes/<uuid:route_id>/sequence/', views.admin_route_sequence, name='admin_route_sequence'),
+    path('admin/routes/<uuid:route_id>/package/', views.admin_route_package, name='admin_route_package'),
+    path('admin/routes/<uuid:route_id>/results/', views.admin_route_results, name='admin_route_results'),
     path('admin/billing-report/', views.admin_billing_report, name='admin_billing_report'),
     path('admin/skip-requests/', views.admin_skip_requests, name='admin_skip_requests'),
+    path('admin/blackouts/', views.admin_blackouts, name='admin_blackouts'),
+    path('admin/blackouts/<uuid:blackout_id>/', views.admin_delete_blackout, name='admin_delete_blackout'),
     path('admin/update-deliveries/', views.admin_update_delivery_status, name='admin_update_delivery_status'),
     
+    # Admin - Background Jobs
+    path('admin/jobs/', views.admin_jobs, name='admin_jobs'),
+    path('admin/jobs/<uuid:job_id>/', views.admin_job_detail, name='admin_job_detail'),
+    path('admin/jobs/<uuid:job_id>/result/', views.admin_job_result, name='admin_job_result'),
+    path('admin/metrics/', views.admin_metrics, name='admin_metrics'),
+    path('admin/export/history/', views.admin_export_history, name='admin_export_history'),
+    path('admin/export/history/<uuid:job_id>/', views.admin_download_history_export, name='admin_download_history_export'),
+    path('admin/calendar/missed/', views.admin_missed_deliveries, name='admin_missed_deliveries'),
+    path('admin/calendar/<uuid:user_id>/', views.admin_user_calendar, name='admin_user_calendar'),
+    
     # Admin - Legacy (Keep or remove based on needs)
     path('admin/requests/', views.admin_get_requests, name='admin_get_requests'),
     path('admin/aggregate/', views.admin_get_aggregate, name='admin_get_aggregate'),
     path('admin/requests/<uuid:request_id>/override/', views.admin_override_request, name='admin_override_request'),
+    path('admin/requests/bulk-override/', views.admin_bulk_override_requests, name='admin_bulk_override_requests'),
 ]
@@ -1,20 +1,39 @@
 
 # milk_app/utils.py
+import uuid
+
 import jwt
 from django.conf import settings
 from django.utils import timezone
 from datetime import datetime, timedelta
 import pytz
 
-def generate_jwt_tokens(user):
-    """Generate access and refresh tokens for a user"""
+# Cache backends whose contents are private to one process
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+def cache_is_shared(alias='default'):
+    """True if every worker process sees the same contents in the cache alias"""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+def generate_jwt_tokens(user, family=None):
+    """Generate access and refresh tokens for a user
+    
+    Tokens issued by rotating a refresh token keep its family id so the whole
+    chain can be revoked at once; logins and signups start a new family.
+    """
     now = timezone.now()
+    family = family or uuid.uuid4().hex
     
     access_payload = {
         'user_id': str(user.id),
         'role': user.role,
         'exp': now + timedelta(seconds=settings.JWT_ACCESS_TOKEN_LIFETIME),
         'iat': now,
+        'jti': uuid.uuid4().hex,
+        'fam': family,
         'type': 'access'
     }
     
@@ -23,6 +42,8 @@ def generate_jwt_tokens(user):
         'role': user.role,
         'exp': now + timedelta(seconds=settings.JWT_REFRESH_TOKEN_LIFETIME),
         'iat': now,
+        'jti': uuid.uuid4().hex,
+        'fam': family,
         'type': 'refresh'
     }
     
@@ -46,4 +67,11 @@ def is_past_cutoff(target_date, user_timezone):
     """Check if current time is past the cutoff for a target date"""
     cutoff_time = get_cutoff_time(target_date, user_timezone)
     current_time = timezone.now()
-    return current_time >= cutoff_time
\ No newline at end of file
+    return current_time >= cutoff_time
+
+def parse_date(date_str):
+    """Parse a YYYY-MM-DD string, returning None if it is malformed"""
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
@@ -1,26 +1,45 @@
 # milk_app/views.py
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django.db import IntegrityError, transaction
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, Value
+from django.db.models.functions import Coalesce, NullIf
 from .permission import IsJWTAuthenticated, IsAdmin, IsOwnerOrAdmin
 from datetime import datetime
+from decimal import Decimal
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 import jwt
+import logging
 from django.conf import settings
 
-from .models import DailyMilkDelivery, DailySkipRequest, SubscriptionRate, User, DailyMilkRequest, UserSubscription
+from .models import BlackoutDate, DailyMilkDelivery, DeliveryRoute, DeliveryZone, DailySkipRequest, Job, SkipRule, SubscriptionRate, SyncTombstone, User, DailyMilkRequest, UserSubscription
 from .serializers import (
     CreateSubscriptionSerializer, DailyMilkDeliverySerializer, SubscriptionRateSerializer, UpdateSubscriptionRateSerializer, UserRegistrationSerializer, UserLoginSerializer, RefreshTokenSerializer,
-    UserSerializer, DailyMilkRequestSerializer, AdminRequestUpdateSerializer, UserSubscriptionSerializer, DailySkipRequestSerializer,
-     
+    UserSerializer, DailyMilkRequestSerializer, AdminRequestUpdateSerializer, AdminBulkOverrideSerializer, UserSubscriptionSerializer, DailySkipRequestSerializer, SkipRuleSerializer, BlackoutDateSerializer,
+    DeliveryZoneSerializer, DeliveryRouteSerializer, RouteAssignmentSerializer,
+    EnqueueJobSerializer, JobSerializer, SyncSubscriptionSerializer, BatchRequestSerializer, CalendarParamsSerializer,
 )   
-from .utils import generate_jwt_tokens, is_past_cutoff
+from .utils import generate_jwt_tokens, is_past_cutoff, parse_date
+from .jobs import JOB_HANDLERS, enqueue_job, validate_job_params
+from .reports import DEMAND_ADHOC_RULES, build_billing_report, build_delivery_schedule, build_demand
+from .rates import schedule_rate_change
+from .routes import route_package, route_schedule, route_sequence
+from .deliveries import apply_delivery_updates
+from .idempotency import idempotent
 from .firebase_config import FirebaseConfig
+from .token_store import TokenRevokedError, revocation_store
+from .throttling import LoginRateThrottle, RefreshTokenRateThrottle, SignupRateThrottle
+from . import blackouts, calendars, driver_package, metrics, skip_index, skip_rules
+from .batch import BatchEntryError, dispatch as batch_dispatch
+from .columnar import open_archive
+
+logger = logging.getLogger(__name__)
 
 
 # Admin Views
@@ -37,6 +56,7 @@ def admin_required(view_func):
 # Authentication Views
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([SignupRateThrottle])
 def signup(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
@@ -86,6 +106,7 @@ def signup(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginRateThrottle])
 def login(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
@@ -123,6 +144,7 @@ def login(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RefreshTokenRateThrottle])
 def refresh_token(request):
     serializer = RefreshTokenSerializer(data=request.data)
     if serializer.is_valid():
@@ -140,13 +162,21 @@ def refresh_token(request):
                 )
             
             user = User.objects.get(id=payload['user_id'])
-            access_token, new_refresh_token = generate_jwt_tokens(user)
+            
+            # Rotate: the presented token is consumed and can never be used again
+            family = revocation_store.rotate(payload)
+            access_token, new_refresh_token = generate_jwt_tokens(user, family=family)
             
             return Response({
                 'access_token': access_token,
                 'refresh_token': new_refresh_token
             })
             
+        except TokenRevokedError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_401_UNAUTHORIZED
+            )
         except jwt.ExpiredSignatureError:
             return Response(
                 {'error': 'Refresh token expired'}, 
@@ -165,6 +195,195 @@ def refresh_token(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsJWTAuthenticated])
+def logout(request):
+    """Revoke the token family of the presented access token (all its refresh tokens)"""
+    payload = jwt.decode(request.auth, settings.JWT_SECRET_KEY, algorithms=['HS256'])
+    
+    if not payload.get('fam'):
+        return Response(
+            {'error': 'Token was issued before revocation support. It expires on its own.'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    revocation_store.revoke_family(payload['fam'], request.user.id)
+    return Response({'message': 'Logged out successfully'})
+
+
+HOME_SECTIONS = ['profile', 'current_rate', 'upcoming_skips', 'tomorrow', 'month_to_date']
+
+
+@api_view(['GET'])
+@permission_classes([IsJWTAuthenticated])
+def home_screen(request):
+    """Everything the app needs at launch in one call, with a fixed number of queries
+    
+    ``sections`` selects a subset (comma-separated, default all) and ``days``
+    sets the upcoming-skip window (default 7). Upcoming skips include the days
+    covered by skip rules, marked ``"source": "rule"``.
+    """
+    sections = HOME_SECTIONS
+    if request.GET.get('sections'):
+        sections = [section.strip() for section in request.GET['sections'].split(',') if section.strip()]
+        unknown = set(sections) - set(HOME_SECTIONS)
+        if unknown:
+            return Response(
+                {'error': f'Unknown sections: {", ".join(sorted(unknown))}. Choose from: {", ".join(HOME_SECTIONS)}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    try:
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    days = min(max(days, 1), 60)
+    
+    user = request.user
+    today = timezone.now().date()
+    tomorrow = today + timezone.timedelta(days=1)
+    data = {}
+    
+    if 'profile' in sections:
+        data['profile'] = UserSerializer(user).data
+    
+    subscription = None
+    rates = []
+    if {'current_rate', 'tomorrow'} & set(sections):
+        subscription = UserSubscription.objects.filter(user=user).select_related('route').first()
+        if subscription:
+            # One query for all versions; current and tomorrow's rate are picked in Python
+            rates = list(subscription.subscription_rates.order_by('-effective_from'))
+    
+    if 'current_rate' in sections:
+        # By window rather than is_active, which lags until the nightly rollover has run
+        current_rate = next((
+            rate for rate in rates
+            if rate.effective_from <= today and (rate.effective_to is None or rate.effective_to >= today)
+        ), None)
+        data['current_rate'] = SubscriptionRateSerializer(current_rate).data if current_rate else None
+    
+    skips = []
+    rule_skip_dates = []
+    if {'upcoming_skips', 'tomorrow'} & set(sections):
+        window_end = today + timezone.timedelta(days=days)
+        skips = list(DailySkipRequest.objects.filter(
+            user=user,
+            skip_date__range=[today, window_end]
+        ).order_by('skip_date'))
+        rule_bits = skip_rules.expand(today, window_end, [user.id]).get(user.id, 0)
+        rule_skip_dates = [today + timezone.timedelta(days=offset) for offset in skip_rules.offsets(rule_bits)]
+    
+    if 'upcoming_skips' in sections:
+        # Explicit skips plus the days skip rules cover, one entry per day
+        upcoming = [dict(entry, source='request') for entry in DailySkipRequestSerializer(skips, many=True).data]
+        requested_dates = {skip.skip_date for skip in skips}
+        upcoming.extend(
+            {'skip_date': skip_date.isoformat(), 'source': 'rule'}
+            for skip_date in rule_skip_dates if skip_date not in requested_dates
+        )
+        data['upcoming_skips'] = sorted(upcoming, key=lambda entry: entry['skip_date'])
+    
+    if 'tomorrow' in sections:
+        is_skipped = (
+            any(skip.skip_date == tomorrow for skip in skips)
+            or tomorrow in rule_skip_dates
+        )
+        subscribed = bool(
+            subscription and subscription.is_active
+            and subscription.subscription_start_date <= tomorrow
+            and (subscription.subscription_end_date is None or subscription.subscription_end_date >= tomorrow)
+        )
+        tomorrow_rate = next((
+            rate for rate in rates
+            if rate.effective_from <= tomorrow and (rate.effective_to is None or rate.effective_to >= tomorrow)
+        ), None) if subscribed else None
+        is_blackout = bool(subscription) and bool(blackouts.bits_for(
+            blackouts.closed_bits(tomorrow, tomorrow),
+            subscription.milk_type,
+            subscription.route.zone_id if subscription.route else None
+        ))
+        data['tomorrow'] = {
+            'date': tomorrow,
+            'is_skipped': is_skipped,
+            'is_blackout': is_blackout,
+            'rate_id': tomorrow_rate.id if tomorrow_rate else None,
+            'scheduled_liters': tomorrow_rate.daily_liters if tomorrow_rate and not (is_skipped or is_blackout) else 0
+        }
+    
+    if 'month_to_date' in sections:
+        month_start = today.replace(day=1)
+        # NullIf mirrors billing's `actual_liters or scheduled_liters`
+        totals = DailyMilkDelivery.objects.filter(
+            user=user,
+            delivery_date__range=[month_start, today],
+            status='delivered'
+        ).aggregate(
+            delivered_days=Count('id'),
+            delivered_liters=Sum(Coalesce(NullIf('actual_liters', Value(Decimal('0'))), 'scheduled_liters'))
+        )
+        data['month_to_date'] = {
+            'start_date': month_start,
+            'end_date': today,
+            'delivered_days': totals['delivered_days'],
+            'delivered_liters': totals['delivered_liters'] or 0
+        }
+    
+    return Response(data)
+
+
+class _RollbackBatch(Exception):
+    pass
+
+
+@api_view(['POST'])
+@permission_classes([IsJWTAuthenticated])
+def batch(request):
+    """Run several API calls in one HTTP request, authenticated once
+    
+    Body: {"requests": [{"method", "path", "body"}], "atomic": false}. With
+    atomic=true all sub-requests share one transaction, execution stops at the
+    first error response and everything is rolled back.
+    """
+    serializer = BatchRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    entries = serializer.validated_data['requests']
+    atomic = serializer.validated_data['atomic']
+    responses = []
+    
+    def run_entries():
+        for entry in entries:
+            try:
+                status_code, body = batch_dispatch(request._request, entry['method'], entry['path'], entry.get('body'))
+            except BatchEntryError as e:
+                status_code, body = e.status_code, {'error': e.message}
+            except Exception:
+                logger.exception(f"Batch sub-request {entry['method']} {entry['path']} failed")
+                status_code, body = status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Internal server error'}
+            
+            responses.append({'status': status_code, 'body': body})
+            if atomic and status_code >= 400:
+                raise _RollbackBatch()
+    
+    if not atomic:
+        run_entries()
+        return Response({'responses': responses})
+    
+    committed = True
+    try:
+        with transaction.atomic():
+            run_entries()
+    except _RollbackBatch:
+        committed = False
+    
+    return Response({
+        'atomic': True,
+        'committed': committed,
+        'responses': responses
+    }, status=status.HTTP_200_OK if committed else status.HTTP_409_CONFLICT)
+
 
 # New Subscription Views
 @api_view(['GET', 'POST', 'PUT'])
@@ -173,7 +392,7 @@ def user_subscription(request):
     """Manage user's milk subscription"""
     if request.method == 'GET':
         try:
-            subscription = UserSubscription.objects.get(user=request.user)
+            subscription = UserSubscription.objects.select_related('current_rate').get(user=request.user)
             serializer = UserSubscriptionSerializer(subscription)
             return Response(serializer.data)
         except UserSubscription.DoesNotExist:
@@ -197,18 +416,21 @@ def user_subscription(request):
                 # Create subscription
                 subscription = UserSubscription.objects.create(
                     user=request.user,
+                    milk_type=serializer.validated_data['milk_type'],
                     subscription_start_date=serializer.validated_data['subscription_start_date']
                 )
                 
-                # Create initial rate
+                # Create initial rate (pending until a future start date arrives)
                 initial_rate = SubscriptionRate.objects.create(
                     subscription=subscription,
                     daily_liters=serializer.validated_data['daily_liters'],
-                    effective_from=serializer.validated_data['subscription_start_date']
+                    effective_from=serializer.validated_data['subscription_start_date'],
+                    is_active=serializer.validated_data['subscription_start_date'] <= timezone.now().date()
                 )
                 
-                # Refresh subscription to get the current_rate
-                subscription.refresh_from_db()
+                # Denormalized current rate (None until a future start date arrives)
+                subscription.refresh_current_rate()
+                calendars.invalidate_on_commit(request.user.id)
                 
             return Response({
                 'message': 'Subscription created successfully',
@@ -232,6 +454,7 @@ def user_subscription(request):
 
 @api_view(['POST'])
 @permission_classes([IsJWTAuthenticated])
+@idempotent
 def update_subscription_rate(request):
     """Update subscription rate - creates new rate version"""
     try:
@@ -243,33 +466,25 @@ def update_subscription_rate(request):
     if serializer.is_valid():
         new_daily_liters = serializer.validated_data['new_daily_liters']
         effective_from = serializer.validated_data['effective_from']
-        
-        # Check if there's already a rate for this date
-        existing_rate = SubscriptionRate.objects.filter(
-            subscription=subscription,
-            effective_from=effective_from
-        ).first()
-        
-        if existing_rate:
-            return Response(
-                {'error': f'Rate already exists for {effective_from}. Cannot create duplicate.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # End current active rate if new rate is immediate
-        current_rate = subscription.current_rate
-        if current_rate and effective_from :
-            current_rate.effective_to = effective_from - timezone.timedelta(days=1)
-            current_rate.is_active = False
-            current_rate.save()
-        
-        # Create new rate
-        new_rate = SubscriptionRate.objects.create(
-            subscription=subscription,
-            daily_liters=new_daily_liters,
-            effective_from=effective_from
+        duplicate = Response(
+            {'error': f'Rate already exists for {effective_from}. Cannot create duplicate.'},
+            status=status.HTTP_400_BAD_REQUEST
         )
         
+        try:
+            with transaction.atomic():
+                # Lock the subscription so concurrent changes for the same date queue up behind the check
+                subscription = UserSubscription.objects.select_for_update().get(id=subscription.id)
+                if SubscriptionRate.objects.filter(subscription=subscription, effective_from=effective_from).exists():
+                    return duplicate
+                
+                # Future-dated changes stay pending (is_active=False) until the nightly rollover
+                new_rate = schedule_rate_change(subscription, new_daily_liters, effective_from)
+                calendars.invalidate_on_commit(request.user.id)
+        except IntegrityError:
+            # Databases without row locks (SQLite) still reject the duplicate through unique_together
+            return duplicate
+        
         return Response({
             'message': 'Subscription rate updated successfully',
             'new_rate': SubscriptionRateSerializer(new_rate).data,
@@ -353,12 +568,15 @@ def subscription_billing_history(request):
 
 @api_view(['POST'])
 @permission_classes([IsJWTAuthenticated])
+@idempotent
 def skip_delivery(request):
     """Request to skip delivery for specific date"""
     serializer = DailySkipRequestSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         try:
             skip_request = serializer.save(user=request.user)
+            calendars.invalidate_on_commit(request.user.id)
+            skip_index.record_skip_on_commit(skip_request.skip_date, request.user.id)
             return Response(
                 DailySkipRequestSerializer(skip_request).data, 
                 status=status.HTTP_201_CREATED
@@ -406,10 +624,127 @@ def cancel_skip_request(request, skip_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    skip_request.delete()
+    with transaction.atomic():
+        SyncTombstone.objects.create(user=request.user, model='skip_request', object_id=skip_request.id)
+        skip_request.delete()
+        calendars.invalidate_on_commit(request.user.id)
+        skip_index.record_cancel_on_commit(skip_request.skip_date, request.user.id)
     return Response({'message': 'Skip request cancelled successfully'})
 
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsJWTAuthenticated])
+def user_skip_rules(request):
+    """List the user's recurring skip rules or create one"""
+    if request.method == 'GET':
+        rules = SkipRule.objects.filter(user=request.user).order_by('-start_date')
+        return Response(SkipRuleSerializer(rules, many=True).data)
+    
+    serializer = SkipRuleSerializer(data=request.data, context={'request': request})
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    rule = serializer.save(user=request.user)
+    calendars.invalidate_on_commit(request.user.id)
+    return Response(SkipRuleSerializer(rule).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsJWTAuthenticated])
+def end_skip_rule(request, rule_id):
+    """Stop a skip rule from the first date still before its cutoff
+    
+    Days already past cutoff stay skipped (they may be billed), so a rule
+    that has started is ended the day before instead of deleted.
+    """
+    rule = get_object_or_404(SkipRule, id=rule_id, user=request.user)
+    
+    first_open_date = timezone.now().date()
+    while is_past_cutoff(first_open_date, request.user.timezone):
+        first_open_date += timezone.timedelta(days=1)
+    
+    if rule.end_date and rule.end_date < first_open_date:
+        return Response(
+            {'error': f'Skip rule already ended on {rule.end_date}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if rule.start_date >= first_open_date:
+        rule.delete()
+        message = 'Skip rule deleted'
+    else:
+        rule.end_date = first_open_date - timezone.timedelta(days=1)
+        rule.save(update_fields=['end_date', 'updated_at'])
+        message = f'Skip rule ended on {rule.end_date}'
+    calendars.invalidate_on_commit(request.user.id)
+    return Response({'message': message})
+
+
+@api_view(['GET'])
+@permission_classes([IsJWTAuthenticated])
+def delta_sync(request):
+    """Rows changed since the client's watermark, plus deletions, in one call
+    
+    Without ``since`` (or when it is older than tombstone retention) a full
+    snapshot is returned. Clients merge rows by id and store the returned
+    watermark for the next call.
+    """
+    now = timezone.now()
+    since = None
+    if request.GET.get('since'):
+        since = parse_datetime(request.GET['since'])
+        if since is None:
+            return Response(
+                {'error': 'Invalid since. Use an ISO 8601 timestamp from a previous sync'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    
+    retention = timezone.timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    full_sync = since is None or since < now - retention
+    
+    subscriptions = UserSubscription.objects.filter(user=request.user)
+    rates = SubscriptionRate.objects.filter(subscription__user=request.user)
+    skip_requests = DailySkipRequest.objects.filter(user=request.user)
+    deliveries = DailyMilkDelivery.objects.filter(user=request.user)
+    
+    if full_sync:
+        deliveries = deliveries.filter(
+            delivery_date__gte=now.date() - timezone.timedelta(days=settings.SYNC_FULL_DELIVERY_DAYS)
+        )
+        deleted_skip_ids = []
+        deleted_delivery_ids = []
+    else:
+        subscriptions = subscriptions.filter(updated_at__gt=since)
+        rates = rates.filter(updated_at__gt=since)
+        skip_requests = skip_requests.filter(created_at__gt=since)
+        deliveries = deliveries.filter(updated_at__gt=since)
+        deleted_skip_ids = SyncTombstone.objects.filter(
+            user=request.user, model='skip_request', deleted_at__gt=since
+        ).values_list('object_id', flat=True)
+        deleted_delivery_ids = SyncTombstone.objects.filter(
+            user=request.user, model='delivery', deleted_at__gt=since
+        ).values_list('object_id', flat=True)
+    
+    subscription = subscriptions.first()
+    
+    return Response({
+        # Rewind by a small overlap so rows committed just after these reads are sent next
+        # time; clients merge by id, so the occasional repeat is harmless.
+        'watermark': now - timezone.timedelta(seconds=settings.SYNC_WATERMARK_OVERLAP),
+        'full_sync': full_sync,
+        'subscription': SyncSubscriptionSerializer(subscription).data if subscription else None,
+        'rates': SubscriptionRateSerializer(rates.order_by('effective_from'), many=True).data,
+        'skip_requests': DailySkipRequestSerializer(skip_requests.order_by('skip_date'), many=True).data,
+        'deliveries': DailyMilkDeliverySerializer(deliveries.order_by('delivery_date'), many=True).data,
+        'deleted': {
+            'skip_requests': list(deleted_skip_ids),
+            'deliveries': list(deleted_delivery_ids)
+        }
+    })
+
+
 
 
 
@@ -428,50 +763,156 @@ def admin_delivery_schedule(request):
     except ValueError:
         return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get all active subscriptions
-    active_subscriptions = UserSubscription.objects.filter(
-        is_active=True,
-        subscription_start_date__lte=delivery_date,
-    ).filter(
-        Q(subscription_end_date__isnull=True) | Q(subscription_end_date__gte=delivery_date)
-    ).select_related('user')
+    return Response(build_delivery_schedule(delivery_date))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_demand(request):
+    """Subscription schedule and ad-hoc milk requests for a date, merged per user and milk type
     
-    # Get skip requests for this date
-    skip_requests = DailySkipRequest.objects.filter(
-        skip_date=delivery_date
-    ).values_list('user_id', flat=True)
+    ``rule`` ('add' or 'override') overrides the DEMAND_ADHOC_RULE setting.
+    """
+    delivery_date = parse_date(request.GET.get('date'))
+    if not delivery_date:
+        return Response({'error': 'date parameter is required (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Build delivery schedule with correct rates
-    deliveries = []
-    total_liters = 0
+    adhoc_rule = request.GET.get('rule')
+    if adhoc_rule and adhoc_rule not in DEMAND_ADHOC_RULES:
+        return Response(
+            {'error': f'Unknown rule. Choose from: {", ".join(DEMAND_ADHOC_RULES)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    for subscription in active_subscriptions:
-        if subscription.user.id not in skip_requests:
-            # Get the rate applicable for this date
-            applicable_rate = SubscriptionRate.objects.filter(
-                subscription=subscription,
-                effective_from__lte=delivery_date,
-            ).filter(
-                Q(effective_to__isnull=True) | Q(effective_to__gte=delivery_date)
-            ).first()
-            
-            if applicable_rate:
-                deliveries.append({
-                    'user_id': subscription.user.id,
-                    'user_name': subscription.user.full_name,
-                    'user_phone': subscription.user.phone_number,
-                    'scheduled_liters': applicable_rate.daily_liters,
-                    'rate_id': applicable_rate.id,
-                    'status': 'scheduled'
-                })
-                total_liters += applicable_rate.daily_liters
+    return Response(build_demand(delivery_date, adhoc_rule))
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdmin])
+def admin_zones(request):
+    """List delivery zones or create one"""
+    if request.method == 'GET':
+        return Response(DeliveryZoneSerializer(DeliveryZone.objects.order_by('name'), many=True).data)
     
-    return Response({
-        'date': delivery_date,
-        'total_deliveries': len(deliveries),
-        'total_liters': total_liters,
-        'deliveries': deliveries
+    serializer = DeliveryZoneSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdmin])
+def admin_routes(request):
+    """List delivery routes (optionally of one zone_id) or create one"""
+    if request.method == 'GET':
+        routes = DeliveryRoute.objects.select_related('zone').order_by('zone__name', 'name')
+        if request.GET.get('zone_id'):
+            routes = routes.filter(zone_id=request.GET['zone_id'])
+        return Response(DeliveryRouteSerializer(routes, many=True).data)
+    
+    serializer = DeliveryRouteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def admin_assign_route(request, route_id):
+    """Move the subscriptions of the given users onto a route"""
+    route = get_object_or_404(DeliveryRoute, id=route_id)
+    serializer = RouteAssignmentSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    updated = UserSubscription.objects.filter(
+        user_id__in=serializer.validated_data['user_ids']
+    ).update(route=route, updated_at=timezone.now())
+    return Response({'message': f'Assigned {updated} subscriptions to {route.name}'})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_route_schedule(request, route_id):
+    """Delivery schedule of a single route for a date"""
+    route = get_object_or_404(DeliveryRoute.objects.select_related('zone'), id=route_id)
+    delivery_date = parse_date(request.GET.get('date'))
+    if not delivery_date:
+        return Response({'error': 'date parameter is required (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(route_schedule(route, delivery_date))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_route_sequence(request, route_id):
+    """Stops of a route for a date in driving order, with leg distances"""
+    route = get_object_or_404(DeliveryRoute.objects.select_related('zone'), id=route_id)
+    delivery_date = parse_date(request.GET.get('date'))
+    if not delivery_date:
+        return Response({'error': 'date parameter is required (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(route_sequence(route, delivery_date))
+
+
+def _package_response(request, package, **headers):
+    """Binary driver package response, or 304 when the client already holds it"""
+    etag = driver_package.etag(package)
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(package, content_type=driver_package.CONTENT_TYPE)
+    response['ETag'] = etag
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_route_package(request, route_id):
+    """Offline driver package of a route for a date (binary, see driver_package)"""
+    route = get_object_or_404(DeliveryRoute.objects.select_related('zone'), id=route_id)
+    delivery_date = parse_date(request.GET.get('date'))
+    if not delivery_date:
+        return Response({'error': 'date parameter is required (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return _package_response(request, route_package(route, delivery_date))
+
+
+# User ids listed in X-Rejected-Users (37 bytes each) before the list is cut off
+MAX_REJECTED_USERS_HEADER = 20
+
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def admin_route_results(request, route_id):
+    """Apply a driver's binary results upload and answer with the refreshed package
+    
+    Only results for the route's subscribers are applied; the others are
+    counted in X-Rejected-Results, and the first MAX_REJECTED_USERS_HEADER of
+    them listed in X-Rejected-Users (headers must stay within proxy limits).
+    """
+    route = get_object_or_404(DeliveryRoute.objects.select_related('zone'), id=route_id)
+    try:
+        delivery_date, results = driver_package.decode_results(request.body)
+    except driver_package.PackageError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    route_users = set(UserSubscription.objects.filter(route_id=route.id).values_list('user_id', flat=True))
+    accepted = [result for result in results if result['user_id'] in route_users]
+    rejected = [str(result['user_id']) for result in results if result['user_id'] not in route_users]
+    
+    applied = apply_delivery_updates(delivery_date, accepted)
+    return _package_response(request, route_package(route, delivery_date), **{
+        'X-Applied-Results': str(applied),
+        'X-Rejected-Results': str(len(rejected)),
+        'X-Rejected-Users': ','.join(rejected[:MAX_REJECTED_USERS_HEADER]),
     })
+
+
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def admin_billing_report(request):
@@ -485,95 +926,65 @@ def admin_billing_report(request):
             'error': 'user_id, start_date, and end_date parameters are required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    start_date_obj = parse_date(start_date)
+    end_date_obj = parse_date(end_date)
+    if not start_date_obj or not end_date_obj:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Long ranges can be handed to the job queue and polled via admin/jobs/<id>/
+    if request.GET.get('async') == 'true':
+        params, errors = validate_job_params('billing_report', {
+            'user_id': user_id,
+            'start_date': start_date,
+            'end_date': end_date
+        })
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue_job('billing_report', params, user=request.user)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
     try:
         user = User.objects.get(id=user_id)
         subscription = UserSubscription.objects.get(user=user)
     except (User.DoesNotExist, UserSubscription.DoesNotExist):
         return Response({'error': 'User or subscription not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    # Parse dates
-    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-    
-    # Get all rates active in the period
-    rates_in_period = SubscriptionRate.objects.filter(
-        subscription=subscription,
-        effective_from__lte=end_date_obj,
-    ).filter(
-        Q(effective_to__isnull=True) | Q(effective_to__gte=start_date_obj)
-    ).order_by('effective_from')
-    
-    # Get actual deliveries
-    deliveries = DailyMilkDelivery.objects.filter(
-        user=user,
-        delivery_date__range=[start_date_obj, end_date_obj],
-        status='delivered'
-    ).select_related('rate_applied').order_by('delivery_date')
-    
-    # Build billing breakdown
-    billing_breakdown = []
-    total_delivered_liters = 0
-    total_delivered_days = 0
+    return Response(build_billing_report(user, subscription, start_date_obj, end_date_obj))
+
     
-    for rate in rates_in_period:
-        rate_start = max(rate.effective_from, start_date_obj)
-        rate_end = min(rate.effective_to or end_date_obj, end_date_obj)
-        
-        # ✅ Filter on queryset (not serialized list)
-        rate_deliveries = deliveries.filter(
-            delivery_date__range=[rate_start, rate_end],
-            rate_applied=rate
-        )
-        
-        delivered_days = rate_deliveries.count()
-        delivered_liters = sum(float(d.actual_liters or d.scheduled_liters) for d in rate_deliveries)
-        
-        total_days_in_range = (rate_end - rate_start).days + 1
-        skip_days = DailySkipRequest.objects.filter(
-            user=user,
-            skip_date__range=[rate_start, rate_end]
-        ).count()
-        
-        expected_delivery_days = total_days_in_range - skip_days
-        
-        billing_breakdown.append({
-            'rate_id': str(rate.id),
-            'daily_liters': str(rate.daily_liters),
-            'effective_from': rate.effective_from,
-            'effective_to': rate.effective_to,
-            'period_start': rate_start,
-            'period_end': rate_end,
-            'expected_delivery_days': expected_delivery_days,
-            'actual_delivery_days': delivered_days,
-            'delivered_liters': delivered_liters,
-            'delivery_success_rate': f"{(delivered_days/expected_delivery_days*100):.1f}%" if expected_delivery_days > 0 else "0%"
-        })
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdmin])
+def admin_blackouts(request):
+    """List blackout dates (optionally within start_date/end_date) or add one"""
+    if request.method == 'GET':
+        start_date = parse_date(request.GET['start_date']) if request.GET.get('start_date') else None
+        end_date = parse_date(request.GET['end_date']) if request.GET.get('end_date') else None
+        if (request.GET.get('start_date') and not start_date) or (request.GET.get('end_date') and not end_date):
+            return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
         
-        total_delivered_liters += delivered_liters
-        total_delivered_days += delivered_days
-    
-    # ✅ Serialize only once at the end
-    deliveries_serialized = DailyMilkDeliverySerializer(deliveries, many=True).data
+        blackout_dates = BlackoutDate.objects.order_by('date')
+        if start_date:
+            blackout_dates = blackout_dates.filter(date__gte=start_date)
+        if end_date:
+            blackout_dates = blackout_dates.filter(date__lte=end_date)
+        return Response(BlackoutDateSerializer(blackout_dates, many=True).data)
     
-    return Response({
-        'user': {
-            'id': str(user.id),
-            'name': user.full_name,
-            'phone': user.phone_number
-        },
-        'billing_period': {
-            'start_date': start_date,
-            'end_date': end_date
-        },
-        'summary': {
-            'total_delivered_days': total_delivered_days,
-            'total_delivered_liters': total_delivered_liters
-        },
-        'rate_breakdown': billing_breakdown,
-        'deliveries': deliveries_serialized
-    })
+    serializer = BlackoutDateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAdmin])
+def admin_delete_blackout(request, blackout_id):
+    """Remove a blackout date"""
+    blackout = get_object_or_404(BlackoutDate, id=blackout_id)
+    blackout.delete()
+    return Response({'message': f'Blackout on {blackout.date} removed'})
+
 
-    
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def admin_skip_requests(request):
@@ -611,6 +1022,7 @@ def admin_skip_requests(request):
 
 @api_view(['PUT'])
 @permission_classes([IsAdmin])
+@idempotent
 def admin_update_delivery_status(request):
     """Update delivery status for multiple users on a specific date"""
     delivery_date = request.data.get('delivery_date')
@@ -622,57 +1034,188 @@ def admin_update_delivery_status(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    updated_count = 0
-    for delivery_data in deliveries:
-        user_id = delivery_data.get('user_id')
-        new_status = delivery_data.get('status')
-        actual_liters = delivery_data.get('actual_liters')
-        
-        try:
-            subscription = UserSubscription.objects.get(user_id=user_id)
-
-            # ✅ get the correct rate for the delivery_date
-            rate = subscription.subscription_rates.filter(
-                effective_from__lte=delivery_date
-            ).filter(
-                Q(effective_to__isnull=True) | Q(effective_to__gte=delivery_date)
-            ).order_by('-effective_from').first()
-
-            if not rate:
-                continue  # no valid rate found, skip this user
-
-            scheduled_liters = rate.daily_liters
-
-            delivery, created = DailyMilkDelivery.objects.get_or_create(
-                user_id=user_id,
-                delivery_date=delivery_date,
-                defaults={
-                    'scheduled_liters': scheduled_liters,
-                    'status': new_status,
-                    'actual_liters': actual_liters
-                }
-            )
-
-            if not created:
-                delivery.status = new_status
-                if actual_liters is not None:
-                    delivery.actual_liters = actual_liters
-                delivery.scheduled_liters = scheduled_liters  # ✅ keep it updated if plan changes
-                delivery.save()
-            
-            updated_count += 1
-            
-        except UserSubscription.DoesNotExist:
-            continue
+    delivery_date = parse_date(delivery_date)
+    if not delivery_date:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    updated_count = apply_delivery_updates(delivery_date, deliveries)
     
     return Response({
         'message': f'Updated {updated_count} deliveries',
         'delivery_date': delivery_date
     })
 
+# Background Job Views
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdmin])
+def admin_jobs(request):
+    """List recent jobs or enqueue a new one"""
+    if request.method == 'GET':
+        jobs = Job.objects.order_by('-created_at')
+        if request.GET.get('status'):
+            jobs = jobs.filter(status=request.GET['status'])
+        return Response(JobSerializer(jobs[:50], many=True).data)
+    
+    serializer = EnqueueJobSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    kind = serializer.validated_data['kind']
+    if kind not in JOB_HANDLERS:
+        return Response(
+            {'error': f'Unknown job kind. Choose from: {", ".join(sorted(JOB_HANDLERS))}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    params, errors = validate_job_params(kind, serializer.validated_data['params'])
+    if errors:
+        return Response({'params': errors}, status=status.HTTP_400_BAD_REQUEST)
+    
+    job = enqueue_job(kind, params, user=request.user)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_job_detail(request, job_id):
+    """Poll a job's status and progress"""
+    job = get_object_or_404(Job.objects.defer('result'), id=job_id)
+    return Response(JobSerializer(job).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_job_result(request, job_id):
+    """Fetch the result of a finished job"""
+    job = get_object_or_404(Job, id=job_id)
+    if job.status != 'succeeded':
+        return Response(
+            {'error': f'Job is {job.status}', 'job': JobSerializer(job).data},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(job.result)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_metrics(request):
+    """Operational counters (rate limiting etc.), optionally filtered by name prefix"""
+    return Response(metrics.snapshot(request.GET.get('prefix', '')))
+
+
+CALENDAR_SETS = list(calendars.KINDS) + ['closed', 'expected', 'missed']
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_user_calendar(request, user_id):
+    """Subscribed/skipped/delivered/failed/closed/expected/missed days of one subscriber"""
+    serializer = CalendarParamsSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    user = get_object_or_404(User, id=user_id)
+    start_date = serializer.validated_data['start_date']
+    end_date = serializer.validated_data['end_date']
+    calendar = calendars.get_calendar(user.id, start_date, end_date)
+    
+    return Response({
+        'user_id': user.id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'counts': {name: calendar.count(getattr(calendar, name)) for name in CALENDAR_SETS},
+        'days': {name: calendar.dates(getattr(calendar, name)) for name in CALENDAR_SETS}
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_missed_deliveries(request):
+    """Subscribers with days that were expected but not delivered in a range"""
+    serializer = CalendarParamsSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    start_date = serializer.validated_data['start_date']
+    end_date = serializer.validated_data['end_date']
+    subscriptions = UserSubscription.objects.filter(
+        subscription_start_date__lte=end_date
+    ).filter(
+        Q(subscription_end_date__isnull=True) | Q(subscription_end_date__gte=start_date)
+    ).select_related('user').order_by('user__full_name')
+    
+    users = {subscription.user_id: subscription.user for subscription in subscriptions}
+    user_calendars = calendars.get_calendars(list(users), start_date, end_date)
+    
+    missed = []
+    for user_id, calendar in user_calendars.items():
+        missed_bits = calendar.missed
+        if missed_bits:
+            missed.append({
+                'user_id': user_id,
+                'user_name': users[user_id].full_name,
+                'user_phone': users[user_id].phone_number,
+                'missed_days': missed_bits.bit_count(),
+                'dates': calendar.dates(missed_bits)
+            })
+    
+    per_day = calendars.daily_counts(user_calendars.values(), 'missed')
+    return Response({
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_missed': sum(per_day),
+        'missed_by_date': [
+            {'date': start_date + timezone.timedelta(days=offset), 'count': count}
+            for offset, count in enumerate(per_day) if count
+        ],
+        'users': missed
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def admin_export_history(request):
+    """Queue a zipped columnar bundle of deliveries, skips and rates for a date range
+    
+    Multi-year ranges take longer than a request may, so the bundle is built
+    by a history_export job: poll admin/jobs/<id>/, then download it from
+    admin/export/history/<id>/.
+    """
+    params, errors = validate_job_params('history_export', request.data)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    job = enqueue_job('history_export', params, user=request.user)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_download_history_export(request, job_id):
+    """Download the bundle built by a history_export job"""
+    job = get_object_or_404(Job, id=job_id, kind='history_export')
+    if job.status != 'succeeded':
+        return Response(
+            {'error': f'Job is {job.status}', 'job': JobSerializer(job).data},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    archive = open_archive(job.id)
+    if archive is None:
+        return Response({'error': 'Export has expired; queue it again'}, status=status.HTTP_410_GONE)
+    
+    return FileResponse(
+        archive,
+        as_attachment=True,
+        filename=job.result['filename'],
+        content_type='application/zip'
+    )
+
+
 # Milk Request Views
 @api_view(['POST'])
 @permission_classes([IsJWTAuthenticated])
+@idempotent
 def create_milk_request(request):
     serializer = DailyMilkRequestSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
@@ -853,7 +1396,7 @@ def admin_get_aggregate(request):
 @permission_classes([IsJWTAuthenticated])
 @admin_required
 def admin_override_request(request, request_id):
-    milk_request = get_object_or_404(DailyMilkRequest, id=request_id)
+    milk_request = get_object_or_404(DailyMilkRequest.objects.select_related('user'), id=request_id)
     
     serializer = AdminRequestUpdateSerializer(
         milk_request, 
@@ -863,18 +1406,71 @@ def admin_override_request(request, request_id):
     
     if serializer.is_valid():
         serializer.save()
-        return Response({
-            'id': milk_request.id,
-            'user_name': milk_request.user.full_name,
-            'user_phone': milk_request.user.phone_number,
-            'target_date': milk_request.target_date,
-            'liters': milk_request.liters,
-            'status': milk_request.status,
-            'updated_at': milk_request.updated_at
-        })
+        return Response(_override_response(milk_request))
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['PUT'])
+@permission_classes([IsJWTAuthenticated])
+@admin_required
+def admin_bulk_override_requests(request):
+    """Override liters/status on many requests at once
+    
+    Body: [{"request_id", "liters", "status"}, ...]. Either every override is
+    applied or, on any validation error or unknown id, none are.
+    """
+    serializer = AdminBulkOverrideSerializer(data=request.data, many=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    overrides = serializer.validated_data
+    if not overrides:
+        return Response({'error': 'No overrides provided'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    request_ids = [item['request_id'] for item in overrides]
+    if len(set(request_ids)) != len(request_ids):
+        return Response({'error': 'Each request_id may appear only once'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    milk_requests = DailyMilkRequest.objects.select_related('user').in_bulk(request_ids)
+    missing = [str(request_id) for request_id in request_ids if request_id not in milk_requests]
+    if missing:
+        return Response({
+            'error': 'Some requests were not found',
+            'missing_request_ids': missing
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    # bulk_update bypasses auto_now, so stamp updated_at ourselves
+    now = timezone.now()
+    updated = []
+    for item in overrides:
+        milk_request = milk_requests[item['request_id']]
+        for field in AdminRequestUpdateSerializer.Meta.fields:
+            if field in item:
+                setattr(milk_request, field, item[field])
+        milk_request.updated_at = now
+        updated.append(milk_request)
+    
+    with transaction.atomic():
+        DailyMilkRequest.objects.bulk_update(updated, ['liters', 'status', 'updated_at'])
+    
+    return Response({
+        'updated_count': len(updated),
+        'requests': [_override_response(milk_request) for milk_request in updated]
+    })
+
+
+def _override_response(milk_request):
+    return {
+        'id': milk_request.id,
+        'user_name': milk_request.user.full_name,
+        'user_phone': milk_request.user.phone_number,
+        'target_date': milk_request.target_date,
+        'liters': milk_request.liters,
+        'status': milk_request.status,
+        'updated_at': milk_request.updated_at
+    }
+
+
 # User Views
 @api_view(['GET', 'PUT'])
 @permission_classes([IsJWTAuthenticated])
@@ -0,0 +1,72 @@
+# milk_app/warmup.py
+"""
+Process warm-up for pre-forking servers.
+
+``warm_up()`` runs once in the gunicorn master (gunicorn.conf.py sets
+preload_app and calls it from ``when_ready``), so workers are forked with
+the URLconf, views, DRF settings and the Firebase SDK already imported and
+initialized instead of paying for them on their first request. Nothing that
+holds a socket is kept: database connections are closed before returning.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def _load_urls():
+    # Resolving the URLconf imports every view module and, through them, serializers and models
+    get_resolver().url_patterns
+
+
+def _load_drf_settings():
+    from rest_framework.settings import api_settings
+
+    api_settings.DEFAULT_RENDERER_CLASSES
+    api_settings.DEFAULT_PARSER_CLASSES
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    api_settings.DEFAULT_PERMISSION_CLASSES
+
+
+def _init_firebase():
+    if not os.path.exists(settings.FIREBASE_CREDENTIALS_PATH):
+        logger.warning("Firebase credentials not found; the SDK will be initialized on first login")
+        return
+
+    from .firebase_config import FirebaseConfig
+    FirebaseConfig()
+
+
+def _load_billing_engine():
+    from . import billing_engine
+    billing_engine.is_enabled()
+
+
+STEPS = [
+    ('urls', _load_urls),
+    ('drf_settings', _load_drf_settings),
+    ('firebase', _init_firebase),
+    ('billing_engine', _load_billing_engine),
+]
+
+
+def warm_up():
+    """Initialize shared state before forking; returns seconds spent per step"""
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            # A failed warm-up step only means that work happens lazily in the workers
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        timings[name] = time.perf_counter() - started
+
+    # Never share database sockets with forked workers
+    connections.close_all()
+    return timings
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'milk_app.middleware.SelectiveCompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -125,6 +126,23 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# File storage. 'exports' holds history export bundles: run_jobs writes them and the web
+# servers serve them, so when those run on different hosts or containers it must be shared -
+# a mount both see (EXPORT_STORAGE_LOCATION) or an object store such as
+# storages.backends.s3.S3Storage (django-storages) via EXPORT_STORAGE_BACKEND.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'exports': {
+        'BACKEND': os.environ.get('EXPORT_STORAGE_BACKEND', 'django.core.files.storage.FileSystemStorage'),
+        'OPTIONS': {'location': os.environ.get('EXPORT_STORAGE_LOCATION', str(BASE_DIR / 'exports'))},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -137,6 +155,48 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # FastJSONRenderer uses orjson when installed (`pip install orjson`), else renders
+    # exactly like DRF's JSONRenderer (python manage.py benchmark_renderer)
+    'DEFAULT_RENDERER_CLASSES': [
+        'milk_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Cache
+# LocMemCache is per process; point CACHE_BACKEND/CACHE_LOCATION at a shared backend
+# (memcached, redis or django.core.cache.backends.db.DatabaseCache) when running
+# several workers so rate limits and counters are shared.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    # Per-user calendar months (milk_app/calendars.py), kept apart so a city-wide report
+    # cannot evict rate limits or idempotency keys. Calendars are only cached when this is
+    # a shared backend; with the per-process default every read is built from the database.
+    'calendars': {
+        'BACKEND': os.environ.get('CALENDAR_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CALENDAR_CACHE_LOCATION', 'calendars'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CALENDAR_CACHE_MAX_ENTRIES', 200000))},
+    },
+}
+
+# Response compression (milk_app/middleware.py): gzip responses of CONTENT_TYPES of at
+# least MIN_SIZE bytes; paths under LOW_CPU_PATHS use the cheaper LOW_CPU_LEVEL
+COMPRESSION = {
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    'LEVEL': 6,
+    'LOW_CPU_LEVEL': 1,
+    'LOW_CPU_PATHS': ['/api/sync/', '/api/batch/', '/api/home/'],
+    'CONTENT_TYPES': ['application/json', 'text/csv', 'text/html', 'text/plain'],
+}
+
+# Rate limiting (token buckets per route scope: '<burst>/<refill period>')
+RATE_LIMITS = {
+    'signup': {'ip': '10/min', 'phone': '3/min'},
+    'login': {'ip': '20/min', 'phone': '5/min'},
+    'refresh_token': {'ip': '30/min'},
 }
 
 # Firebase configuration
@@ -147,6 +207,86 @@ JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-jwt-secret-key')
 JWT_ACCESS_TOKEN_LIFETIME = 60 * 60 * 24 * 7  # 15 minutes
 JWT_REFRESH_TOKEN_LIFETIME = 60 * 60 * 24 * 7  # 7 days
 
+# Refresh-token rotation: in-process bloom filter sizing for revoked token families. Other
+# workers learn of revocations through the default cache; with the per-process LocMemCache
+# the filter is bypassed and every authenticated request checks revoked_tokens in the DB.
+REFRESH_TOKEN_STORE = {
+    'BLOOM_CAPACITY': int(os.environ.get('REFRESH_TOKEN_BLOOM_CAPACITY', 100000)),
+    'BLOOM_ERROR_RATE': 0.001,
+}
+
+# Async views
+# Comma-separated URL names served by milk_app.async_views instead of the sync DRF views,
+# e.g. ASYNC_ROUTES=signup,login,refresh_token,user_profile. Only takes effect when running
+# under an ASGI server (uvicorn milk_project.asgi:application).
+ASYNC_ROUTES = [name.strip() for name in os.environ.get('ASYNC_ROUTES', '').split(',') if name.strip()]
+
+# Delta sync (api/sync/)
+SYNC_TOMBSTONE_RETENTION_DAYS = 90  # older watermarks get a full snapshot
+SYNC_FULL_DELIVERY_DAYS = 60  # delivery history included in a full snapshot
+SYNC_WATERMARK_OVERLAP = 5  # seconds
+
+# Billing engine: 'python' (default) or 'numpy' (vectorized, needs `pip install numpy`;
+# same results, much faster for year-long or whole-city billing runs)
+BILLING_ENGINE = os.environ.get('BILLING_ENGINE', 'python')
+
+# Per-user calendar bitsets (milk_app/calendars.py), cached per month in CACHES['calendars']
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Skip index: date -> users who skipped, kept in the default cache when it is shared
+# (python manage.py warm_skip_index); with LocMemCache lookups query the database
+SKIP_INDEX = {
+    'WARM_DAYS': 7,
+    'TIMEOUT': 60 * 60 * 24 * 8,
+}
+
+# Demand (api/admin/demand/): how a confirmed ad-hoc DailyMilkRequest combines with the
+# same user's subscription that day - 'add' (on top) or 'override' (replaces it)
+DEMAND_ADHOC_RULE = os.environ.get('DEMAND_ADHOC_RULE', 'add')
+
+# Idempotency-Key support (milk_app/idempotency.py): responses are kept in the
+# idempotency_keys table and replayed to retries for TTL seconds; a key whose first request
+# has not finished within IN_FLIGHT_TIMEOUT seconds can be claimed again. Delete expired
+# keys with python manage.py prune_idempotency_keys.
+IDEMPOTENCY = {
+    'TTL': 60 * 60 * 24,
+    'IN_FLIGHT_TIMEOUT': 60,
+}
+
+# Batch API (api/batch/)
+BATCH_MAX_REQUESTS = 50
+
+# Columnar history export (manage.py export_history, api/admin/export/history/)
+COLUMNAR_EXPORT = {
+    'CHUNK_ROWS': 1000000,  # rows per chunk file
+    'FETCH_SIZE': 5000,  # rows fetched per server-side cursor round trip
+    # zipped bundles built by history_export jobs go to this STORAGES alias, deleted after RETAIN_DAYS
+    'STORAGE': 'exports',
+    'RETAIN_DAYS': 7,
+}
+
+# Delivery partitions (python manage.py manage_delivery_partitions, run monthly).
+# PostgreSQL keeps one partition per month of daily_milk_deliveries; months older than
+# RETAIN_MONTHS are archived to gzipped CSV files in ARCHIVE_DIR. Other databases move
+# them into the daily_milk_deliveries_archive table instead.
+DELIVERY_PARTITIONS = {
+    'MONTHS_AHEAD': 3,
+    'RETAIN_MONTHS': 24,
+    'ARCHIVE_DIR': os.environ.get('DELIVERY_ARCHIVE_DIR', str(BASE_DIR / 'archive')),
+}
+
+# Background jobs (python manage.py run_jobs). Running jobs refresh updated_at every
+# HEARTBEAT_INTERVAL seconds; one silent for STALE_TIMEOUT seconds is assumed to have lost
+# its worker and is requeued, or failed once it has been started MAX_ATTEMPTS times.
+JOB_QUEUE = {
+    'WORKER_PROCESSES': int(os.environ.get('JOB_WORKER_PROCESSES', 1)),
+    'WORKER_THREADS': int(os.environ.get('JOB_WORKER_THREADS', 2)),
+    'POLL_INTERVAL': float(os.environ.get('JOB_POLL_INTERVAL', 2)),
+    'HEARTBEAT_INTERVAL': 30,
+    'STALE_TIMEOUT': 300,
+    'MAX_ATTEMPTS': 3,
+}
+
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWED_HEADERS = [
@@ -155,6 +295,7 @@ CORS_ALLOWED_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',